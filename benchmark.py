@@ -0,0 +1,487 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import process_data
+
+
+####################
+# GLOBAL VARIABLES #
+####################
+
+
+baseline_file_name = "benchmark_baseline.json"
+
+# How much slower than the baseline a stage can get before it counts as a regression
+DEFAULT_REGRESSION_TOLERANCE = 0.25
+
+# Stages that take less time than this are too noisy to compare against the baseline
+MIN_COMPARABLE_STAGE_SECONDS = 0.005
+
+# Some premade event sizes so that runs on different days can be compared with each other
+benchmark_scenarios = {
+    "district": {"num_teams": 40, "matches_per_team": 12},
+    "regional": {"num_teams": 64, "matches_per_team": 12},
+    "championship": {"num_teams": 75, "matches_per_team": 10},
+    "season": {"num_teams": 400, "matches_per_team": 36},
+}
+
+TEAMS_PER_MATCH = 6
+
+# The text that the scouting form puts in each multiple choice column
+taxi_choices = ["Yes", "No"]
+hangar_choices = [
+    "No Hang",
+    "Low Rung (1)",
+    "Mid Rung (2)",
+    "High Rung (3)",
+    "Traversal Rung (4)",
+]
+defense_choices = ["No", "Unsure", "Yes"]
+other_info_choices = [
+    "",
+    "",
+    "",
+    "Fast drivetrain",
+    "Broke down near the end of the match",
+    "Good at defense, pushed the other alliance around",
+    "Dropped cargo a lot, \"needs work\" on intake",
+    "Missed auto\nClimbed fine though",
+]
+
+
+#############
+# FUNCTIONS #
+#############
+
+
+def make_cargo_string(max_cargo):
+    # The form records cargo as a list of counts that were tapped through, e.g. "0, 1, 2",
+    # or sometimes just the final count. get_max_value_from_comma_separated_numbers() reads
+    # the highest number from either one.
+    cargo_scored = random.randint(0, max_cargo)
+    if random.random() < 0.7:
+        return ", ".join(str(count) for count in range(cargo_scored + 1))
+    return str(cargo_scored)
+
+
+def write_synthetic_event_csv(file_name, num_teams, matches_per_team, duplicate_rate=0.05,
+                              garbage_rate=0.01, seed=0):
+    # Write a made-up input csv in the same column layout as the real scouting export.
+    # Every team plays matches_per_team qualification matches, a duplicate_rate fraction of
+    # rows get scouted twice, and a garbage_rate fraction of rows are missing their team
+    # number. Returns the number of rows written (not counting the column titles).
+    random.seed(seed)
+
+    team_nums = random.sample(range(1, 9000), num_teams)
+    num_matches = -(-num_teams * matches_per_team // TEAMS_PER_MATCH)
+
+    rows_written = 0
+    with open(file_name, "w", newline="") as output_csv_file:
+        output_handling_object = csv.writer(output_csv_file)
+        output_handling_object.writerow([
+            "Timestamp",
+            "Email Address",
+            "Scout Name",
+            "Team Number",
+            "Qualification Match Number",
+            "Taxi",
+            "AUTO - Cargo Scored [Upper Hub]",
+            "AUTO - Cargo Scored [Lower Hub]",
+            "TELEOP - Cargo Scored [Upper Hub]",
+            "TELEOP - Cargo Scored [Lower Hub]",
+            "Hangar",
+            "Mostly defense?",
+            "Other Information",
+        ])
+
+        # Every match is filled with the teams that have played the fewest matches so far
+        # (in a random order), so every team ends up with (close to) the same number of
+        # matches
+        num_matches_played = {team_num: 0 for team_num in team_nums}
+        for qual_match_num in range(1, num_matches + 1):
+            match_team_nums = sorted(
+                team_nums,
+                key=lambda team_num: (num_matches_played[team_num], random.random()))
+            match_team_nums = match_team_nums[:TEAMS_PER_MATCH]
+
+            for i, team_num in enumerate(match_team_nums):
+                num_matches_played[team_num] += 1
+
+                if random.random() < garbage_rate:
+                    team_num_string = ""
+                elif random.random() < 0.1:
+                    # Some forms export numbers as floats
+                    team_num_string = f"{team_num}.0"
+                else:
+                    team_num_string = str(team_num)
+
+                row_data = [
+                    f"3/{qual_match_num % 28 + 1}/2022 10:{qual_match_num % 60:02d}:00",
+                    f"scout{i}@example.com",
+                    f"Scout {i}",
+                    team_num_string,
+                    str(qual_match_num),
+                    random.choice(taxi_choices),
+                    make_cargo_string(4),
+                    make_cargo_string(3),
+                    make_cargo_string(12),
+                    make_cargo_string(8),
+                    random.choice(hangar_choices),
+                    random.choice(defense_choices),
+                    random.choice(other_info_choices),
+                ]
+                output_handling_object.writerow(row_data)
+                rows_written += 1
+
+                if random.random() < duplicate_rate:
+                    output_handling_object.writerow(row_data)
+                    rows_written += 1
+
+    return rows_written
+
+
+def run_pipeline_stages(input_file_name, output_file_name, stage_callback):
+    # Run every stage of process_data.py one after another. stage_callback(stage_name,
+    # stage_function) is in charge of actually calling each stage (so that it can time it)
+    # and has to return whatever the stage returns.
+    read_progress = {"byte_offset": 0, "row_count": 0}
+    team_data = {}
+    match_table = process_data.MatchTable()
+
+    match_entries = stage_callback("csv_parse", lambda: list(
+        process_data.drop_invalid_entries(
+            process_data.parse_rows(
+                process_data.read_input_rows(input_file_name, read_progress)))))
+
+    stage_callback("grouping", lambda: process_data.group_match_entries(
+        match_entries, team_data, match_table, process_data.TeamMatchKeys()))
+
+    # The same statistics load_team_data() works out: every team's averages, and how its
+    # points are spread out (which the distribution rankings and the "Points Per Match"
+    # table on each team sheet need)
+    def update_statistics():
+        process_data.update_team_averages(team_data, match_table.team_totals())
+        process_data.update_team_distributions(team_data, match_table)
+
+    stage_callback("statistics", update_statistics)
+
+    team_rankings = stage_callback("ranking", lambda: process_data.rank_teams(team_data))
+
+    output_workbook = process_data.open_output_workbook(output_file_name)
+    stage_callback("workbook_write", lambda: process_data.write_output_workbook(
+        output_workbook, team_data, team_rankings))
+    stage_callback("workbook_close", output_workbook.close)
+
+
+def time_pipeline_stages(input_file_name, output_file_name):
+    # Returns a dict of stage name to how many seconds that stage took
+    stage_seconds = {}
+
+    def time_stage(stage_name, stage_function):
+        start_time = time.perf_counter()
+        stage_result = stage_function()
+        stage_seconds[stage_name] = time.perf_counter() - start_time
+        return stage_result
+
+    run_pipeline_stages(input_file_name, output_file_name, time_stage)
+    return stage_seconds
+
+
+def measure_pipeline_stage_memory(input_file_name, output_file_name):
+    # Returns a dict of stage name to the most memory (in bytes) allocated at once while
+    # that stage was running. This is done separately from the timing because tracking
+    # every allocation slows everything down a lot.
+    stage_peak_bytes = {}
+
+    def measure_stage(stage_name, stage_function):
+        tracemalloc.reset_peak()
+        start_bytes, junk = tracemalloc.get_traced_memory()
+        stage_result = stage_function()
+        junk, peak_bytes = tracemalloc.get_traced_memory()
+        stage_peak_bytes[stage_name] = peak_bytes - start_bytes
+        return stage_result
+
+    tracemalloc.start()
+    try:
+        run_pipeline_stages(input_file_name, output_file_name, measure_stage)
+    finally:
+        tracemalloc.stop()
+
+    return stage_peak_bytes
+
+
+def run_benchmark(scenario_name, num_teams, matches_per_team, duplicate_rate, garbage_rate,
+                  repeat, seed):
+    # Generate a synthetic event and run the whole pipeline on it "repeat" times, keeping
+    # the fastest time for each stage (the one with the least interference from anything
+    # else running on the computer)
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        input_file_name = os.path.join(temporary_directory, "input.csv")
+        output_file_name = os.path.join(temporary_directory, "output_data.xlsx")
+
+        num_rows = write_synthetic_event_csv(
+            input_file_name,
+            num_teams,
+            matches_per_team,
+            duplicate_rate=duplicate_rate,
+            garbage_rate=garbage_rate,
+            seed=seed)
+
+        # The pipeline prints progress as it goes, which would get in the way of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            best_stage_seconds = {}
+            for i in range(repeat):
+                stage_seconds = time_pipeline_stages(input_file_name, output_file_name)
+                for stage_name, seconds in stage_seconds.items():
+                    best_stage_seconds[stage_name] = min(
+                        seconds, best_stage_seconds.get(stage_name, seconds))
+
+            stage_peak_bytes = measure_pipeline_stage_memory(input_file_name, output_file_name)
+
+    return {
+        "scenario": scenario_name,
+        "num_teams": num_teams,
+        "matches_per_team": matches_per_team,
+        "duplicate_rate": duplicate_rate,
+        "garbage_rate": garbage_rate,
+        "num_rows": num_rows,
+        "stage_seconds": best_stage_seconds,
+        "total_seconds": sum(best_stage_seconds.values()),
+        "stage_peak_bytes": stage_peak_bytes,
+    }
+
+
+def read_workbook_parts(file_name):
+    # Everything in an .xlsx file that should be the same when it's made again. The
+    # creation time in docProps changes every time, and the cached sheets' content types
+    # are listed after the others, so those are sorted before they're compared.
+    with zipfile.ZipFile(file_name) as xlsx_file:
+        workbook_parts = {
+            part_name: xlsx_file.read(part_name)
+            for part_name in xlsx_file.namelist() if part_name.startswith("xl/")}
+        workbook_parts["[Content_Types].xml"] = sorted(re.findall(
+            r"<[^>]*/>", xlsx_file.read("[Content_Types].xml").decode("utf-8")))
+
+    return workbook_parts
+
+
+def check_sheet_cache(num_teams, matches_per_team, seed):
+    # Make the workbook twice in every chart mode with the sheet cache turned on, the same
+    # as running process_data.py twice on the same input. The second time, every team sheet
+    # should be copied from the cache and the workbook should come out exactly the same.
+    # Returns a list of everything that didn't.
+    problems = []
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        input_file_name = os.path.join(temporary_directory, "input.csv")
+        write_synthetic_event_csv(input_file_name, num_teams, matches_per_team, seed=seed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            team_data, _ = process_data.load_team_data(input_file_name)
+        team_rankings = process_data.rank_teams(team_data)
+
+        for chart_mode in process_data.chart_mode_names:
+            output_file_name = os.path.join(temporary_directory, f"output_{chart_mode}.xlsx")
+
+            workbook_parts = []
+            for i in range(2):
+                profiler = process_data.PipelineProfiler(enabled=True)
+                process_data.render_workbook(
+                    output_file_name,
+                    team_data,
+                    team_rankings,
+                    profiler,
+                    use_sheet_cache=True,
+                    chart_mode=chart_mode)
+
+                workbook_parts.append(read_workbook_parts(output_file_name))
+
+            num_sheets_reused = profiler.counters.get("sheets_reused", 0)
+            if num_sheets_reused != len(team_data):
+                problems.append(
+                    f"{chart_mode}: only {num_sheets_reused} of {len(team_data)} team sheets "
+                    f"were reused")
+            if workbook_parts[0] != workbook_parts[1]:
+                problems.append(f"{chart_mode}: the workbook changed when it was made again")
+
+    return problems
+
+
+def compare_to_baseline(result, baseline_result, tolerance):
+    # Returns a list of (stage name, baseline seconds, new seconds) for every stage that
+    # got more than "tolerance" slower than the baseline
+    regressions = []
+
+    for stage_name, seconds in result["stage_seconds"].items():
+        baseline_seconds = baseline_result["stage_seconds"].get(stage_name)
+        if baseline_seconds is None:
+            continue
+        if max(seconds, baseline_seconds) < MIN_COMPARABLE_STAGE_SECONDS:
+            continue
+        if seconds > baseline_seconds * (1 + tolerance):
+            regressions.append((stage_name, baseline_seconds, seconds))
+
+    return regressions
+
+
+def print_result(result, baseline_result):
+    print(f"\n{result['scenario']}: {result['num_teams']} teams, "
+          f"{result['matches_per_team']} matches per team, {result['num_rows']} rows")
+    print(f"{'Stage':<16}{'Seconds':>10}{'Baseline':>10}{'Change':>9}{'Peak MiB':>10}")
+
+    for stage_name, seconds in result["stage_seconds"].items():
+        peak_mib = result["stage_peak_bytes"][stage_name] / (1024 * 1024)
+
+        baseline_column = ""
+        change_column = ""
+        if baseline_result is not None and stage_name in baseline_result["stage_seconds"]:
+            baseline_seconds = baseline_result["stage_seconds"][stage_name]
+            baseline_column = f"{baseline_seconds:.4f}"
+            if baseline_seconds > 0:
+                change_column = f"{(seconds / baseline_seconds - 1) * 100:+.0f}%"
+
+        print(f"{stage_name:<16}{seconds:>10.4f}{baseline_column:>10}{change_column:>9}"
+              f"{peak_mib:>10.2f}")
+
+    print(f"{'total':<16}{result['total_seconds']:>10.4f}")
+
+
+########
+# MAIN #
+########
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Time each stage of process_data.py on made-up scouting data")
+    argument_parser.add_argument(
+        "scenarios",
+        nargs="*",
+        default=["district", "regional"],
+        help=f"premade event sizes to run ({', '.join(benchmark_scenarios)}), or 'custom' "
+             f"to use --teams and --matches-per-team")
+    argument_parser.add_argument("--teams", type=int, default=40)
+    argument_parser.add_argument("--matches-per-team", type=int, default=12)
+    argument_parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.05,
+        help="fraction of rows that get scouted twice")
+    argument_parser.add_argument(
+        "--garbage-rate",
+        type=float,
+        default=0.01,
+        help="fraction of rows with a missing team number")
+    argument_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="how many times to run each scenario (the fastest time for each stage is kept)")
+    argument_parser.add_argument("--seed", type=int, default=0)
+    argument_parser.add_argument(
+        "--baseline",
+        default=baseline_file_name,
+        help="json file with earlier results to compare against")
+    argument_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save these results as the new baseline instead of comparing against it")
+    argument_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_REGRESSION_TOLERANCE,
+        help="how much slower a stage can get before it counts as a regression (0.25 = 25%%)")
+    argument_parser.add_argument(
+        "--json",
+        help="also write the results to this json file")
+    argument_parser.add_argument(
+        "--check-sheet-cache",
+        action="store_true",
+        help="instead of timing anything, make the workbook twice in every --charts mode "
+             "and check that the second one is copied from the sheet cache correctly")
+    arguments = argument_parser.parse_args()
+
+    if arguments.check_sheet_cache:
+        problems = check_sheet_cache(
+            arguments.teams, arguments.matches_per_team, arguments.seed)
+        if problems:
+            print("\n> Sheet Cache Problems:")
+            for problem in problems:
+                print(f"    {problem}")
+            return 1
+
+        print("\n> Sheet Cache Reused Every Team Sheet\n")
+        return 0
+
+    baseline_results = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline, "r") as baseline_file:
+            baseline_results = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    for scenario_name in arguments.scenarios:
+        if scenario_name == "custom":
+            scenario = {
+                "num_teams": arguments.teams,
+                "matches_per_team": arguments.matches_per_team,
+            }
+        elif scenario_name in benchmark_scenarios:
+            scenario = benchmark_scenarios[scenario_name]
+        else:
+            argument_parser.error(f"unknown scenario {scenario_name}")
+
+        result = run_benchmark(
+            scenario_name,
+            scenario["num_teams"],
+            scenario["matches_per_team"],
+            arguments.duplicate_rate,
+            arguments.garbage_rate,
+            arguments.repeat,
+            arguments.seed)
+        results[scenario_name] = result
+
+        baseline_result = baseline_results.get(scenario_name)
+        if arguments.save_baseline:
+            baseline_result = None
+        print_result(result, baseline_result)
+
+        if baseline_result is not None:
+            for (stage_name, baseline_seconds, seconds) in compare_to_baseline(
+                    result, baseline_result, arguments.tolerance):
+                regressions.append((scenario_name, stage_name, baseline_seconds, seconds))
+
+    if arguments.json:
+        with open(arguments.json, "w") as json_file:
+            json.dump(results, json_file, indent=4)
+
+    if arguments.save_baseline:
+        baseline_results.update(results)
+        with open(arguments.baseline, "w") as baseline_file:
+            json.dump(baseline_results, baseline_file, indent=4)
+        print(f"\n> Saved Baseline to {arguments.baseline}\n")
+        return 0
+
+    if regressions:
+        print("\n> Performance Regressions:")
+        for (scenario_name, stage_name, baseline_seconds, seconds) in regressions:
+            print(f"    {scenario_name} {stage_name}: {baseline_seconds:.4f}s -> {seconds:.4f}s")
+        return 1
+
+    print("\n> No Performance Regressions\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
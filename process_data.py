@@ -1,7 +1,33 @@
+import argparse
+import array
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
 import csv
+import glob
+import hashlib
+import http.server
+import io
+import itertools
+import json
+import mmap
 import os
-import xlsxwriter
-from dataclasses import dataclass, field
+import posixpath
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+import zipfile
+import numpy as np
+from dataclasses import asdict, astuple, dataclass, field, fields
 
 
 ####################
@@ -11,21 +37,26 @@ from dataclasses import dataclass, field
 
 input_file_name = "input.csv"
 output_file_name = "output_data.xlsx"
-
-all_team_match_entries = []
-all_team_data = []
-team_num_list = []
-output_worksheets = []
-all_team_avg_match_contribution = []
-all_team_avg_auto = []
-all_team_avg_tele = []
-all_team_avg_climb = []
-all_team_defense_percent = []
-top_teams_across_categories = []
+checkpoint_file_name = "output_data.checkpoint.npz"
+parsed_cache_directory_name = "parsed_data_cache"
+profile_report_file_name = "profile_report.json"
+batch_output_directory_name = "batch_output"
+rollup_output_file_name = "season_rollup.xlsx"
+reject_report_file_name = "rejected_rows.csv"
+disagreement_report_file_name = "scout_disagreements.csv"
+query_server_host = "127.0.0.1"
+query_server_port = 8000
+match_store_file_name = "scouting_history.sqlite3"
+output_format_names = ("xlsx", "csv", "json", "npz")
+chart_mode_names = ("full", "combined", "rankings")
+schedule_file_name = "schedule.csv"
+drop_folder_name = "scout_exports"
+alliance_picks_file_name = "alliance_picks.csv"
 
 MAX_NUMBER_OF_QUAL_MATCHES = 15
-DATA_START_ROW = 37
+DATA_START_ROW = 44
 AVERAGES_ROW = 33
+DISTRIBUTION_START_ROW = 37
 STATISTICS_START_ROW = 16
 STATISTICS_START_COL = 0
 CHART_START_ROW = 1
@@ -34,7 +65,31 @@ FIRST_CHART_COL = "A"
 SECOND_CHART_COL = "E"
 THIRD_CHART_COL = "I"
 NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY = 5
-current_match_count = 0
+PROGRESS_REPORT_INTERVAL = 1000
+PARSED_DATA_SCHEMA_VERSION = 4
+PARSED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SHEET_CACHE_VERSION = 3
+SHEET_CACHE_XLSXWRITER_MAJOR_VERSION = 3
+# XML namespaces used by the parts of an .xlsx file that the sheet cache reads
+SPREADSHEET_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIPS_NAMESPACE = "http://schemas.openxmlformats.org/package/2006/relationships"
+DOCUMENT_RELATIONSHIPS_NAMESPACE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships")
+RECENT_MATCH_WINDOW = 4
+RECENT_FORM_SMOOTHING = 0.4
+TEAMS_PER_ALLIANCE = 3
+POWER_RATING_REGULARIZATION = 0.01
+POWER_RATING_TOLERANCE = 1e-8
+RANKING_CHART_NUM_TEAMS = 16
+DROP_FOLDER_POLL_SECONDS = 1.0
+DROP_FOLDER_DEBOUNCE_SECONDS = 2.0
+DROP_FILE_CHECK_BYTES = 4096
+PARSE_CHUNKS_PER_PROCESS = 4
+MIN_PARSE_CHUNK_BYTES = 1024 * 1024
+SIMULATED_MATCHES_PER_ALLIANCE = 20000
+SIMULATION_SEED = 2022
+MAX_ALLIANCES_PER_SIMULATION_BATCH = 256
+SIMULATION_BATCHES_PER_PROCESS = 4
 
 # For a single robot
 MAX_POSSIBLE_AUTO_POINTS = 10
@@ -82,8 +137,6 @@ team_labeling_colors = {
     25: "#805D93",
 }
 
-team_labeling_formats = {}
-
 
 taxi_completed_dict = {
     "Yes": 1,
@@ -100,13 +153,16 @@ hangar_level_points_dict = {
     "": -1
 }
 
-hangar_level_empty_count_dict = {
-    "No Hang": 0,
-    "Low Rung (1)": 0,
-    "Mid Rung (2)": 0,
-    "High Rung (3)": 0,
-    "Traversal Rung (4)": 0,
-}
+# The hangar levels and defense levels counted for each team's pie charts, and where each
+# one's count goes in the team's count array
+hangar_level_names = (
+    "No Hang",
+    "Low Rung (1)",
+    "Mid Rung (2)",
+    "High Rung (3)",
+    "Traversal Rung (4)",
+)
+hangar_level_count_index = {name: i for i, name in enumerate(hangar_level_names)}
 
 defense_level_as_percentage_dict = {
     "No": 0,
@@ -115,14 +171,15 @@ defense_level_as_percentage_dict = {
     "": -1,
 }
 
-defense_level_empty_count_dict = {
-    "No": 0,
-    "Unsure": 0,
-    "Yes": 0,
-}
+defense_level_names = (
+    "No",
+    "Unsure",
+    "Yes",
+)
+defense_level_count_index = {name: i for i, name in enumerate(defense_level_names)}
 
 
-@dataclass
+@dataclass(slots=True)
 class SingleTeamSingleMatchEntry:
     """Class to keep track of one team's performance during one match"""
     team_num: int
@@ -137,17 +194,852 @@ class SingleTeamSingleMatchEntry:
     other_info: str
 
 
-@dataclass
+class RecentFormAccumulator:
+    """Class to keep track of a team's averages over only its last few matches, and its
+    weighted averages where every match counts for less the older it gets (an
+    exponentially weighted moving average). Both are updated as each match is added,
+    without going back through the team's earlier matches. Matches count as more recent the
+    higher their qualification match number is, so they have to be added in that order."""
+
+    column_names = (
+        "successfully_completed_taxi",
+        "auto_cargo_scored_upper",
+        "auto_cargo_scored_lower",
+        "tele_cargo_scored_upper",
+        "tele_cargo_scored_lower",
+        "hangar_level",
+        "defense_level",
+    )
+
+    __slots__ = (
+        "window", "smoothing", "recent_matches", "recent_totals", "weighted_averages",
+        "last_match_num")
+
+    def __init__(self, window=RECENT_MATCH_WINDOW, smoothing=RECENT_FORM_SMOOTHING):
+        self.window = window
+        self.smoothing = smoothing
+
+        # Each match is a tuple of its values in the same order as column_names
+        self.recent_matches = collections.deque()
+        self.recent_totals = [0.0] * len(self.column_names)
+        self.weighted_averages = None
+        self.last_match_num = None
+
+    @classmethod
+    def from_matches(cls, match_entries):
+        # Make an accumulator from every match a team has played, in whatever order they
+        # were scouted
+        recent_form = cls()
+        for match_entry in sorted(match_entries, key=lambda x: x.qual_match_num):
+            recent_form.add_match(match_entry)
+        return recent_form
+
+    def add_match(self, match_entry):
+        # A match from before the last one added can't be slotted in without going back
+        # through the earlier matches, so it's left out and False is returned. The
+        # accumulator then has to be made again with from_matches().
+        if (self.last_match_num is not None
+                and match_entry.qual_match_num < self.last_match_num):
+            return False
+        self.last_match_num = match_entry.qual_match_num
+
+        match_values = tuple(getattr(match_entry, name) for name in self.column_names)
+
+        # Add the new match to the running totals, and take the oldest one back out once
+        # there are more than "window" matches
+        self.recent_matches.append(match_values)
+        for i, value in enumerate(match_values):
+            self.recent_totals[i] += value
+        if len(self.recent_matches) > self.window:
+            for i, value in enumerate(self.recent_matches.popleft()):
+                self.recent_totals[i] -= value
+
+        # Move each weighted average "smoothing" of the way towards the new match
+        if self.weighted_averages is None:
+            self.weighted_averages = list(match_values)
+        else:
+            for i, value in enumerate(match_values):
+                self.weighted_averages[i] += self.smoothing * (value - self.weighted_averages[i])
+
+        return True
+
+    def get_state(self):
+        # Everything needed to carry on from where this accumulator is later (see
+        # save_checkpoint()): the recent matches, their totals, the weighted averages and
+        # the number of the last match added
+        return (
+            list(self.recent_matches), self.recent_totals, self.weighted_averages,
+            self.last_match_num)
+
+    @classmethod
+    def from_state(cls, recent_matches, recent_totals, weighted_averages, last_match_num):
+        # Make an accumulator from the values returned by get_state()
+        recent_form = cls()
+        recent_form.recent_matches.extend(
+            tuple(match_values) for match_values in recent_matches)
+        recent_form.recent_totals = list(recent_totals)
+        if weighted_averages is not None:
+            recent_form.weighted_averages = list(weighted_averages)
+        recent_form.last_match_num = last_match_num
+        return recent_form
+
+    def recent_averages(self):
+        # Averages over the last "window" matches (or every match if there are fewer), as a
+        # dict of column name to average
+        if not self.recent_matches:
+            return dict.fromkeys(self.column_names, 0.0)
+        return {
+            name: total / len(self.recent_matches)
+            for name, total in zip(self.column_names, self.recent_totals)}
+
+    def exponential_averages(self):
+        if self.weighted_averages is None:
+            return dict.fromkeys(self.column_names, 0.0)
+        return dict(zip(self.column_names, self.weighted_averages))
+
+
+@dataclass(slots=True)
 class TeamData:
     team_num: int = 0
-    match_data: list = field(default_factory=list)
+
+    # Where the team's matches are in the match table, in the order they were scouted. The
+    # matches are only stored once, in the table, and only turned into match entries when
+    # they're needed (see get_match_entries()).
+    match_table: "MatchTable" = None
+    match_rows: array.array = field(default_factory=lambda: array.array("q"))
+
     taxi_percent: float = 0
     avg_auto_points: float = 0
     avg_tele_points: float = 0
     avg_defense_equivalent: float = 0
     avg_climb_points: float = 0
-    hangar_level_count_dict: dict = field(default_factory=dict)
-    defense_level_count_dict: dict = field(default_factory=dict)
+    hangar_level_counts: array.array = field(
+        default_factory=lambda: array.array("I", [0] * len(hangar_level_names)))
+    defense_level_counts: array.array = field(
+        default_factory=lambda: array.array("I", [0] * len(defense_level_names)))
+    avg_auto_cargo_upper: float = 0
+    avg_auto_cargo_lower: float = 0
+    avg_tele_cargo_upper: float = 0
+    avg_tele_cargo_lower: float = 0
+    match_count: int = 0
+    recent_form: RecentFormAccumulator = field(default_factory=RecentFormAccumulator)
+    opr: float = None
+    dpr: float = None
+    ccwm: float = None
+    distributions: dict = field(default_factory=dict)
+
+    def get_match_entries(self):
+        # Make a match entry for every match the team has played (in the order they were
+        # scouted) from its rows in the match table. The entries aren't kept, so this should
+        # only be called when they're about to be used (e.g. for the team's sheet).
+        if not self.match_rows:
+            return []
+        return list(self.match_table.entries(rows=np.array(self.match_rows, dtype=np.int64)))
+
+
+@dataclass
+class TeamRankings:
+    """Class to keep track of how every team ranks in each category"""
+    avg_match_contribution: list = field(default_factory=list)
+    avg_auto: list = field(default_factory=list)
+    avg_tele: list = field(default_factory=list)
+    avg_climb: list = field(default_factory=list)
+    defense_percent: list = field(default_factory=list)
+    top_teams_across_categories: dict = field(default_factory=dict)
+    team_category_ranks: dict = field(default_factory=dict)
+
+    # The same categories ranked by each team's last few matches and by its weighted recent
+    # averages (see RecentFormAccumulator), as lists in the same order as
+    # ranked_categories(), plus each team's ranks in them
+    recent_rankings: list = field(default_factory=list)
+    weighted_rankings: list = field(default_factory=list)
+    team_recent_ranks: dict = field(default_factory=dict)
+    team_weighted_ranks: dict = field(default_factory=dict)
+
+    # Teams ranked by their power ratings (see PowerRatingSolver), only filled in when
+    # there's a match schedule: "opr" and "ccwm" from highest to lowest, "dpr" from lowest
+    # to highest (fewest points allowed first)
+    power_rankings: dict = field(default_factory=dict)
+
+    # Teams ranked by how their match points are spread out (see
+    # compute_team_distributions()), best first: "median_match_contribution",
+    # "floor_match_contribution" (10th percentile), "ceiling_match_contribution" (90th
+    # percentile) and "consistency". Each team's match contribution statistics are kept too
+    # for the table on the ranking sheet.
+    distribution_rankings: dict = field(default_factory=dict)
+    team_match_contribution_stats: dict = field(default_factory=dict)
+
+    # The names used for each ranked category by the query service, in the same order as
+    # ranked_categories()
+    category_field_names = (
+        "avg_match_contribution",
+        "avg_auto",
+        "avg_tele",
+        "avg_climb",
+        "defense_percent",
+    )
+
+    def ranked_categories(self):
+        # The ranked categories in the order they show up on each team's sheet
+        return [
+            ("Avg. Match Points", self.avg_match_contribution),
+            ("Avg. Auto Points", self.avg_auto),
+            ("Avg. Teleop Points", self.avg_tele),
+            ("Avg. Climb Points", self.avg_climb),
+            ("Amount of Defense", self.defense_percent),
+        ]
+
+    def all_rankings(self):
+        # Every ranking list by name, including the recent form ones (e.g. "avg_auto",
+        # "recent_avg_auto" and "weighted_avg_auto")
+        rankings = {name: getattr(self, name) for name in self.category_field_names}
+        for name, recent_ranking, weighted_ranking in zip(
+                self.category_field_names, self.recent_rankings, self.weighted_rankings):
+            rankings[f"recent_{name}"] = recent_ranking
+            rankings[f"weighted_{name}"] = weighted_ranking
+        rankings.update(self.power_rankings)
+        rankings.update(self.distribution_rankings)
+        return rankings
+
+
+class TeamMatchKeys:
+    """Class to keep track of which (team number, match number) pairs have been seen, so
+    that duplicate entries can be dropped. Instead of a set of (team number, match number)
+    tuples, it keeps a set of match numbers for each team, so that there isn't a tuple (and
+    a team number) kept around for every row."""
+
+    __slots__ = ("team_match_nums",)
+
+    def __init__(self):
+        self.team_match_nums = {}
+
+    def add_if_new(self, team_num, qual_match_num):
+        # Add a team's match and return True, or return False if it had already been seen.
+        # Checking and adding in one go keeps this quick, since it's done for every row.
+        match_nums = self.team_match_nums.get(team_num)
+        if match_nums is None:
+            self.team_match_nums[team_num] = {qual_match_num}
+            return True
+        if qual_match_num in match_nums:
+            return False
+        match_nums.add(qual_match_num)
+        return True
+
+    def add_team_matches(self, team_num, qual_match_nums):
+        # Add every match number in qual_match_nums for one team at once
+        self.team_match_nums.setdefault(team_num, set()).update(qual_match_nums)
+
+
+class MatchTable:
+    """Columnar store of single-team single-match entries. Every field of
+    SingleTeamSingleMatchEntry gets its own typed numpy array instead of every row getting
+    its own python object, and the other_info text is interned so repeated notes are only
+    stored once."""
+
+    # Team and match numbers can be a lot bigger than any count or point value, so they get
+    # wider columns
+    int_column_dtypes = {
+        "team_num": np.int32,
+        "qual_match_num": np.int32,
+        "auto_cargo_scored_upper": np.int16,
+        "auto_cargo_scored_lower": np.int16,
+        "tele_cargo_scored_upper": np.int16,
+        "tele_cargo_scored_lower": np.int16,
+        "hangar_level": np.int16,
+    }
+    int_column_names = tuple(int_column_dtypes)
+    float_column_names = (
+        "successfully_completed_taxi",
+        "defense_level",
+    )
+
+    def __init__(self, capacity=256):
+        self.num_rows = 0
+        self.columns = {}
+        for name, dtype in self.int_column_dtypes.items():
+            self.columns[name] = np.zeros(capacity, dtype=dtype)
+        for name in self.float_column_names:
+            self.columns[name] = np.zeros(capacity, dtype=np.float32)
+
+        # other_info is stored as a code into other_info_strings
+        self.columns["other_info"] = np.zeros(capacity, dtype=np.int32)
+        self.other_info_strings = []
+        self.other_info_codes = {}
+
+    def __len__(self):
+        return self.num_rows
+
+    def append(self, match_entry):
+        # Add a SingleTeamSingleMatchEntry to the end of the table. Double the size of every
+        # column whenever the table runs out of room.
+        if self.num_rows == len(self.columns["team_num"]):
+            for name, column in self.columns.items():
+                self.columns[name] = np.resize(column, max(2 * len(column), 256))
+
+        other_info_code = self.get_other_info_code(match_entry.other_info)
+
+        row = self.num_rows
+        self.columns["team_num"][row] = match_entry.team_num
+        self.columns["qual_match_num"][row] = match_entry.qual_match_num
+        self.columns["successfully_completed_taxi"][row] = \
+            match_entry.successfully_completed_taxi
+        self.columns["auto_cargo_scored_upper"][row] = match_entry.auto_cargo_scored_upper
+        self.columns["auto_cargo_scored_lower"][row] = match_entry.auto_cargo_scored_lower
+        self.columns["tele_cargo_scored_upper"][row] = match_entry.tele_cargo_scored_upper
+        self.columns["tele_cargo_scored_lower"][row] = match_entry.tele_cargo_scored_lower
+        self.columns["hangar_level"][row] = match_entry.hangar_level
+        self.columns["defense_level"][row] = match_entry.defense_level
+        self.columns["other_info"][row] = other_info_code
+        self.num_rows += 1
+
+    def extend(self, other_match_table, rows=slice(None)):
+        # Add rows of another table to the end of this one, in order. "rows" can pick which
+        # rows get added (all of them by default).
+        other_info_code_map = np.array(
+            [self.get_other_info_code(other_info)
+             for other_info in other_match_table.other_info_strings],
+            dtype=np.int32)
+        new_columns = {name: other_match_table.column(name)[rows] for name in self.columns}
+        num_new_rows = len(new_columns["team_num"])
+        new_num_rows = self.num_rows + num_new_rows
+
+        if new_num_rows > len(self.columns["team_num"]):
+            for name, column in self.columns.items():
+                self.columns[name] = np.resize(column, max(2 * len(column), new_num_rows, 256))
+
+        new_columns["other_info"] = other_info_code_map[new_columns["other_info"]]
+        for name, new_column in new_columns.items():
+            self.columns[name][self.num_rows:new_num_rows] = new_column
+        self.num_rows = new_num_rows
+
+    def get_other_info_code(self, other_info):
+        other_info_code = self.other_info_codes.get(other_info)
+        if other_info_code is None:
+            other_info_code = len(self.other_info_strings)
+            self.other_info_codes[other_info] = other_info_code
+            self.other_info_strings.append(other_info)
+
+        return other_info_code
+
+    def column(self, name):
+        # Only the filled-in part of the column is returned
+        return self.columns[name][:self.num_rows]
+
+    def entry(self, row):
+        # Turn a single row of the table back into a SingleTeamSingleMatchEntry
+        return SingleTeamSingleMatchEntry(
+            team_num=int(self.columns["team_num"][row]),
+            qual_match_num=int(self.columns["qual_match_num"][row]),
+            successfully_completed_taxi=float(
+                self.columns["successfully_completed_taxi"][row]),
+            auto_cargo_scored_upper=int(self.columns["auto_cargo_scored_upper"][row]),
+            auto_cargo_scored_lower=int(self.columns["auto_cargo_scored_lower"][row]),
+            tele_cargo_scored_upper=int(self.columns["tele_cargo_scored_upper"][row]),
+            tele_cargo_scored_lower=int(self.columns["tele_cargo_scored_lower"][row]),
+            hangar_level=int(self.columns["hangar_level"][row]),
+            defense_level=float(self.columns["defense_level"][row]),
+            other_info=self.other_info_strings[self.columns["other_info"][row]],
+        )
+
+    def entries(self, first_row=0, rows=None):
+        # Hand out every row from first_row on as a SingleTeamSingleMatchEntry, or only the
+        # row numbers in "rows" if given. This is a lot quicker than calling entry() for
+        # every row because each column is turned into python numbers all at once.
+        field_values = []
+        for entry_field in fields(SingleTeamSingleMatchEntry):
+            if rows is None:
+                column_values = self.column(entry_field.name)[first_row:].tolist()
+            else:
+                column_values = self.column(entry_field.name)[rows].tolist()
+            if entry_field.name == "other_info":
+                column_values = [self.other_info_strings[code] for code in column_values]
+            field_values.append(column_values)
+
+        for match_values in zip(*field_values):
+            yield SingleTeamSingleMatchEntry(*match_values)
+
+    def team_totals(self, rows=slice(None)):
+        # Add up every numeric column for every team at once. "rows" can pick which rows of
+        # the table count towards the totals (all of them by default). Returns the sorted
+        # team numbers, how many rows each team has, and a dict of column name to an array
+        # of per-team totals in the same order as the team numbers.
+        team_nums, team_index = np.unique(
+            self.column("team_num")[rows], return_inverse=True)
+        match_counts = np.bincount(team_index, minlength=len(team_nums))
+
+        column_totals = {}
+        for name in self.int_column_names[2:] + self.float_column_names:
+            column_totals[name] = np.bincount(
+                team_index,
+                weights=self.column(name)[rows],
+                minlength=len(team_nums))
+
+        return team_nums, match_counts, column_totals
+
+    def to_arrays(self):
+        # Get every column (plus the interned other_info strings) as a dict of arrays that
+        # can be saved with np.savez
+        arrays = {f"column_{name}": self.column(name) for name in self.columns}
+        arrays["other_info_strings"] = np.array(self.other_info_strings, dtype=np.str_)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # Rebuild a table from the dict of arrays made by to_arrays(). The arrays are used
+        # as-is rather than copied (so memory-mapped arrays stay memory-mapped), and only
+        # get copied if more rows are appended later on (or if a column was saved with a
+        # different type).
+        match_table = cls(capacity=0)
+        match_table.num_rows = len(arrays["column_team_num"])
+        for name, column in match_table.columns.items():
+            match_table.columns[name] = arrays[f"column_{name}"].astype(
+                column.dtype, copy=False)
+        match_table.other_info_strings = arrays["other_info_strings"].tolist()
+        match_table.other_info_codes = {
+            other_info: code for code, other_info in enumerate(match_table.other_info_strings)}
+        return match_table
+
+
+class PowerRatingSolver:
+    """Class to estimate each team's offensive power rating (OPR, the points it adds to its
+    alliance's score) and defensive power rating (DPR, the points it lets the other
+    alliance score) by least squares, where every alliance's score is modeled as the sum
+    of its teams' ratings. The normal equations are solved by conjugate gradient, which
+    only needs the list of teams on each alliance instead of the whole (mostly zero)
+    alliance-by-team matrix. More matches can be added at any time, and the next solve
+    starts from the last solution, so it only takes a few steps."""
+
+    def __init__(self, regularization=POWER_RATING_REGULARIZATION):
+        # A small amount of regularization keeps the equations solvable early in an event,
+        # when some teams have only ever played together
+        self.regularization = regularization
+        self.team_nums = []
+        self.team_index = {}
+        self.added_match_nums = set()
+        self.alliance_team_indices = np.zeros((0, TEAMS_PER_ALLIANCE), dtype=np.int64)
+        self.alliance_scores = np.zeros(0)
+        self.opponent_scores = np.zeros(0)
+        self.ratings = {"opr": np.zeros(0), "dpr": np.zeros(0)}
+
+        # Matches added since the last solve, which get added to the arrays all at once
+        self.new_alliance_rows = []
+        self.new_alliance_scores = []
+        self.new_opponent_scores = []
+
+    def add_match(self, match_num, red_teams, blue_teams, red_score, blue_score):
+        # Add both alliances of one match (each alliance is a row of the least squares
+        # problem)
+        for team_nums, score, opponent_score in (
+                (red_teams, red_score, blue_score), (blue_teams, blue_score, red_score)):
+            for team_num in team_nums:
+                if team_num not in self.team_index:
+                    self.team_index[team_num] = len(self.team_nums)
+                    self.team_nums.append(team_num)
+
+            self.new_alliance_rows.append([self.team_index[team_num] for team_num in team_nums])
+            self.new_alliance_scores.append(score)
+            self.new_opponent_scores.append(opponent_score)
+
+        self.added_match_nums.add(match_num)
+
+    def add_new_matches_to_arrays(self):
+        if self.new_alliance_rows:
+            self.alliance_team_indices = np.vstack(
+                [self.alliance_team_indices, self.new_alliance_rows])
+            self.alliance_scores = np.append(self.alliance_scores, self.new_alliance_scores)
+            self.opponent_scores = np.append(self.opponent_scores, self.new_opponent_scores)
+            self.new_alliance_rows = []
+            self.new_alliance_scores = []
+            self.new_opponent_scores = []
+
+        # New teams start with the average rating of everyone else
+        for name, ratings in self.ratings.items():
+            num_new_teams = len(self.team_nums) - len(ratings)
+            if num_new_teams > 0:
+                self.ratings[name] = np.append(
+                    ratings, [ratings.mean() if len(ratings) else 0] * num_new_teams)
+
+    def apply_normal_matrix(self, ratings):
+        # Multiply by (A^T A + regularization * I) without building A, where A has a row per
+        # alliance with a 1 in the column of every team on it
+        alliance_sums = ratings[self.alliance_team_indices].sum(axis=1)
+        return np.bincount(
+            self.alliance_team_indices.ravel(),
+            weights=np.repeat(alliance_sums, TEAMS_PER_ALLIANCE),
+            minlength=len(self.team_nums)) + self.regularization * ratings
+
+    def solve_ratings(self, scores, initial_ratings, tolerance, max_iterations):
+        # Solve (A^T A + regularization * I) ratings = A^T scores by conjugate gradient,
+        # using the diagonal (how many alliances each team was on) as a preconditioner
+        num_teams = len(self.team_nums)
+        right_hand_side = np.bincount(
+            self.alliance_team_indices.ravel(),
+            weights=np.repeat(scores, TEAMS_PER_ALLIANCE),
+            minlength=num_teams)
+        diagonal = np.bincount(
+            self.alliance_team_indices.ravel(), minlength=num_teams) + self.regularization
+
+        ratings = initial_ratings.copy()
+        residual = right_hand_side - self.apply_normal_matrix(ratings)
+        preconditioned_residual = residual / diagonal
+        direction = preconditioned_residual.copy()
+        residual_dot = residual @ preconditioned_residual
+        stopping_norm = tolerance * max(np.linalg.norm(right_hand_side), 1)
+
+        num_iterations = 0
+        while np.linalg.norm(residual) > stopping_norm and num_iterations < max_iterations:
+            normal_matrix_direction = self.apply_normal_matrix(direction)
+            step_size = residual_dot / (direction @ normal_matrix_direction)
+            ratings += step_size * direction
+            residual -= step_size * normal_matrix_direction
+
+            preconditioned_residual = residual / diagonal
+            next_residual_dot = residual @ preconditioned_residual
+            direction = preconditioned_residual + (next_residual_dot / residual_dot) * direction
+            residual_dot = next_residual_dot
+            num_iterations += 1
+
+        return ratings, num_iterations
+
+    def solve(self, tolerance=POWER_RATING_TOLERANCE, max_iterations=None):
+        # Update the ratings for every match added so far. Returns a dict of team number to
+        # (OPR, DPR, CCWM), where CCWM (calculated contribution to winning margin) is
+        # OPR - DPR.
+        self.add_new_matches_to_arrays()
+        if max_iterations is None:
+            max_iterations = 10 * len(self.team_nums) + 10
+
+        for name, scores in (("opr", self.alliance_scores), ("dpr", self.opponent_scores)):
+            self.ratings[name], num_iterations = self.solve_ratings(
+                scores, self.ratings[name], tolerance, max_iterations)
+
+        return {
+            team_num: (opr, dpr, opr - dpr)
+            for team_num, opr, dpr in zip(
+                self.team_nums, self.ratings["opr"].tolist(), self.ratings["dpr"].tolist())}
+
+
+class PipelineProfiler:
+    """Class to keep track of how much time and memory each phase of the pipeline uses, and
+    to count things like rows read and sheets created. When it isn't enabled, every method
+    does as little as possible so that it can always be passed around."""
+
+    def __init__(self, enabled=False, trace_allocations=False):
+        self.enabled = enabled
+        self.trace_allocations = trace_allocations
+        self.phase_stats = {}
+        self.counters = {}
+        self.phase_stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Measure everything that happens inside the "with" block as part of a phase. Phases
+        # can be nested, in which case the time spent in the inner phase isn't counted
+        # towards the outer one. Using the same phase more than once adds up the totals.
+        if not self.enabled:
+            yield
+            return
+
+        start = self.take_measurement()
+        self.phase_stack.append({key: 0 for key in start})
+        try:
+            yield
+        finally:
+            end = self.take_measurement()
+            inner_phase_totals = self.phase_stack.pop()
+
+            stats = self.phase_stats.setdefault(
+                name, {key: 0 for key in ["calls"] + list(start)})
+            stats["calls"] += 1
+            for key in start:
+                phase_total = end[key] - start[key]
+                stats[key] += phase_total - inner_phase_totals[key]
+                if self.phase_stack:
+                    self.phase_stack[-1][key] += phase_total
+
+    def take_measurement(self):
+        measurement = {
+            "wall_seconds": time.perf_counter(),
+            "cpu_seconds": time.process_time(),
+            "net_allocated_blocks": sys.getallocatedblocks(),
+        }
+        if self.trace_allocations:
+            measurement["net_traced_bytes"] = tracemalloc.get_traced_memory()[0]
+        return measurement
+
+    def timed_items(self, name, iterable):
+        # Count the time spent getting each item out of "iterable" (e.g. a generator that
+        # parses rows) as part of a phase. This is how the streaming stages can be timed
+        # separately from whatever is using their output.
+        if not self.enabled:
+            return iterable
+        return self.generate_timed_items(name, iterable)
+
+    def generate_timed_items(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def counted_items(self, name, iterable):
+        # Count how many items come out of "iterable"
+        if not self.enabled:
+            return iterable
+        return self.generate_counted_items(name, iterable)
+
+    def generate_counted_items(self, name, iterable):
+        self.counters.setdefault(name, 0)
+        for item in iterable:
+            self.counters[name] += 1
+            yield item
+
+    def add_count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        # Everything that was measured, in a form that can be saved as json
+        report = {
+            "phases": self.phase_stats,
+            "counters": self.counters,
+            "total_wall_seconds": sum(
+                stats["wall_seconds"] for stats in self.phase_stats.values()),
+            "total_cpu_seconds": sum(
+                stats["cpu_seconds"] for stats in self.phase_stats.values()),
+        }
+        if self.trace_allocations:
+            report["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        return report
+
+
+class EventState:
+    """Class to keep an event's team data and rankings loaded in memory between queries, so
+    that new rows can be added and questions answered without re-reading the input csv"""
+
+    def __init__(self, input_file_name, output_file_name, incremental=False,
+                 use_cache=False, schedule=None, reject_report_file_name=None):
+        # With no input_file_name, the event starts with no matches and every row comes in
+        # through add_rows(). use_cache and reject_report_file_name are passed on to
+        # load_team_data().
+        self.output_file_name = output_file_name
+        if input_file_name is None:
+            self.team_data, self.match_table = {}, MatchTable()
+        else:
+            self.team_data, self.match_table = load_team_data(
+                input_file_name,
+                incremental=incremental,
+                use_cache=use_cache,
+                reject_report_file_name=reject_report_file_name)
+        self.team_totals = self.match_table.team_totals()
+
+        # Power ratings are kept up to date as rows come in if there's a match schedule,
+        # along with every scouted entry's match points (see get_scouted_match_points())
+        self.schedule = schedule
+        self.power_rating_solver = None
+        self.scouted_match_points = None
+        if schedule is not None:
+            self.scouted_match_points = get_scouted_match_points(self.match_table)
+            self.power_rating_solver = compute_power_ratings(
+                self.team_data, self.match_table, schedule,
+                scouted_match_points=self.scouted_match_points)
+
+        self.team_rankings = rank_teams(self.team_data)
+        self.seen_team_match_keys = TeamMatchKeys()
+        qual_match_nums = self.match_table.column("qual_match_num")
+        for team_num, single_teams_data in self.team_data.items():
+            team_rows = np.array(single_teams_data.match_rows, dtype=np.int64)
+            self.seen_team_match_keys.add_team_matches(
+                team_num, qual_match_nums[team_rows].tolist())
+        self.field_decoder = FieldDecoder()
+
+        # Requests are answered on separate threads, so only one can use the state at once
+        self.lock = threading.Lock()
+
+    def add_rows(self, csv_text, first_row_num=0):
+        # Add rows (in the same column layout as the input csv, without the column titles)
+        # and update the averages of only the teams that got new matches. first_row_num is
+        # the row number of the first row (counting from 0), for when the rows come from
+        # the middle of a file. Returns a summary of what happened to the rows.
+        with self.lock:
+            num_previous_entries = len(self.match_table)
+            num_previous_rejects = len(self.field_decoder.rejected_values)
+            num_previous_rejected_rows = self.field_decoder.num_rejected_rows
+            numbered_rows = list(enumerate(csv.reader(io.StringIO(csv_text)), first_row_num))
+
+            num_kept_entries = group_match_entries(
+                drop_invalid_entries(parse_rows(numbered_rows, self.field_decoder)),
+                self.team_data,
+                self.match_table,
+                self.seen_team_match_keys)
+
+            if num_kept_entries > 0:
+                new_team_totals = self.match_table.team_totals(
+                    rows=slice(num_previous_entries, None))
+                self.team_totals = merge_team_totals(self.team_totals, new_team_totals)
+                update_team_averages(
+                    self.team_data,
+                    select_team_totals(self.team_totals, new_team_totals[0]))
+                update_team_distributions(
+                    self.team_data,
+                    self.match_table,
+                    rows=np.isin(self.match_table.column("team_num"), new_team_totals[0]))
+                if self.schedule is not None:
+                    self.scouted_match_points.update(get_scouted_match_points(
+                        self.match_table, rows=slice(num_previous_entries, None)))
+                    compute_power_ratings(
+                        self.team_data,
+                        self.match_table,
+                        self.schedule,
+                        self.power_rating_solver,
+                        self.scouted_match_points)
+                self.team_rankings = rank_teams(self.team_data)
+
+            return {
+                "rows_received": len(numbered_rows),
+                "entries_kept": num_kept_entries,
+                "rows_rejected":
+                    self.field_decoder.num_rejected_rows - num_previous_rejected_rows,
+                # Row and column numbers count from 1 (at first_row_num for rows)
+                "rejected_values": [
+                    {"row": row_num + 1, "column": column_index + 1, "field": field_name,
+                     "value": text, "reason": reason}
+                    for row_num, column_index, field_name, text, reason
+                    in self.field_decoder.rejected_values[num_previous_rejects:]],
+            }
+
+    def team_summary(self, team_num):
+        # A team's averages and its rank in every category, or None if it hasn't played
+        with self.lock:
+            single_teams_data = self.team_data.get(team_num)
+            if single_teams_data is None:
+                return None
+
+            return get_team_summary(single_teams_data, self.team_rankings)
+
+    def team_nums(self):
+        with self.lock:
+            return sorted(self.team_data)
+
+    def category_names(self):
+        with self.lock:
+            return list(self.team_rankings.all_rankings())
+
+    def team_matches(self, team_num):
+        # Every match a team has played (in the order they were scouted), or None if it
+        # hasn't played
+        with self.lock:
+            single_teams_data = self.team_data.get(team_num)
+            if single_teams_data is None:
+                return None
+
+            return [
+                asdict(match_entry) for match_entry in single_teams_data.get_match_entries()]
+
+    def category_ranking(self, category_field_name, num_teams=None):
+        # The teams from best to worst in one category (just the top num_teams if given),
+        # or None if there is no such category
+        with self.lock:
+            if category_field_name not in self.team_rankings.all_rankings():
+                return None
+
+            return get_category_ranking(self.team_rankings, category_field_name, num_teams)
+
+    def render_workbook(self):
+        with self.lock:
+            render_workbook(
+                self.output_file_name,
+                self.team_data,
+                self.team_rankings,
+                use_sheet_cache=True)
+
+        return {"output_file_name": self.output_file_name}
+
+    def write_outputs(self, output_formats):
+        # Write every format in output_formats (see output_format_names). Returns the names
+        # of the files that were written.
+        with self.lock:
+            return write_output_files(
+                output_formats,
+                self.output_file_name,
+                self.team_data,
+                self.team_rankings,
+                self.match_table,
+                use_sheet_cache=True)
+
+
+class QueryRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Class to answer the query service's HTTP requests using the server's EventState"""
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path_parts = [part for part in url.path.split("/") if part != ""]
+        query = urllib.parse.parse_qs(url.query)
+        event_state = self.server.event_state
+
+        try:
+            if path_parts == ["teams"]:
+                self.send_json(200, {"teams": event_state.team_nums()})
+
+            elif len(path_parts) == 2 and path_parts[0] == "teams":
+                self.send_json_or_not_found(event_state.team_summary(int(path_parts[1])))
+
+            elif len(path_parts) == 3 and path_parts[0] == "teams" and \
+                    path_parts[2] == "matches":
+                self.send_json_or_not_found(event_state.team_matches(int(path_parts[1])))
+
+            elif path_parts == ["rankings"]:
+                self.send_json(200, {"categories": event_state.category_names()})
+
+            elif len(path_parts) == 2 and path_parts[0] == "rankings":
+                num_teams = int(query["top"][0]) if "top" in query else None
+                self.send_json_or_not_found(
+                    event_state.category_ranking(path_parts[1], num_teams))
+
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        except ValueError:
+            self.send_json(400, {"error": "team numbers and \"top\" have to be numbers"})
+
+    def do_POST(self):
+        path_parts = [part for part in self.path.split("/") if part != ""]
+        event_state = self.server.event_state
+
+        if path_parts == ["rows"]:
+            try:
+                request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                csv_text = request_body.decode("utf-8")
+            except UnicodeDecodeError:
+                self.send_json(400, {"error": "rows have to be sent as UTF-8 text"})
+                return
+            except ValueError:
+                self.send_json(400, {"error": "Content-Length has to be a number"})
+                return
+            self.send_json(200, event_state.add_rows(csv_text))
+
+        elif path_parts == ["workbook"]:
+            self.send_json(200, event_state.render_workbook())
+
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_json_or_not_found(self, response):
+        if response is None:
+            self.send_json(404, {"error": "not found"})
+        else:
+            self.send_json(200, response)
+
+    def send_json(self, status, response):
+        response_body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
 
 
 #############
@@ -158,22 +1050,18 @@ class TeamData:
 def get_max_value_from_comma_separated_numbers(numbers):
     # The argument "numbers" comes in as a string of numbers
     # e.x. "0, 1, 2, 3" or "0, 1" or just a single number as a string like "3"
-    number_str_list = numbers.split(",")
-    number_int_list = []
+    # Blank entries (e.g. from "1,,2" or "") count as 0. Raises ValueError if any entry
+    # isn't a whole number.
+    max_number = -1
 
-    for num in number_str_list:
-        # Sometimes the split() function above leaves blank entries, this handles that issue
+    for num in numbers.split(","):
         if num != "":
-            number_int_list.append(int(num))
+            num = int(num)
         else:
-            number_int_list.append(0)
-
-    # Just in case number_int_list is empty, add -1 so that it will be the max number and
-    # indicate that there was an error
-    number_int_list.append(-1)
+            num = 0
 
-    # Get the max value from the list of numbers
-    max_number = max(number_int_list)
+        if num > max_number:
+            max_number = num
 
     return max_number
 
@@ -206,668 +1094,3739 @@ def parse_match_number(num):
     return parsed_num
 
 
-######################
-# PROCESS INPUT DATA #
-######################
+def read_input_rows(file_name, read_progress):
+    # Hand out the rows of the input csv one at a time (along with their row number) so
+    # that the whole file never has to be held in memory at once. Reading starts from
+    # read_progress["byte_offset"] so that rows handled by an earlier run can be skipped,
+    # and read_progress is updated once the end of the file has been reached. The 0th row
+    # (column titles) is skipped.
+    with open(file_name, "rb") as input_binary_file:
+        input_binary_file.seek(read_progress["byte_offset"])
+        input_csv_file = io.TextIOWrapper(input_binary_file, newline="")
+        input_handling_object = csv.reader(input_csv_file)
 
+        row_count = read_progress["row_count"]
+        for row_data in input_handling_object:
+            row_num = row_count
+            row_count += 1
 
-# Open the input data spreadsheet and call it input_worksheet while inside of the "with"
-# statement
-with open(input_file_name, "r", newline="") as input_csv_file:
+            if row_num == 0:
+                print("Skipping Row Number 1 (Column Titles)")
+                continue
 
-    # Get rid of any existing output file
-    if os.path.exists(output_file_name):
-        os.remove(output_file_name)
+            # Printing every single row takes longer than processing it, so only print
+            # every so often
+            if row_num % PROGRESS_REPORT_INTERVAL == 0:
+                print(f"Processing Row Number {row_num + 1}")
 
-    # Create the csv handling object out of the open csv file
-    input_handling_object = csv.reader(input_csv_file)
-
-    for row_num, row_data in enumerate(input_handling_object):
-        # Skip the 0th row (column titles). Python starts counting at 0 instead of 1
-        if row_num > 0:
-            # Put all of the information from a single row in excel into a python object
-            # called "team_match_entry" to make it easier to deal with later on
-            print(f"Processing Row Number {row_num + 1}")
-            team_match_entry = SingleTeamSingleMatchEntry(
-                team_num=parse_team_number(row_data[3]),
-                qual_match_num=parse_match_number(row_data[4]),
-                successfully_completed_taxi=taxi_completed_dict[row_data[5]],
-                auto_cargo_scored_upper=get_max_value_from_comma_separated_numbers(
-                    row_data[6]),
-                auto_cargo_scored_lower=get_max_value_from_comma_separated_numbers(
-                    row_data[7]),
-                tele_cargo_scored_upper=get_max_value_from_comma_separated_numbers(
-                    row_data[8]),
-                tele_cargo_scored_lower=get_max_value_from_comma_separated_numbers(
-                    row_data[9]),
-                hangar_level=hangar_level_points_dict[row_data[10]],
-                defense_level=defense_level_as_percentage_dict[row_data[11]],
-                other_info=row_data[12]
-            )
-
-            # Add the single-team single-match entry (i.e. data from one row) to a list
-            # containing all of these entries
-            all_team_match_entries.append(team_match_entry)
-        else:
-            print("Skipping Row Number 1 (Column Titles)")
+            yield row_num, row_data
 
+        read_progress["row_count"] = row_count
+        read_progress["byte_offset"] = input_binary_file.tell()
 
-# Go through every match entry one-by-one and check if a class for all of a team's matches
-# has been created yet (the TeamData class). If not, create it and add it to a list of
-# these classes. Then, add the current match entry to its corresponding class containing all
-# of that team's match entries.
-for match_entry in all_team_match_entries:
-    # If the team num is -1 (due to an input error), skip this iteration of the for loop
-    if match_entry.team_num == -1:
-        continue
 
-    if match_entry.team_num not in team_num_list:
-        team_num_list.append(match_entry.team_num)
+def find_next_row_start(mapped_input_file, position, inside_quotes=False):
+    # Find where the next row of the input csv starts after "position" (or the end of the
+    # file if there isn't one). A newline only ends a row if it isn't inside a quoted field,
+    # since notes can have line breaks in them. Every quote either starts or ends a quoted
+    # field, or is one half of an escaped quote (""), so after an even number of quotes
+    # we're back outside of quotes.
+    while True:
+        newline_position = mapped_input_file.find(b"\n", position)
+        if newline_position == -1:
+            return len(mapped_input_file)
 
-        new_single_team_data = TeamData()
-        new_single_team_data.team_num = match_entry.team_num
-        new_single_team_data.hangar_level_count_dict = {
-            key: value for key, value in hangar_level_empty_count_dict.items()}
-        new_single_team_data.defense_level_count_dict = {
-            key: value for key, value in defense_level_empty_count_dict.items()}
+        num_quotes = mapped_input_file[position:newline_position].count(b'"')
+        inside_quotes = inside_quotes != (num_quotes % 2 == 1)
+        position = newline_position + 1
 
-        all_team_data.append(new_single_team_data)
+        if not inside_quotes:
+            return position
 
-    for single_teams_data in all_team_data:
-        if single_teams_data.team_num == match_entry.team_num:
 
-            duplicate_entry = False
+def find_input_chunk_boundaries(mapped_input_file, start_offset, num_chunks):
+    # Split the input csv from start_offset to the end into about num_chunks pieces that
+    # each start at the beginning of a row. Returns the byte offset where each chunk
+    # starts, followed by the end of the file.
+    file_size = len(mapped_input_file)
+    chunk_size = max((file_size - start_offset) // num_chunks, 1)
+    chunk_boundaries = [start_offset]
 
-            for single_team_match in single_teams_data.match_data:
-                if match_entry.qual_match_num == single_team_match.qual_match_num:
-                    duplicate_entry = True
+    while chunk_boundaries[-1] + chunk_size < file_size:
+        # Whether we're inside a quoted field at the guessed boundary depends on how many
+        # quotes came before it in this chunk
+        guessed_boundary = chunk_boundaries[-1] + chunk_size
+        num_quotes = mapped_input_file[chunk_boundaries[-1]:guessed_boundary].count(b'"')
+        next_row_start = find_next_row_start(
+            mapped_input_file, guessed_boundary, inside_quotes=num_quotes % 2 == 1)
 
-            if not duplicate_entry:
-                single_teams_data.match_data.append(match_entry)
+        if next_row_start >= file_size:
+            break
+        chunk_boundaries.append(next_row_start)
 
+    chunk_boundaries.append(file_size)
+    return chunk_boundaries
 
-###############################
-# GENERATE OUTPUT SPREADSHEET #
-###############################
 
+def parse_input_chunk(input_file_name, start_offset, end_offset, keep_duplicates=False):
+    # Parse the rows between two byte offsets of the input csv (both at the start of a row)
+    # into a match table. This runs in a worker process, so only the part of the file it
+    # needs is read, and it sends back the match table as arrays. Like
+    # group_match_entries(), only the first entry for each team in each match is kept,
+    # unless keep_duplicates is True (so they can be reconciled later on). Row numbers in
+    # the rejected values count from 0 at the start of the chunk.
+    with open(input_file_name, "rb") as input_binary_file:
+        with mmap.mmap(
+                input_binary_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_input_file:
+            chunk_bytes = mapped_input_file[start_offset:end_offset]
 
-# Create a new workbook for the nicely formatted output workbook with each team as a
-# separate tab
-with xlsxwriter.Workbook(output_file_name) as output_workbook:
+    chunk_rows = csv.reader(io.TextIOWrapper(io.BytesIO(chunk_bytes), newline=""))
+    field_decoder = FieldDecoder()
+    match_table = MatchTable()
+    seen_team_match_keys = TeamMatchKeys()
+    num_valid_rows = 0
 
-    # Cell formatting objects to format cells as percents, decimals, etc.
-    percent_format = output_workbook.add_format({'num_format': '0.0%'})
-    one_decimal_format = output_workbook.add_format({'num_format': '0.0'})
+    for match_entry in drop_invalid_entries(parse_rows(enumerate(chunk_rows), field_decoder)):
+        num_valid_rows += 1
+        is_new_team_match = seen_team_match_keys.add_if_new(
+            match_entry.team_num, match_entry.qual_match_num)
+        if not is_new_team_match and not keep_duplicates:
+            continue
+        match_table.append(match_entry)
 
-    # Create color formats for each team color for use later on in the ranking sheet
-    for key, value in team_labeling_colors.items():
-        new_format = output_workbook.add_format({'num_format': '0'})
-        new_format.set_bg_color(value)
-        team_labeling_formats.update({key: new_format})
+    return {
+        "match_table_arrays": match_table.to_arrays(),
+        "num_rows": field_decoder.num_rows,
+        "num_valid_rows": num_valid_rows,
+        "num_rejected_rows": field_decoder.num_rejected_rows,
+        "rejected_values": field_decoder.rejected_values,
+    }
 
-    # Sort the team number list in ascending order
-    team_num_list = sorted(team_num_list)
 
-    # Create the ranking worksheet first
-    ranking_worksheet = output_workbook.add_worksheet("Rankings")
-    output_worksheets.append(ranking_worksheet)
+def parse_input_in_parallel(input_file_name, read_progress, num_processes,
+                            keep_duplicates=False):
+    # Does the same job as read_input_rows() and parse_rows(), but splits the input csv into
+    # chunks and parses them in separate processes. Returns the parsed chunks in the same
+    # order as the file, each with the row number of its first row, and updates
+    # read_progress like read_input_rows() does.
+    file_size = os.path.getsize(input_file_name)
+    start_offset = read_progress["byte_offset"]
+    row_count = read_progress["row_count"]
+    if start_offset >= file_size:
+        return []
 
-    # Create a new sheet for every team
-    for team_num in team_num_list:
-        single_teams_worksheet = output_workbook.add_worksheet(str(team_num))
-        output_worksheets.append(single_teams_worksheet)
-
-        # Find the all_team_data entry for the team with the same number as the team_num
-        # variable
-        for single_teams_data in all_team_data:
-            if single_teams_data.team_num == team_num:
-
-                # Sort the match data to be in ascending order of qual match number. I don't
-                # fully understand how this works, but I got it from stack overflow and it
-                # does the job.
-                single_teams_data.match_data = sorted(
-                    single_teams_data.match_data,
-                    key=lambda x: x.qual_match_num,
-                    reverse=False)
-
-                # Populate the worksheet for this team with match data, graphs, etc.
-
-                # Data category titles for averages
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 1, "Taxi")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 2, "AUTO - Cargo Scored [Upper Hub]")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 3, "AUTO - Cargo Scored [Lower Hub]")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 4, "TELEOP - Cargo Scored [Upper Hub]")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 5, "TELEOP - Cargo Scored [Lower Hub]")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 6, "Hangar")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW - 1, 7, "Mostly defense?")
-
-                # Data category titles for match data
-                single_teams_worksheet.write(
-                    DATA_START_ROW - 1, 0, "MATCH DATA")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 0, "Qualification Number")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 1, "Taxi")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 2, "AUTO - Cargo Scored [Upper Hub]")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 3, "AUTO - Cargo Scored [Lower Hub]")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 4, "TELEOP - Cargo Scored [Upper Hub]")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 5, "TELEOP - Cargo Scored [Lower Hub]")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 6, "Hangar")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 7, "Mostly defense?")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 8, "Other Information")
-
-                # For charts later on
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 23, "Taxi Num")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 24, "Climb Num")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 25, "Defense Num")
-
-                # Set the column widths to make the text legible
-                single_teams_worksheet.set_column_pixels(0, 0, 120)   # Qual
-                single_teams_worksheet.set_column_pixels(1, 1, 50)   # Taxi
-                single_teams_worksheet.set_column_pixels(
-                    2, 3, 180)                                        # Auto cargo (both)
-                single_teams_worksheet.set_column_pixels(
-                    4, 5, 190)                                        # Tele cargo (both)
-                single_teams_worksheet.set_column_pixels(6, 6, 100)    # Hangar
-                single_teams_worksheet.set_column_pixels(7, 7, 90)    # Defense
-                single_teams_worksheet.set_column_pixels(8, 8, 1000)  # Other
-
-                # These variables keep track of the total points scored in each category
-                # so that averages can be calculated later
-                team_total_taxi_equivalent = 0
-                team_total_auto_cargo_upper = 0
-                team_total_auto_cargo_lower = 0
-                team_total_tele_cargo_upper = 0
-                team_total_tele_cargo_lower = 0
-                team_total_defense_equivalent = 0
-                team_total_climb_points = 0
-
-                # Add the team's match data to that team's worksheet
-                for i, match in enumerate(single_teams_data.match_data):
-                    # Turn the python representation of the match data back into
-                    # human-friendly text that can be written to the spreadsheet
-                    taxi_string = "Yes" if match.successfully_completed_taxi == 1 else "No"
-
-                    hangar_string = "ERROR"
-                    for key, value in hangar_level_points_dict.items():
-                        if match.hangar_level == value:
-                            hangar_string = key
-                            single_teams_data.hangar_level_count_dict[key] += 1
-
-                    defense_string = "ERROR"
-                    for key, value in defense_level_as_percentage_dict.items():
-                        if match.defense_level == value:
-                            defense_string = key
-                            single_teams_data.defense_level_count_dict[key] += 1
-
-                    # i + 1 is needed because i starts counting at 0, but I want the first
-                    # row of match data to be in the row at index 1, not 0.
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 0, match.qual_match_num)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 1, taxi_string)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 2, match.auto_cargo_scored_upper)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 3, match.auto_cargo_scored_lower)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 4, match.tele_cargo_scored_upper)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 5, match.tele_cargo_scored_lower)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 6, hangar_string)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 7, defense_string)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 8, match.other_info)
-
-                    # For charts later on
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 23, match.successfully_completed_taxi)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 24, match.hangar_level)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 25, match.defense_level)
-
-                    # Add up the team total numbers across all matches
-                    team_total_taxi_equivalent += match.successfully_completed_taxi
-                    team_total_auto_cargo_upper += match.auto_cargo_scored_upper
-                    team_total_auto_cargo_lower += match.auto_cargo_scored_lower
-                    team_total_tele_cargo_upper += match.tele_cargo_scored_upper
-                    team_total_tele_cargo_lower += match.tele_cargo_scored_lower
-                    team_total_defense_equivalent += match.defense_level
-                    team_total_climb_points += match.hangar_level
-
-                # Write climb total counts to sheet for pie charts later
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 19, "Hangar levels")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 20, "Frequency")
-                for i, (key, value) in enumerate(single_teams_data.hangar_level_count_dict.items()):
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 19, key)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 20, value)
-
-                # Write defense total counts to sheet for pie charts later
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 21, "Hangar levels")
-                single_teams_worksheet.write(
-                    DATA_START_ROW, 22, "Frequency")
-                for i, (key, value) in enumerate(single_teams_data.defense_level_count_dict.items()):
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 21, key)
-                    single_teams_worksheet.write(
-                        DATA_START_ROW + i + 1, 22, value)
-
-                # Get the current number of matches this team has completed
-                current_match_count = len(single_teams_data.match_data)
-
-                # Create averages from totals
-                team_avg_taxi_percent = team_total_taxi_equivalent / current_match_count
-                team_avg_auto_cargo_upper = team_total_auto_cargo_upper / current_match_count
-                team_avg_auto_cargo_lower = team_total_auto_cargo_lower / current_match_count
-                team_avg_tele_cargo_upper = team_total_tele_cargo_upper / current_match_count
-                team_avg_tele_cargo_lower = team_total_tele_cargo_lower / current_match_count
-                team_avg_defense_equivalent = team_total_defense_equivalent / current_match_count
-                team_avg_climb_points = team_total_climb_points / current_match_count
-
-                # Update general team statistics based on these averages
-                single_teams_data.taxi_percent = team_avg_taxi_percent
-                single_teams_data.avg_auto_points = 2 * team_avg_taxi_percent + \
-                    2 * team_avg_auto_cargo_lower + 4 * team_avg_auto_cargo_upper
-                single_teams_data.avg_tele_points = team_avg_tele_cargo_lower + \
-                    2 * team_avg_tele_cargo_upper
-                single_teams_data.avg_defense_equivalent = team_avg_defense_equivalent
-                single_teams_data.avg_climb_points = team_avg_climb_points
-
-                # Add team statistics to lists for ranking
-                all_team_avg_match_contribution.append(
-                    (team_num, single_teams_data.avg_auto_points + single_teams_data.avg_tele_points + single_teams_data.avg_climb_points))
-                all_team_avg_auto.append(
-                    (team_num, single_teams_data.avg_auto_points))
-                all_team_avg_tele.append(
-                    (team_num, single_teams_data.avg_tele_points))
-                all_team_avg_climb.append(
-                    (team_num, single_teams_data.avg_climb_points))
-                all_team_defense_percent.append(
-                    (team_num, single_teams_data.avg_defense_equivalent))
-
-                # Print averages to the spreadsheet
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 0, "Averages:")
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 1, team_avg_taxi_percent, percent_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 2, team_avg_auto_cargo_upper, one_decimal_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 3, team_avg_auto_cargo_lower, one_decimal_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 4, team_avg_tele_cargo_upper, one_decimal_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 5, team_avg_tele_cargo_lower, one_decimal_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 6, team_avg_climb_points, one_decimal_format)
-                single_teams_worksheet.write(
-                    AVERAGES_ROW, 7, team_avg_defense_equivalent, percent_format)
-
-                # Summary statistics
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW,
-                    STATISTICS_START_COL,
-                    "Taxi Percentage: ")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW,
-                    STATISTICS_START_COL + 1,
-                    single_teams_data.taxi_percent,
-                    percent_format)
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 1,
-                    STATISTICS_START_COL,
-                    "Avg. Auto Points: ")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 1,
-                    STATISTICS_START_COL + 1,
-                    single_teams_data.avg_auto_points,
-                    one_decimal_format)
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 1,
-                    STATISTICS_START_COL + 2,
-                    "(Including avg. taxi points)")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 2,
-                    STATISTICS_START_COL,
-                    "Avg. Teleop Points: ")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 2,
-                    STATISTICS_START_COL + 1,
-                    single_teams_data.avg_tele_points,
-                    one_decimal_format)
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 3,
-                    STATISTICS_START_COL,
-                    "Avg. Climb Points: ")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 3,
-                    STATISTICS_START_COL + 1,
-                    single_teams_data.avg_climb_points,
-                    one_decimal_format)
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 4,
-                    STATISTICS_START_COL,
-                    "Defense Percentage: ")
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 4,
-                    STATISTICS_START_COL + 1,
-                    single_teams_data.avg_defense_equivalent,
-                    percent_format)
-                single_teams_worksheet.write(
-                    STATISTICS_START_ROW + 4,
-                    STATISTICS_START_COL + 2,
-                    "(100% = Yes/Always, 0% = No/Never)")
-
-                # Create the chart for cargo scored in auto (high vs. low)
-                cargo_in_auto_chart = output_workbook.add_chart(
-                    {'type': 'column'})
-                cargo_in_auto_chart.set_title(
-                    {'name': 'AUTO - Upper vs. Lower Hub Cargo'})
-                cargo_in_auto_chart.set_x_axis(
-                    {'name': 'Qualification Match'})
-                cargo_in_auto_chart.set_y_axis(
-                    {'name': 'Cargo Scored',
-                     'min': 0,
-                     'max': MAX_POSSIBLE_AUTO_POINTS})
-                cargo_in_auto_chart.add_series({
-                    'name': 'Upper Hub',
-                    'categories': f'={single_teams_data.team_num}!A{DATA_START_ROW + 2}:A{DATA_START_ROW + current_match_count + 1}',
-                    'values': f'={single_teams_data.team_num}!C{DATA_START_ROW + 2}:C{DATA_START_ROW + current_match_count + 1}',
-                    'fill': {'color': chart_colors["BLUE"]},
-                })
-                cargo_in_auto_chart.add_series({
-                    'name': 'Lower Hub',
-                    'categories': f'={single_teams_data.team_num}!A{DATA_START_ROW + 2}:A{DATA_START_ROW + current_match_count + 1}',
-                    'values': f'={single_teams_data.team_num}!D{DATA_START_ROW + 2}:D{DATA_START_ROW + current_match_count + 1}',
-                    'fill': {'color': chart_colors["RED"]},
-                })
-
-                single_teams_worksheet.insert_chart(
-                    f"{FIRST_CHART_COL}{CHART_START_ROW}", cargo_in_auto_chart)
-
-                # Create the chart for cargo scored in teleop (high vs. low)
-                cargo_in_teleop_chart = output_workbook.add_chart(
-                    {'type': 'column'})
-                cargo_in_teleop_chart.set_title(
-                    {'name': 'TELEOP - Upper vs. Lower Hub Cargo'})
-                cargo_in_teleop_chart.set_x_axis(
-                    {'name': 'Qualification Match'})
-                cargo_in_teleop_chart.set_y_axis(
-                    {'name': 'Cargo Scored',
-                     'min': 0,
-                     'max': MAX_POSSIBLE_TELE_POINTS})
-                cargo_in_teleop_chart.add_series({
-                    'name': 'Upper Hub',
-                    'categories': f'={single_teams_data.team_num}!A{DATA_START_ROW + 2}:A{DATA_START_ROW + current_match_count + 1}',
-                    'values': f'={single_teams_data.team_num}!E{DATA_START_ROW + 2}:E{DATA_START_ROW + current_match_count + 1}',
-                    'fill': {'color': chart_colors["BLUE"]},
-                })
-                cargo_in_teleop_chart.add_series({
-                    'name': 'Lower Hub',
-                    'categories': f'={single_teams_data.team_num}!A{DATA_START_ROW + 2}:A{DATA_START_ROW + current_match_count + 1}',
-                    'values': f'={single_teams_data.team_num}!F{DATA_START_ROW + 2}:F{DATA_START_ROW + current_match_count + 1}',
-                    'fill': {'color': chart_colors["RED"]},
-                })
-
-                single_teams_worksheet.insert_chart(
-                    f"{SECOND_CHART_COL}{CHART_START_ROW}", cargo_in_teleop_chart)
-
-                # Create the chart for hangar level across matches
-                hangar_points_over_time_chart = output_workbook.add_chart(
-                    {'type': 'column'})
-                hangar_points_over_time_chart.set_title(
-                    {'name': 'Hangar Points Over Time'})
-                hangar_points_over_time_chart.set_x_axis(
-                    {'name': 'Qualification Match'})
-                hangar_points_over_time_chart.set_y_axis(
-                    {'name': 'Hangar Points',
-                     'min': 0,
-                     'max': 15})
-                hangar_points_over_time_chart.add_series({
-                    'name': 'Hangar Points',
-                    'categories': f'={single_teams_data.team_num}!A{DATA_START_ROW + 2}:A{DATA_START_ROW + current_match_count + 1}',
-                    'values': f'={single_teams_data.team_num}!Y{DATA_START_ROW + 2}:Y{DATA_START_ROW + current_match_count + 1}',
-                    'fill': {'color': chart_colors["RED"]},
-                })
-
-                single_teams_worksheet.insert_chart(
-                    f"{SECOND_CHART_COL}{CHART_START_ROW + CHART_ROW_SPACING}", hangar_points_over_time_chart)
-
-                # Hangar Pie Chart
-                hangar_pie_chart = output_workbook.add_chart(
-                    {'type': 'pie'})
-                hangar_pie_chart.set_title(
-                    {'name': 'Climb Level Breakdown'})
-                hangar_pie_chart.add_series({
-                    'name': 'Climb Level',
-                    'categories': f'={single_teams_data.team_num}!T{DATA_START_ROW + 2}:T{DATA_START_ROW + 6}',
-                    'values': f'={single_teams_data.team_num}!U{DATA_START_ROW + 2}:U{DATA_START_ROW + 6}',
-                    'points': [
-                        {'fill': {'color': chart_colors["BLACK"]}},
-                        {'fill': {'color': chart_colors["RED"]}},
-                        {'fill': {'color': chart_colors["YELLOW"]}},
-                        {'fill': {'color': chart_colors["BLUE"]}},
-                        {'fill': {'color': chart_colors["GREEN"]}},
-                    ]
-                })
-
-                single_teams_worksheet.insert_chart(
-                    f"{THIRD_CHART_COL}{CHART_START_ROW + CHART_ROW_SPACING}", hangar_pie_chart)
-
-                # Defense Pie Chart
-                defense_pie_chart = output_workbook.add_chart(
-                    {'type': 'pie'})
-                defense_pie_chart.set_title(
-                    {'name': 'Does This Team Play Defense?'})
-                defense_pie_chart.add_series({
-                    'name': 'Defense',
-                    'categories': f'={single_teams_data.team_num}!V{DATA_START_ROW + 2}:V{DATA_START_ROW + 4}',
-                    'values': f'={single_teams_data.team_num}!W{DATA_START_ROW + 2}:W{DATA_START_ROW + 4}',
-                    'points': [
-                        {'fill': {'color': chart_colors["RED"]}},
-                        {'fill': {'color': chart_colors["YELLOW"]}},
-                        {'fill': {'color': chart_colors["GREEN"]}},
-                    ]
-                })
-
-                single_teams_worksheet.insert_chart(
-                    f"{THIRD_CHART_COL}{CHART_START_ROW}", defense_pie_chart)
-
-                # TODO: Extremely fancy graphs that look absurd
+    with open(input_file_name, "rb") as input_binary_file:
+        with mmap.mmap(
+                input_binary_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_input_file:
+            if row_count == 0:
+                print("Skipping Row Number 1 (Column Titles)")
+                start_offset = find_next_row_start(mapped_input_file, start_offset)
+                row_count = 1
 
-    # Sort/rank all of the team's individual statistics to find leaders in each category
-    all_team_avg_match_contribution = sorted(
-        all_team_avg_match_contribution,
-        key=lambda x: x[1],
-        reverse=True)
-    all_team_avg_auto = sorted(
-        all_team_avg_auto,
-        key=lambda x: x[1],
-        reverse=True)
-    all_team_avg_tele = sorted(
-        all_team_avg_tele,
-        key=lambda x: x[1],
-        reverse=True)
-    all_team_avg_climb = sorted(
-        all_team_avg_climb,
-        key=lambda x: x[1],
-        reverse=True)
-    all_team_defense_percent = sorted(
-        all_team_defense_percent,
-        key=lambda x: x[1],
-        reverse=True)
+            # Make a few chunks per process so that one slow chunk doesn't hold up the
+            # rest, but don't make them so small that sending them back takes longer
+            num_chunks = max(1, min(
+                num_processes * PARSE_CHUNKS_PER_PROCESS,
+                (file_size - start_offset) // MIN_PARSE_CHUNK_BYTES))
+            chunk_boundaries = find_input_chunk_boundaries(
+                mapped_input_file, start_offset, num_chunks)
 
-    # Add the top 5 from each category to a set of all of these teams, where duplicates will
-    # be avoided. This list will determine which teams get colored
-    top_teams_across_categories += all_team_avg_match_contribution[0:
-                                                                   NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
-    top_teams_across_categories += all_team_avg_auto[0:
-                                                     NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
-    top_teams_across_categories += all_team_avg_tele[0:
-                                                     NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
-    top_teams_across_categories += all_team_avg_climb[0:
-                                                      NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
-    top_teams_across_categories += all_team_defense_percent[0:
-                                                            NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
+    print(f"Parsing {len(chunk_boundaries) - 1} Chunks on {num_processes} Processes")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        parsed_chunks = list(executor.map(
+            parse_input_chunk,
+            itertools.repeat(input_file_name),
+            chunk_boundaries[:-1],
+            chunk_boundaries[1:],
+            itertools.repeat(keep_duplicates)))
 
-    # Get a list of unique teams that are at the top of at least one category
-    top_teams_across_categories = list(set([
-        team for (team, junk) in top_teams_across_categories]))
+    for parsed_chunk in parsed_chunks:
+        parsed_chunk["first_row_num"] = row_count
+        row_count += parsed_chunk["num_rows"]
 
-    # Add a number to each team that corresponds to its color on the ranking sheet
-    top_teams_across_categories = {
-        team: i + 1 for i, team in enumerate(top_teams_across_categories)}
+    read_progress["row_count"] = row_count
+    read_progress["byte_offset"] = file_size
+    return parsed_chunks
 
-    # Write the column headers
-    ranking_worksheet.write(0, 0, "#")
-    ranking_worksheet.write(0, 2, "Team")
-    ranking_worksheet.write(0, 3, "Avg. Match Contribution (Pts.)")
-    ranking_worksheet.write(0, 5, "Team")
-    ranking_worksheet.write(0, 6, "Avg. Auto Pts.")
-    ranking_worksheet.write(0, 8, "Team")
-    ranking_worksheet.write(0, 9, "Avg. Teleop Pts.")
-    ranking_worksheet.write(0, 11, "Team")
-    ranking_worksheet.write(0, 12, "Avg. Climb Pts.")
-    ranking_worksheet.write(0, 14, "Team")
-    ranking_worksheet.write(0, 15, "Defense %")
 
-    # Set the column widths so the text is legible
-    ranking_worksheet.set_column_pixels(0, 0, 20)  # Num
-    ranking_worksheet.set_column_pixels(1, 1, 10)    # Gap
-    ranking_worksheet.set_column_pixels(2, 2, 40)   # Team
-    ranking_worksheet.set_column_pixels(3, 3, 170)  # Match pts
-    ranking_worksheet.set_column_pixels(4, 4, 10)   # Gap
-    ranking_worksheet.set_column_pixels(5, 5, 40)   # Team
-    ranking_worksheet.set_column_pixels(6, 6, 80)  # Auto pts
-    ranking_worksheet.set_column_pixels(7, 7, 10)   # Gap
-    ranking_worksheet.set_column_pixels(8, 8, 40)   # Team
-    ranking_worksheet.set_column_pixels(9, 9, 90)  # Teleop pts
-    ranking_worksheet.set_column_pixels(10, 10, 10)  # Gap
-    ranking_worksheet.set_column_pixels(11, 11, 40)  # Team
-    ranking_worksheet.set_column_pixels(12, 12, 85)    # Climb
-    ranking_worksheet.set_column_pixels(13, 13, 10)  # Gap
-    ranking_worksheet.set_column_pixels(14, 14, 40)  # Team
-    ranking_worksheet.set_column_pixels(15, 15, 60)  # Defense
-
-    # Add ranking numbers to the rank sheet
-    for i, team_num in enumerate(team_num_list):
-        ranking_worksheet.write(i + 1, 0, i + 1)
+def merge_parsed_chunks(parsed_chunks, team_data, match_table, seen_keys, field_decoder,
+                        slot_reconciler=None):
+    # Add the chunks from parse_input_in_parallel() to the match table and team_data in file
+    # order, so that (just like group_match_entries()) only the first entry for each team
+    # in each match is kept, and add their rejected values to field_decoder. With a
+    # slot_reconciler, every entry for the same team in the same match is combined instead.
+    # Returns the number of entries that were kept.
+    num_previous_entries = len(match_table)
 
-    # List all teams by average match contribution
-    for i, (team_num, pts) in enumerate(all_team_avg_match_contribution):
-        if team_num in top_teams_across_categories:
-            for top_team_num, j in top_teams_across_categories.items():
-                if team_num == top_team_num:
-                    ranking_worksheet.write(
-                        i + 1, 2, team_num, team_labeling_formats[j])
-        else:
-            ranking_worksheet.write(i + 1, 2, team_num)
-        ranking_worksheet.write(i + 1, 3, pts, one_decimal_format)
-
-    # List all teams by average auto points
-    for i, (team_num, pts) in enumerate(all_team_avg_auto):
-        if team_num in top_teams_across_categories:
-            for top_team_num, j in top_teams_across_categories.items():
-                if team_num == top_team_num:
-                    ranking_worksheet.write(
-                        i + 1, 5, team_num, team_labeling_formats[j])
-        else:
-            ranking_worksheet.write(i + 1, 5, team_num)
-        ranking_worksheet.write(i + 1, 6, pts, one_decimal_format)
-
-    # List all teams by average teleop points
-    for i, (team_num, pts) in enumerate(all_team_avg_tele):
-        if team_num in top_teams_across_categories:
-            for top_team_num, j in top_teams_across_categories.items():
-                if team_num == top_team_num:
-                    ranking_worksheet.write(
-                        i + 1, 8, team_num, team_labeling_formats[j])
-        else:
-            ranking_worksheet.write(i + 1, 8, team_num)
-        ranking_worksheet.write(i + 1, 9, pts, one_decimal_format)
-
-    # List all teams by average climb points
-    for i, (team_num, pts) in enumerate(all_team_avg_climb):
-        if team_num in top_teams_across_categories:
-            for top_team_num, j in top_teams_across_categories.items():
-                if team_num == top_team_num:
-                    ranking_worksheet.write(
-                        i + 1, 11, team_num, team_labeling_formats[j])
-        else:
-            ranking_worksheet.write(i + 1, 11, team_num)
-        ranking_worksheet.write(i + 1, 12, pts, one_decimal_format)
-
-    # List all teams by defense percentage
-    for i, (team_num, pts) in enumerate(all_team_defense_percent):
-        if team_num in top_teams_across_categories:
-            for top_team_num, j in top_teams_across_categories.items():
-                if team_num == top_team_num:
-                    ranking_worksheet.write(
-                        i + 1, 14, team_num, team_labeling_formats[j])
+    for parsed_chunk in parsed_chunks:
+        chunk_match_table = MatchTable.from_arrays(parsed_chunk["match_table_arrays"])
+
+        first_row_num = parsed_chunk["first_row_num"]
+        field_decoder.rejected_values.extend(
+            (first_row_num + row_num, column_index, field_name, text, reason)
+            for row_num, column_index, field_name, text, reason
+            in parsed_chunk["rejected_values"])
+        field_decoder.num_rows += parsed_chunk["num_rows"]
+        field_decoder.num_rejected_rows += parsed_chunk["num_rejected_rows"]
+
+        if slot_reconciler is not None:
+            slot_reconciler.add_entries(chunk_match_table.entries())
+            continue
+
+        kept_rows = []
+        chunk_team_match_keys = zip(
+            chunk_match_table.column("team_num").tolist(),
+            chunk_match_table.column("qual_match_num").tolist())
+        for row, (team_num, qual_match_num) in enumerate(chunk_team_match_keys):
+            if seen_keys.add_if_new(team_num, qual_match_num):
+                kept_rows.append(row)
+        match_table.extend(chunk_match_table, np.array(kept_rows, dtype=np.int64))
+
+    if slot_reconciler is not None:
+        return group_match_entries(
+            slot_reconciler.reconcile(), team_data, match_table, seen_keys)
+
+    group_match_table(match_table, team_data, seen_keys, first_row=num_previous_entries)
+
+    return len(match_table) - num_previous_entries
+
+
+def reject_unexpected_value(text):
+    # Used for the columns where every allowed value is already in the column's dict, so
+    # anything that isn't in the dict is a mistake
+    raise ValueError("not one of the expected choices")
+
+
+# How to turn each input column into a number:
+# (field name, column index, dict of already known values, function for any other value)
+# The dicts are copied into each FieldDecoder, and every new value that gets decoded is
+# added to its copy so that it only has to be decoded once.
+input_field_schema = [
+    ("team_num", 3, {}, parse_team_number),
+    ("qual_match_num", 4, {}, parse_match_number),
+    ("successfully_completed_taxi", 5, taxi_completed_dict, reject_unexpected_value),
+    ("auto_cargo_scored_upper", 6, {}, get_max_value_from_comma_separated_numbers),
+    ("auto_cargo_scored_lower", 7, {}, get_max_value_from_comma_separated_numbers),
+    ("tele_cargo_scored_upper", 8, {}, get_max_value_from_comma_separated_numbers),
+    ("tele_cargo_scored_lower", 9, {}, get_max_value_from_comma_separated_numbers),
+    ("hangar_level", 10, hangar_level_points_dict, reject_unexpected_value),
+    ("defense_level", 11, defense_level_as_percentage_dict, reject_unexpected_value),
+]
+OTHER_INFO_COLUMN = 12
+
+
+def check_value_range(field_name, value):
+    # Every whole number column of the match table has a limited range (e.g. a cargo count
+    # has to fit in 16 bits), so a mistyped value like 99999 is rejected here instead of
+    # stopping the run when it's added to the table
+    dtype = MatchTable.int_column_dtypes.get(field_name)
+    if dtype is not None and not np.iinfo(dtype).min <= value <= np.iinfo(dtype).max:
+        raise ValueError(f"out of range (has to be from {np.iinfo(dtype).min} to "
+                         f"{np.iinfo(dtype).max})")
+
+
+class FieldDecoder:
+    """Class to turn input rows into match entries, keeping track of rejected values"""
+
+    def __init__(self):
+        # Every column only has a small number of different values over a whole event
+        # (cargo counts, rung names, etc.), so each value is decoded once and remembered
+        self.decoded_values = {
+            field_name: dict(known_values)
+            for field_name, _, known_values, _ in input_field_schema}
+
+        # One (row number, column index, field name, value, reason) tuple per bad value
+        self.rejected_values = []
+        self.num_rows = 0
+        self.num_rejected_rows = 0
+
+    def decode_row(self, row_num, row_data):
+        # Returns the match entry for a row, or None if any of its values couldn't be
+        # decoded (those values are added to rejected_values instead of stopping the run)
+        decoded_fields = {}
+        num_previous_rejects = len(self.rejected_values)
+        self.num_rows += 1
+
+        for field_name, column_index, _, decode_value in input_field_schema:
+            if column_index >= len(row_data):
+                self.rejected_values.append(
+                    (row_num, column_index, field_name, "", "column is missing"))
+                continue
+
+            text = row_data[column_index]
+            field_values = self.decoded_values[field_name]
+
+            try:
+                decoded_fields[field_name] = field_values[text]
+            except KeyError:
+                try:
+                    decoded_value = decode_value(text)
+                    check_value_range(field_name, decoded_value)
+                except (ValueError, OverflowError) as error:
+                    self.rejected_values.append(
+                        (row_num, column_index, field_name, text, str(error)))
+                    continue
+
+                field_values[text] = decoded_value
+                decoded_fields[field_name] = decoded_value
+
+        if len(self.rejected_values) > num_previous_rejects:
+            self.num_rejected_rows += 1
+            return None
+
+        # Older exports sometimes leave off the empty notes column at the end. Notes like ""
+        # or "good" show up over and over, so every copy shares one string.
+        if OTHER_INFO_COLUMN < len(row_data):
+            decoded_fields["other_info"] = sys.intern(row_data[OTHER_INFO_COLUMN])
         else:
-            ranking_worksheet.write(i + 1, 14, team_num)
-        ranking_worksheet.write(i + 1, 15, pts, percent_format)
-
-    # Add rank numbers back into each team's worksheet
-    for single_team_worksheet in output_worksheets:
-        for team_num in team_num_list:
-            if str(team_num) == single_team_worksheet.name:
-                # Write all of the ranked category titles to the sheet
-                single_team_worksheet.write(22, 0, "Ranked Category")
-                single_team_worksheet.write(22, 1, "Rank")
-                single_team_worksheet.write(23, 0, "Avg. Match Points")
-                single_team_worksheet.write(24, 0, "Avg. Auto Points")
-                single_team_worksheet.write(25, 0, "Avg. Teleop Points")
-                single_team_worksheet.write(26, 0, "Avg. Climb Points")
-                single_team_worksheet.write(27, 0, "Amount of Defense")
-
-                # Write the rank from each category to the sheet
-
-                # Avg total match points
-                for i, (avg_match_contrib_team_num, avg_match_contrib) in enumerate(all_team_avg_match_contribution):
-                    if team_num == avg_match_contrib_team_num:
-                        single_team_worksheet.write(23, 1, i + 1)
-                # Auto
-                for i, (avg_auto_team_num, avg_auto_pts) in enumerate(all_team_avg_auto):
-                    if team_num == avg_auto_team_num:
-                        single_team_worksheet.write(24, 1, i + 1)
-                # Teleop
-                for i, (avg_tele_team_num, avg_tele_pts) in enumerate(all_team_avg_tele):
-                    if team_num == avg_tele_team_num:
-                        single_team_worksheet.write(25, 1, i + 1)
-                # Climb
-                for i, (avg_climb_team_num, avg_climb_pts) in enumerate(all_team_avg_climb):
-                    if team_num == avg_climb_team_num:
-                        single_team_worksheet.write(26, 1, i + 1)
-                # Defense
-                for i, (percent_defense_team_num, percent_defense) in enumerate(all_team_defense_percent):
-                    if team_num == percent_defense_team_num:
-                        single_team_worksheet.write(27, 1, i + 1)
-
-
-print("\n> Successfully Created Output Workbook\n")
+            decoded_fields["other_info"] = ""
+
+        return SingleTeamSingleMatchEntry(**decoded_fields)
+
+
+def write_reject_report(file_name, field_decoder, append=False):
+    # Save every value that couldn't be decoded to a csv so it can be fixed by hand. With
+    # append=True (when only new rows were read), the rejects are added to the end of the
+    # existing report. Otherwise, if nothing was rejected, any old report is removed.
+    if not append and not field_decoder.rejected_values:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        return
+    if not field_decoder.rejected_values:
+        return
+
+    write_column_titles = not append or not os.path.exists(file_name)
+    with open(file_name, "a" if append else "w", newline="") as reject_report_file:
+        reject_report_writer = csv.writer(reject_report_file)
+        if write_column_titles:
+            reject_report_writer.writerow(
+                ["Row Number", "Column", "Field", "Value", "Reason"])
+
+        for row_num, column_index, field_name, text, reason in field_decoder.rejected_values:
+            # Row and column numbers are written the way they show up in excel
+            reject_report_writer.writerow(
+                [row_num + 1, column_index + 1, field_name, text, reason])
+
+    print(f"Rejected {field_decoder.num_rejected_rows} Rows, see {file_name}")
+
+
+def parse_rows(numbered_rows, field_decoder=None):
+    # Put all of the information from a single row in excel into a python object to make
+    # it easier to deal with later on. Rows with values that can't be decoded are left out.
+    if field_decoder is None:
+        field_decoder = FieldDecoder()
+
+    for row_num, row_data in numbered_rows:
+        match_entry = field_decoder.decode_row(row_num, row_data)
+        if match_entry is not None:
+            yield match_entry
+
+
+def drop_invalid_entries(match_entries):
+    # If the team num is -1 (due to an input error), the entry can't be used
+    for match_entry in match_entries:
+        if match_entry.team_num != -1:
+            yield match_entry
+
+
+def combine_by_median(values):
+    # The consensus is the middle value (the lower of the two middle values if there's an
+    # even number, so it's always a value a scout actually recorded), and the disagreement
+    # is how far apart the highest and lowest values are
+    return statistics.median_low(values), max(values) - min(values)
+
+
+def combine_by_majority_vote(values):
+    # The consensus is the most common value (the one recorded first if there's a tie), and
+    # the disagreement is the fraction of scouts that recorded something else
+    consensus_value, num_votes = collections.Counter(values).most_common(1)[0]
+    return consensus_value, 1 - num_votes / len(values)
+
+
+def combine_notes(values):
+    # Every different note is kept, in the order they were recorded
+    notes = [note for note in dict.fromkeys(values) if note != ""]
+    return sys.intern(" | ".join(notes)), 0
+
+
+# How the entries for the same team in the same match are combined into one:
+# (field name, function that returns the consensus value and how much the values disagree,
+# the most disagreement allowed before the match gets flagged, or None to never flag it)
+reconciliation_rules = [
+    ("successfully_completed_taxi", combine_by_majority_vote, 0.4),
+    ("auto_cargo_scored_upper", combine_by_median, 2),
+    ("auto_cargo_scored_lower", combine_by_median, 2),
+    ("tele_cargo_scored_upper", combine_by_median, 3),
+    ("tele_cargo_scored_lower", combine_by_median, 3),
+    ("hangar_level", combine_by_majority_vote, 0.4),
+    ("defense_level", combine_by_majority_vote, 0.4),
+    ("other_info", combine_notes, None),
+]
+
+
+class MatchSlotReconciler:
+    """Class to combine every entry for the same team in the same match (e.g. when two
+    scouts watch the same robot) into one consensus entry, and to keep track of the matches
+    where the scouts disagreed too much"""
+
+    def __init__(self, rules=None):
+        self.rules = reconciliation_rules if rules is None else rules
+
+        # Every entry for each (team number, match number), in the order each one was first
+        # seen
+        self.slot_entries = {}
+
+        # One (team number, match number, field name, values, consensus value) tuple per
+        # value that was flagged
+        self.disagreements = []
+        self.num_reconciled_slots = 0
+        self.num_flagged_slots = 0
+
+    def add_entries(self, match_entries):
+        for match_entry in match_entries:
+            team_match_key = (match_entry.team_num, match_entry.qual_match_num)
+            if team_match_key in self.slot_entries:
+                self.slot_entries[team_match_key].append(match_entry)
+            else:
+                self.slot_entries[team_match_key] = [match_entry]
+
+    def reconcile(self):
+        # Hand out one entry per team per match, in the order they were first seen. Entries
+        # that only one scout recorded are handed out as they are.
+        for slot_entries in self.slot_entries.values():
+            if len(slot_entries) == 1:
+                yield slot_entries[0]
+            else:
+                yield self.reconcile_slot(slot_entries)
+
+        self.slot_entries = {}
+
+    def reconcile_entries(self, match_entries):
+        # Every entry has to be seen before any slot can be reconciled, so this waits for
+        # match_entries to run out before handing out the first entry
+        self.add_entries(match_entries)
+        yield from self.reconcile()
+
+    def reconcile_slot(self, slot_entries):
+        team_num = slot_entries[0].team_num
+        qual_match_num = slot_entries[0].qual_match_num
+        consensus_fields = {"team_num": team_num, "qual_match_num": qual_match_num}
+        num_previous_disagreements = len(self.disagreements)
+
+        for field_name, combine_values, max_disagreement in self.rules:
+            values = [getattr(match_entry, field_name) for match_entry in slot_entries]
+            consensus_value, disagreement = combine_values(values)
+            consensus_fields[field_name] = consensus_value
+
+            if max_disagreement is not None and disagreement > max_disagreement:
+                self.disagreements.append(
+                    (team_num, qual_match_num, field_name, values, consensus_value))
+
+        self.num_reconciled_slots += 1
+        if len(self.disagreements) > num_previous_disagreements:
+            self.num_flagged_slots += 1
+
+        return SingleTeamSingleMatchEntry(**consensus_fields)
+
+
+def write_disagreement_report(file_name, slot_reconciler):
+    # Save every flagged value to a csv so the scouts can take another look at the match.
+    # If nothing was flagged, any old report is removed.
+    if not slot_reconciler.disagreements:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        return
+
+    with open(file_name, "w", newline="") as disagreement_report_file:
+        disagreement_report_writer = csv.writer(disagreement_report_file)
+        disagreement_report_writer.writerow(
+            ["Team", "Match", "Field", "Recorded Values", "Consensus"])
+
+        for team_num, qual_match_num, field_name, values, consensus_value in \
+                slot_reconciler.disagreements:
+            disagreement_report_writer.writerow([
+                team_num,
+                qual_match_num,
+                field_name,
+                ", ".join(str(value) for value in values),
+                consensus_value])
+
+    print(f"Flagged {slot_reconciler.num_flagged_slots} of "
+          f"{slot_reconciler.num_reconciled_slots} Team Matches Scouted More Than Once, see "
+          f"{file_name}")
+
+
+def get_or_create_team_data(team_data, team_num):
+    # Check if a class for all of a team's matches has been created yet (the TeamData
+    # class). If not, create it and add it to the team_data dict keyed by team number.
+    if team_num not in team_data:
+        new_single_team_data = TeamData()
+        new_single_team_data.team_num = team_num
+
+        team_data[team_num] = new_single_team_data
+
+    return team_data[team_num]
+
+
+def rebuild_recent_form(team_data, team_nums):
+    # Make the recent form of each of these teams again from all of its matches, for teams
+    # that got a match from before one that had already been added (see
+    # RecentFormAccumulator.add_match())
+    for team_num in team_nums:
+        single_teams_data = team_data[team_num]
+        single_teams_data.recent_form = RecentFormAccumulator.from_matches(
+            single_teams_data.get_match_entries())
+
+
+def group_match_entries(match_entries, team_data, match_table, seen_keys):
+    # Go through every match entry as it arrives and add it to its team's TeamData class
+    # and to the match table. Returns the number of entries that were kept.
+    num_kept_entries = 0
+    out_of_order_team_nums = set()
+
+    for match_entry in match_entries:
+        # If this team has already been recorded for this match, the entry is a duplicate
+        # and only the first one is kept
+        if not seen_keys.add_if_new(match_entry.team_num, match_entry.qual_match_num):
+            continue
+
+        single_teams_data = get_or_create_team_data(team_data, match_entry.team_num)
+        single_teams_data.match_table = match_table
+        single_teams_data.match_rows.append(len(match_table))
+        if not single_teams_data.recent_form.add_match(match_entry):
+            out_of_order_team_nums.add(match_entry.team_num)
+        match_table.append(match_entry)
+        num_kept_entries += 1
+
+    rebuild_recent_form(team_data, out_of_order_team_nums)
+
+    return num_kept_entries
+
+
+def group_match_table(match_table, team_data, seen_keys, first_row=0):
+    # Fill in team_data and seen_keys from a match table that has already been grouped
+    # (e.g. one loaded from the cache). Only the rows from first_row on are added.
+    out_of_order_team_nums = set()
+    for row, match_entry in enumerate(match_table.entries(first_row), first_row):
+        seen_keys.add_if_new(match_entry.team_num, match_entry.qual_match_num)
+        single_teams_data = get_or_create_team_data(team_data, match_entry.team_num)
+        single_teams_data.match_table = match_table
+        single_teams_data.match_rows.append(row)
+        if not single_teams_data.recent_form.add_match(match_entry):
+            out_of_order_team_nums.add(match_entry.team_num)
+
+    rebuild_recent_form(team_data, out_of_order_team_nums)
+
+
+def restore_grouped_match_table(match_table, team_data, seen_keys, team_states):
+    # Does the same job as group_match_table() for a match table loaded from a checkpoint,
+    # without going through its rows one at a time: every team's recent form and points
+    # distributions come from team_states (a dict of team number to the two of them, see
+    # load_checkpoint()), and its rows in the match table are found all at once
+    team_nums = match_table.column("team_num")
+    qual_match_nums = match_table.column("qual_match_num")
+
+    # Sorting the row numbers by team (keeping them in order within each team) puts every
+    # team's rows next to each other
+    sorted_rows = np.argsort(team_nums, kind="stable")
+    unique_team_nums, team_starts = np.unique(team_nums[sorted_rows], return_index=True)
+    for team_num, team_rows in zip(
+            unique_team_nums.tolist(), np.split(sorted_rows, team_starts[1:])):
+        single_teams_data = get_or_create_team_data(team_data, team_num)
+        single_teams_data.match_table = match_table
+        single_teams_data.match_rows = array.array("q", team_rows.astype(np.int64).tobytes())
+        seen_keys.add_team_matches(team_num, qual_match_nums[team_rows].tolist())
+        single_teams_data.recent_form, single_teams_data.distributions = \
+            team_states[team_num]
+
+
+def merge_team_totals(first_team_totals, second_team_totals):
+    # Add two sets of per-team totals (in the format returned by MatchTable.team_totals)
+    # together. Only the teams in the second set need to be touched, so this takes time
+    # proportional to the number of teams rather than the number of matches.
+    first_team_nums, first_match_counts, first_column_totals = first_team_totals
+    second_team_nums, second_match_counts, second_column_totals = second_team_totals
+
+    team_nums = np.union1d(first_team_nums, second_team_nums)
+    first_index = np.searchsorted(team_nums, first_team_nums)
+    second_index = np.searchsorted(team_nums, second_team_nums)
+
+    match_counts = np.zeros(len(team_nums), dtype=np.int64)
+    match_counts[first_index] += first_match_counts
+    match_counts[second_index] += second_match_counts
+
+    column_totals = {}
+    for name, first_totals in first_column_totals.items():
+        column_totals[name] = np.zeros(len(team_nums))
+        column_totals[name][first_index] += first_totals
+        column_totals[name][second_index] += second_column_totals[name]
+
+    return team_nums, match_counts, column_totals
+
+
+def select_team_totals(team_totals, selected_team_nums):
+    # Pick out just the selected teams from a set of per-team totals (in the format returned
+    # by MatchTable.team_totals). Every selected team has to be in team_totals.
+    team_nums, match_counts, column_totals = team_totals
+    selected_index = np.searchsorted(team_nums, selected_team_nums)
+
+    return (
+        team_nums[selected_index],
+        match_counts[selected_index],
+        {name: totals[selected_index] for name, totals in column_totals.items()})
+
+
+def update_team_averages(team_data, team_totals):
+    # Turn the per-team totals (in the format returned by MatchTable.team_totals) into the
+    # averages stored on each team's TeamData class
+    team_nums, match_counts, column_totals = team_totals
+
+    for i, team_num in enumerate(team_nums.tolist()):
+        single_teams_data = team_data[team_num]
+        current_match_count = match_counts[i]
+        single_teams_data.match_count = int(current_match_count)
+
+        team_avg_taxi_percent = float(
+            column_totals["successfully_completed_taxi"][i] / current_match_count)
+        single_teams_data.avg_auto_cargo_upper = float(
+            column_totals["auto_cargo_scored_upper"][i] / current_match_count)
+        single_teams_data.avg_auto_cargo_lower = float(
+            column_totals["auto_cargo_scored_lower"][i] / current_match_count)
+        single_teams_data.avg_tele_cargo_upper = float(
+            column_totals["tele_cargo_scored_upper"][i] / current_match_count)
+        single_teams_data.avg_tele_cargo_lower = float(
+            column_totals["tele_cargo_scored_lower"][i] / current_match_count)
+
+        # Update general team statistics based on these averages
+        single_teams_data.taxi_percent = team_avg_taxi_percent
+        single_teams_data.avg_auto_points = 2 * team_avg_taxi_percent + \
+            2 * single_teams_data.avg_auto_cargo_lower + \
+            4 * single_teams_data.avg_auto_cargo_upper
+        single_teams_data.avg_tele_points = single_teams_data.avg_tele_cargo_lower + \
+            2 * single_teams_data.avg_tele_cargo_upper
+        single_teams_data.avg_defense_equivalent = float(
+            column_totals["defense_level"][i] / current_match_count)
+        single_teams_data.avg_climb_points = float(
+            column_totals["hangar_level"][i] / current_match_count)
+
+
+# The per-match points categories that get distribution statistics (in the same order as
+# get_category_points(), without defense), and the quantile that each statistic is (None if
+# it isn't one). Consistency goes from 1 (the same points every match) down to 0 (a standard
+# deviation as big as the average, or more).
+distribution_category_names = ("match_contribution", "auto", "tele", "climb")
+distribution_stat_quantiles = {
+    "median": 0.5,
+    "std": None,
+    "p10": 0.1,
+    "p90": 0.9,
+    "min": 0.0,
+    "max": 1.0,
+    "consistency": None,
+}
+
+
+def compute_team_distributions(match_table, rows=slice(None)):
+    # Work out the median, standard deviation, 10th/90th percentiles, min and max of every
+    # team's points per match in each category, for every team at once. "rows" can pick
+    # which rows of the table count (all of them by default). Returns the sorted team
+    # numbers and a dict of category name to a dict of statistic name to an array of
+    # per-team values (in the same order as the team numbers).
+    team_nums, team_index = np.unique(
+        match_table.column("team_num")[rows], return_inverse=True)
+    match_counts = np.bincount(team_index, minlength=len(team_nums))
+
+    # Every team's matches are next to each other once sorted by team, so each team's
+    # quantiles can be picked out of its own part of the sorted values by position (the same
+    # way np.quantile does for one team, going part of the way between the two closest
+    # values). The positions are worked out within each team's part first, so a team's
+    # quantiles come out exactly the same no matter which other teams' rows are included.
+    team_starts = np.cumsum(match_counts) - match_counts
+    quantile_names = [
+        name for name, quantile in distribution_stat_quantiles.items() if quantile is not None]
+    quantiles = np.array([distribution_stat_quantiles[name] for name in quantile_names])
+    team_positions = quantiles[None, :] * (match_counts - 1)[:, None]
+    lower_team_positions = np.floor(team_positions)
+    fractions = team_positions - lower_team_positions
+    lower_positions = team_starts[:, None] + lower_team_positions.astype(np.int64)
+    upper_positions = team_starts[:, None] + np.ceil(team_positions).astype(np.int64)
+
+    match_points = get_category_points({
+        name: match_table.column(name)[rows].astype(np.float64)
+        for name in MatchTable.int_column_names[2:] + MatchTable.float_column_names})
+
+    category_stats = {}
+    for category_name, points in zip(distribution_category_names, match_points):
+        sorted_points = points[np.lexsort((points, team_index))]
+        quantile_values = sorted_points[lower_positions] + fractions * (
+            sorted_points[upper_positions] - sorted_points[lower_positions])
+
+        # Standard deviation of all of a team's matches (not just a sample of them)
+        means = np.bincount(team_index, weights=points, minlength=len(team_nums)) / \
+            match_counts
+        mean_squares = np.bincount(
+            team_index, weights=points * points, minlength=len(team_nums)) / match_counts
+
+        stat_values = {
+            name: quantile_values[:, i] for i, name in enumerate(quantile_names)}
+        stds = np.sqrt(np.maximum(mean_squares - means * means, 0))
+        stat_values["std"] = stds
+        stat_values["consistency"] = np.where(
+            means > 0, np.clip(1 - stds / np.where(means > 0, means, 1), 0, 1), 0)
+
+        # Always in the same order as distribution_stat_quantiles (which is also the order
+        # they're loaded back from a checkpoint in)
+        category_stats[category_name] = {
+            name: stat_values[name] for name in distribution_stat_quantiles}
+
+    return team_nums, category_stats
+
+
+def update_team_distributions(team_data, match_table, rows=slice(None)):
+    # Store the statistics from compute_team_distributions() on each team's TeamData class as
+    # a dict of category name to a dict of statistic name to value. Only the teams in the
+    # chosen rows are updated, so "rows" has to include every row of each of those teams.
+    team_nums, category_stats = compute_team_distributions(match_table, rows)
+
+    category_stat_lists = {
+        category_name: {name: values.tolist() for name, values in stats.items()}
+        for category_name, stats in category_stats.items()}
+    for i, team_num in enumerate(team_nums.tolist()):
+        team_data[team_num].distributions = {
+            category_name: {
+                name: stat_list[i] for name, stat_list in stat_lists.items()}
+            for category_name, stat_lists in category_stat_lists.items()}
+
+
+def read_schedule(file_name):
+    # Read the qualification match schedule. Every row after the column titles has the
+    # match number, the three red teams, the three blue teams and optionally the official
+    # red and blue scores. Team numbers can be written like "254" or "frc254". Returns a
+    # list of (match number, red teams, blue teams, red score, blue score) with None for
+    # missing scores.
+    schedule = []
+    with open(file_name, newline="") as schedule_file:
+        for row_num, row_data in enumerate(csv.reader(schedule_file)):
+            if row_num == 0 or not row_data:
+                continue
+
+            try:
+                match_num = parse_match_number(row_data[0])
+                alliance_team_nums = [
+                    parse_team_number(team.strip().lower().removeprefix("frc"))
+                    for team in row_data[1:1 + 2 * TEAMS_PER_ALLIANCE]]
+                official_scores = [
+                    float(score) if score.strip() != "" else None
+                    for score in row_data[7:9]]
+            except (ValueError, OverflowError):
+                print(f"Skipping Schedule Row Number {row_num + 1} (Unreadable)")
+                continue
+
+            if len(alliance_team_nums) != 2 * TEAMS_PER_ALLIANCE or -1 in alliance_team_nums:
+                print(f"Skipping Schedule Row Number {row_num + 1} (Missing Teams)")
+                continue
+
+            official_scores += [None] * (2 - len(official_scores))
+            schedule.append((
+                match_num,
+                tuple(alliance_team_nums[:TEAMS_PER_ALLIANCE]),
+                tuple(alliance_team_nums[TEAMS_PER_ALLIANCE:]),
+                official_scores[0],
+                official_scores[1]))
+
+    return schedule
+
+
+def get_scouted_match_points(match_table, rows=slice(None)):
+    # Each scouted entry's match points (for just the given rows of match_table), keyed by
+    # (team number, match number)
+    entry_match_points = get_category_points(
+        {name: match_table.column(name)[rows].astype(np.float64)
+         for name in RecentFormAccumulator.column_names})[0]
+    return dict(zip(
+        zip(match_table.column("team_num")[rows].tolist(),
+            match_table.column("qual_match_num")[rows].tolist()),
+        entry_match_points.tolist()))
+
+
+def compute_power_ratings(team_data, match_table, schedule, solver=None,
+                          scouted_match_points=None):
+    # Fill in the OPR, DPR and CCWM of every team in team_data from the matches in the
+    # schedule. An alliance's score is its official score from the schedule if there is
+    # one, otherwise the total scouted points of its three teams (so every team on both
+    # alliances has to have been scouted in that match). Pass in the solver returned by an
+    # earlier call to only add the matches that weren't ready last time, and the
+    # scouted_match_points (from get_scouted_match_points()) that are kept up to date as
+    # rows come in, so the whole match table doesn't have to be gone through again.
+    # Returns the solver.
+    if solver is None:
+        solver = PowerRatingSolver()
+    if scouted_match_points is None:
+        scouted_match_points = get_scouted_match_points(match_table)
+
+    for match_num, red_teams, blue_teams, red_score, blue_score in schedule:
+        if match_num in solver.added_match_nums:
+            continue
+
+        alliance_scores = []
+        for team_nums, official_score in ((red_teams, red_score), (blue_teams, blue_score)):
+            if official_score is not None:
+                alliance_scores.append(official_score)
+            elif all((team_num, match_num) in scouted_match_points for team_num in team_nums):
+                alliance_scores.append(sum(
+                    scouted_match_points[(team_num, match_num)] for team_num in team_nums))
+
+        if len(alliance_scores) == 2:
+            solver.add_match(match_num, red_teams, blue_teams, *alliance_scores)
+
+    if not solver.team_nums:
+        return solver
+
+    for team_num, (opr, dpr, ccwm) in solver.solve().items():
+        if team_num in team_data:
+            single_teams_data = team_data[team_num]
+            single_teams_data.opr = opr
+            single_teams_data.dpr = dpr
+            single_teams_data.ccwm = ccwm
+
+    return solver
+
+
+def get_file_fingerprint(file_name, num_bytes):
+    # Hash the first num_bytes of a file. If the hash still matches on a later run, the
+    # file has only been added to since then.
+    file_hash = hashlib.sha256()
+
+    with open(file_name, "rb") as binary_file:
+        bytes_left = num_bytes
+        while bytes_left > 0:
+            chunk = binary_file.read(min(bytes_left, 1 << 20))
+            if not chunk:
+                break
+            file_hash.update(chunk)
+            bytes_left -= len(chunk)
+
+    return file_hash.hexdigest()
+
+
+def save_checkpoint(file_name, match_table, team_totals, read_progress, input_fingerprint,
+                    team_data):
+    # Save everything needed to pick up where this run left off: the grouped match table,
+    # the per-team running totals, every team's recent form and points distributions (which
+    # can't be worked out from the totals), how far into the input file this run got, and
+    # a fingerprint of the part of the input file that has been read (from
+    # get_file_fingerprint())
+    team_nums, match_counts, column_totals = team_totals
+
+    checkpoint_arrays = match_table.to_arrays()
+    checkpoint_arrays["schema_version"] = np.array(PARSED_DATA_SCHEMA_VERSION)
+    checkpoint_arrays["byte_offset"] = np.array(read_progress["byte_offset"])
+    checkpoint_arrays["row_count"] = np.array(read_progress["row_count"])
+    checkpoint_arrays["input_fingerprint"] = np.array(input_fingerprint)
+    checkpoint_arrays["totals_team_nums"] = team_nums
+    checkpoint_arrays["totals_match_counts"] = match_counts
+    for name, totals in column_totals.items():
+        checkpoint_arrays[f"totals_{name}"] = totals
+    checkpoint_arrays.update(get_team_state_arrays(team_data))
+
+    # Write to a temporary file first so that a half-written checkpoint is never left
+    # behind if the script is stopped partway through
+    with open(file_name + ".tmp", "wb") as checkpoint_file:
+        np.savez(checkpoint_file, **checkpoint_arrays)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def load_checkpoint(file_name, input_file_name):
+    # Load a checkpoint saved by save_checkpoint(). Returns None if there is no checkpoint,
+    # if it was made by a different version of this script, or if the input file was
+    # rewritten (rather than just added to) since the checkpoint was saved.
+    if not os.path.exists(file_name):
+        return None
+
+    with np.load(file_name) as checkpoint_arrays:
+        if int(checkpoint_arrays["schema_version"]) != PARSED_DATA_SCHEMA_VERSION:
+            return None
+
+        read_progress = {
+            "byte_offset": int(checkpoint_arrays["byte_offset"]),
+            "row_count": int(checkpoint_arrays["row_count"]),
+        }
+        if os.path.getsize(input_file_name) < read_progress["byte_offset"]:
+            return None
+        if get_file_fingerprint(input_file_name, read_progress["byte_offset"]) != \
+                str(checkpoint_arrays["input_fingerprint"]):
+            return None
+
+        match_table = MatchTable.from_arrays(checkpoint_arrays)
+        team_totals = (
+            checkpoint_arrays["totals_team_nums"],
+            checkpoint_arrays["totals_match_counts"],
+            {name: checkpoint_arrays[f"totals_{name}"]
+             for name in MatchTable.int_column_names[2:] + MatchTable.float_column_names},
+        )
+        team_states = get_team_states(checkpoint_arrays)
+
+    return {
+        "match_table": match_table,
+        "team_totals": team_totals,
+        "read_progress": read_progress,
+        "team_states": team_states,
+    }
+
+
+def get_team_state_arrays(team_data):
+    # Put every team's recent form (see RecentFormAccumulator.get_state()) and points
+    # distributions into arrays with one row per team, for save_checkpoint(). Teams with
+    # fewer than RECENT_MATCH_WINDOW matches have their unused recent match rows left as nan.
+    team_nums = sorted(team_data)
+    num_columns = len(RecentFormAccumulator.column_names)
+    recent_matches = np.full((len(team_nums), RECENT_MATCH_WINDOW, num_columns), np.nan)
+    recent_totals = np.zeros((len(team_nums), num_columns))
+    weighted_averages = np.full((len(team_nums), num_columns), np.nan)
+    last_match_nums = np.full(len(team_nums), -1, dtype=np.int64)
+
+    for i, team_num in enumerate(team_nums):
+        (team_recent_matches, team_recent_totals, team_weighted_averages,
+         team_last_match_num) = team_data[team_num].recent_form.get_state()
+        if team_recent_matches:
+            recent_matches[i, :len(team_recent_matches)] = team_recent_matches
+        recent_totals[i] = team_recent_totals
+        if team_weighted_averages is not None:
+            weighted_averages[i] = team_weighted_averages
+        if team_last_match_num is not None:
+            last_match_nums[i] = team_last_match_num
+
+    team_state_arrays = {
+        "state_team_nums": np.array(team_nums, dtype=np.int64),
+        "state_recent_matches": recent_matches,
+        "state_recent_totals": recent_totals,
+        "state_weighted_averages": weighted_averages,
+        "state_last_match_nums": last_match_nums,
+    }
+    for category_name in distribution_category_names:
+        for name in distribution_stat_quantiles:
+            team_state_arrays[f"state_{category_name}_{name}"] = np.array(
+                [team_data[team_num].distributions[category_name][name]
+                 for team_num in team_nums],
+                dtype=np.float64)
+
+    return team_state_arrays
+
+
+def get_team_states(checkpoint_arrays):
+    # Turn the arrays from get_team_state_arrays() back into a dict of team number to its
+    # (recent form, points distributions). Every array is read out of the checkpoint once
+    # and turned into lists, rather than once per team.
+    recent_matches = checkpoint_arrays["state_recent_matches"].tolist()
+    recent_totals = checkpoint_arrays["state_recent_totals"].tolist()
+    weighted_averages = checkpoint_arrays["state_weighted_averages"].tolist()
+    last_match_nums = checkpoint_arrays["state_last_match_nums"].tolist()
+    distribution_lists = {
+        category_name: {
+            name: checkpoint_arrays[f"state_{category_name}_{name}"].tolist()
+            for name in distribution_stat_quantiles}
+        for category_name in distribution_category_names}
+
+    team_states = {}
+    for i, team_num in enumerate(checkpoint_arrays["state_team_nums"].tolist()):
+        recent_form = RecentFormAccumulator.from_state(
+            [match_values for match_values in recent_matches[i]
+             if not np.isnan(match_values[0])],
+            recent_totals[i],
+            None if np.isnan(weighted_averages[i][0]) else weighted_averages[i],
+            None if last_match_nums[i] < 0 else last_match_nums[i])
+        distributions = {
+            category_name: {name: stat_lists[name][i] for name in stat_lists}
+            for category_name, stat_lists in distribution_lists.items()}
+        team_states[team_num] = (recent_form, distributions)
+
+    return team_states
+
+
+def get_parsed_cache_entry_name(input_fingerprint):
+    # Cache entries are named after the fingerprint of the input file they were parsed
+    # from and the version of the parsed data format, so changes to either one can never
+    # pick up a stale entry
+    return os.path.join(
+        parsed_cache_directory_name,
+        f"{input_fingerprint}-v{PARSED_DATA_SCHEMA_VERSION}")
+
+
+def load_parsed_cache(input_fingerprint):
+    # Load the grouped match table parsed from an input file with this fingerprint by an
+    # earlier run. The columns are memory-mapped straight from the cache instead of being
+    # read into memory. Returns None if the file hasn't been parsed before.
+    cache_entry_name = get_parsed_cache_entry_name(input_fingerprint)
+    if not os.path.isdir(cache_entry_name):
+        return None
+
+    try:
+        cached_arrays = {
+            file_name[:-len(".npy")]: np.load(
+                os.path.join(cache_entry_name, file_name), mmap_mode="r")
+            for file_name in os.listdir(cache_entry_name)}
+        match_table = MatchTable.from_arrays(cached_arrays)
+        read_progress = {
+            "byte_offset": int(cached_arrays["byte_offset"]),
+            "row_count": int(cached_arrays["row_count"]),
+        }
+    except (OSError, ValueError, KeyError):
+        # A damaged cache entry is the same as not having one
+        return None
+
+    # Mark this entry as recently used so it is the last one to be evicted
+    os.utime(cache_entry_name)
+
+    return {
+        "match_table": match_table,
+        "read_progress": read_progress,
+    }
+
+
+def save_parsed_cache(input_fingerprint, match_table, read_progress):
+    # Save the grouped match table as one uncompressed .npy file per column so that it can
+    # be memory-mapped by load_parsed_cache() on later runs, then make room in the cache
+    cache_entry_name = get_parsed_cache_entry_name(input_fingerprint)
+    if os.path.isdir(cache_entry_name):
+        return
+
+    cache_arrays = match_table.to_arrays()
+    cache_arrays["byte_offset"] = np.array(read_progress["byte_offset"])
+    cache_arrays["row_count"] = np.array(read_progress["row_count"])
+
+    # Write to a temporary directory first so that a half-written entry is never left
+    # behind if the script is stopped partway through
+    temporary_entry_name = f"{cache_entry_name}.{os.getpid()}.tmp"
+    os.makedirs(temporary_entry_name, exist_ok=True)
+    for name, column_array in cache_arrays.items():
+        np.save(os.path.join(temporary_entry_name, f"{name}.npy"), column_array)
+
+    try:
+        os.rename(temporary_entry_name, cache_entry_name)
+    except OSError:
+        # Another run saved the same entry first
+        shutil.rmtree(temporary_entry_name, ignore_errors=True)
+
+    evict_parsed_cache_entries(PARSED_CACHE_MAX_BYTES)
+
+
+def evict_parsed_cache_entries(max_bytes):
+    # Delete the least recently used cache entries until the whole cache fits in max_bytes
+    cache_entries = []
+    for entry_name in os.listdir(parsed_cache_directory_name):
+        entry_path = os.path.join(parsed_cache_directory_name, entry_name)
+        if entry_name.endswith(".tmp") or not os.path.isdir(entry_path):
+            continue
+
+        # Another run might be deleting this entry at the same time
+        try:
+            entry_bytes = sum(
+                os.path.getsize(os.path.join(entry_path, file_name))
+                for file_name in os.listdir(entry_path))
+            cache_entries.append((os.path.getmtime(entry_path), entry_bytes, entry_path))
+        except OSError:
+            continue
+
+    total_bytes = sum(entry_bytes for (junk, entry_bytes, junk) in cache_entries)
+
+    for (junk, entry_bytes, entry_path) in sorted(cache_entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total_bytes -= entry_bytes
+
+
+######################
+# PROCESS INPUT DATA #
+######################
+
+
+def load_team_data(input_file_name, incremental=False, use_cache=False, profiler=None,
+                   reject_report_file_name=None,
+                   checkpoint_file_name=checkpoint_file_name, parse_processes=1,
+                   reconcile_duplicates=False,
+                   disagreement_report_file_name=None):
+    # Read the input csv and group it into a dict of team number to TeamData (with the
+    # averages filled in). Also returns the match table with every kept match entry. With
+    # parse_processes above 1, the input is split up and parsed by that many processes.
+    # With reconcile_duplicates, every entry for the same team in the same match is
+    # combined into one (instead of only keeping the first one), which needs the whole file
+    # at once, so it can't be used in incremental mode.
+    #
+    # Nothing is written to disk unless it's asked for: the parsed data is only saved to
+    # the cache with use_cache, the checkpoint only in incremental mode, and the reject and
+    # disagreement reports only when they're given a file name (main() turns all of these
+    # on for a normal run).
+    #
+    # Rows are streamed through one at a time, and each team's averages and recent form
+    # are kept as running totals. Memory still grows with the number of kept rows, but only
+    # by the match table's columns, each team's row numbers and each team's set of match
+    # numbers (for dropping duplicates): every team sheet lists every match, so the matches
+    # have to be kept somewhere.
+    if incremental and reconcile_duplicates:
+        raise ValueError("duplicate entries can't be reconciled in incremental mode")
+
+    if profiler is None:
+        profiler = PipelineProfiler()
+    field_decoder = FieldDecoder()
+    slot_reconciler = MatchSlotReconciler() if reconcile_duplicates else None
+
+    # Reconciled match tables are cached separately from ones where only the first entry
+    # was kept
+    parsed_cache_suffix = "-reconciled" if reconcile_duplicates else ""
+
+    match_table = MatchTable()
+    team_totals = None
+    read_progress = {"byte_offset": 0, "row_count": 0}
+    checkpoint = None
+    parsed_cache = None
+    team_data = {}
+    seen_team_match_keys = TeamMatchKeys()
+
+    # In incremental mode, start from where the last run left off if the input file has only
+    # been added to since then. Otherwise, start from the beginning of the file.
+    if incremental:
+        with profiler.phase("checkpoint_and_cache_loading"):
+            checkpoint = load_checkpoint(checkpoint_file_name, input_file_name)
+
+        if checkpoint is not None:
+            match_table = checkpoint["match_table"]
+            team_totals = checkpoint["team_totals"]
+            read_progress = checkpoint["read_progress"]
+            with profiler.phase("grouping"):
+                restore_grouped_match_table(
+                    match_table, team_data, seen_team_match_keys, checkpoint["team_states"])
+            print(f"Resuming from Row Number {read_progress['row_count'] + 1}")
+        else:
+            print("No usable checkpoint found, processing the whole input file")
+
+    # If this exact input file has been parsed before, load the parsed data from the cache
+    # instead of parsing it again
+    if checkpoint is None and use_cache:
+        with profiler.phase("checkpoint_and_cache_loading"):
+            input_file_size = os.path.getsize(input_file_name)
+            parsed_cache = load_parsed_cache(
+                get_file_fingerprint(input_file_name, input_file_size) + parsed_cache_suffix)
+
+        if parsed_cache is not None:
+            match_table = parsed_cache["match_table"]
+            read_progress = parsed_cache["read_progress"]
+            with profiler.phase("statistics"):
+                team_totals = match_table.team_totals()
+            with profiler.phase("grouping"):
+                group_match_table(match_table, team_data, seen_team_match_keys)
+            print(f"Loaded {len(match_table)} Match Entries from the Cache")
+
+    # Stream the input rows through each stage one at a time. Only the entries that are kept
+    # end up in the match table (stored column-by-column instead of one python object per
+    # row), so duplicates and bad rows never pile up in memory. When profiling, the time
+    # spent reading/parsing rows is counted separately from the time spent grouping them.
+    num_previous_entries = len(match_table)
+    if parse_processes > 1:
+        with profiler.phase("input_parsing"):
+            parsed_chunks = parse_input_in_parallel(
+                input_file_name,
+                read_progress,
+                parse_processes,
+                keep_duplicates=reconcile_duplicates)
+        with profiler.phase("grouping"):
+            num_kept_entries = merge_parsed_chunks(
+                parsed_chunks,
+                team_data,
+                match_table,
+                seen_team_match_keys,
+                field_decoder,
+                slot_reconciler)
+
+        profiler.add_count(
+            "rows_read", sum(parsed_chunk["num_rows"] for parsed_chunk in parsed_chunks))
+        profiler.add_count(
+            "valid_rows",
+            sum(parsed_chunk["num_valid_rows"] for parsed_chunk in parsed_chunks))
+    else:
+        with profiler.phase("grouping"):
+            match_entries = profiler.timed_items("input_parsing", profiler.counted_items(
+                "valid_rows",
+                drop_invalid_entries(parse_rows(
+                    profiler.counted_items(
+                        "rows_read", read_input_rows(input_file_name, read_progress)),
+                    field_decoder))))
+            if slot_reconciler is not None:
+                match_entries = profiler.timed_items(
+                    "reconciliation", slot_reconciler.reconcile_entries(match_entries))
+
+            num_kept_entries = group_match_entries(
+                match_entries, team_data, match_table, seen_team_match_keys)
+    print(f"Kept {num_kept_entries} New Match Entries for {len(team_data)} Teams")
+
+    # When the parsed data came from the cache (or nothing new was added since the last
+    # incremental run), no rows were decoded and the existing report is left alone
+    if field_decoder.num_rows > 0:
+        if reject_report_file_name is not None:
+            write_reject_report(
+                reject_report_file_name, field_decoder, append=checkpoint is not None)
+        if slot_reconciler is not None:
+            if disagreement_report_file_name is not None:
+                write_disagreement_report(disagreement_report_file_name, slot_reconciler)
+            profiler.add_count("slots_reconciled", slot_reconciler.num_reconciled_slots)
+            profiler.add_count("slots_flagged", slot_reconciler.num_flagged_slots)
+
+    profiler.add_count("rows_rejected", field_decoder.num_rejected_rows)
+    profiler.add_count(
+        "rows_skipped_invalid_team_num",
+        profiler.counters.get("rows_read", 0) - field_decoder.num_rejected_rows -
+        profiler.counters.get("valid_rows", 0))
+    profiler.add_count(
+        "duplicates_dropped",
+        profiler.counters.get("valid_rows", 0) - num_kept_entries)
+    profiler.add_count("match_entries_kept", num_kept_entries)
+
+    # Add up the totals for every team in one go from the new rows of the match table, then
+    # fold them into the running totals from the last run (if there were any)
+    with profiler.phase("statistics"):
+        new_team_totals = match_table.team_totals(
+            rows=slice(num_previous_entries, None))
+        if team_totals is None:
+            team_totals = new_team_totals
+        else:
+            team_totals = merge_team_totals(team_totals, new_team_totals)
+
+        # When picking up from a checkpoint, only the teams that got new rows need their
+        # distributions worked out again (the rest came from the checkpoint)
+        update_team_averages(team_data, team_totals)
+        if checkpoint is None:
+            update_team_distributions(team_data, match_table)
+        elif num_kept_entries > 0:
+            update_team_distributions(
+                team_data,
+                match_table,
+                rows=np.isin(match_table.column("team_num"), new_team_totals[0]))
+
+    with profiler.phase("checkpoint_and_cache_saving"):
+        if incremental or use_cache:
+            input_fingerprint = get_file_fingerprint(
+                input_file_name, read_progress["byte_offset"])
+
+        if incremental:
+            save_checkpoint(
+                checkpoint_file_name,
+                match_table,
+                team_totals,
+                read_progress,
+                input_fingerprint,
+                team_data)
+
+        if use_cache and (parsed_cache is None or num_kept_entries > 0):
+            save_parsed_cache(
+                input_fingerprint + parsed_cache_suffix, match_table, read_progress)
+
+    profiler.add_count("teams", len(team_data))
+
+    return team_data, match_table
+
+
+def aggregate_team_data(match_table):
+    # Group an already loaded match table (e.g. from load_team_data(), or one built up by
+    # hand with MatchTable.append()) into a dict of team number to TeamData with the
+    # averages filled in
+    team_data = {}
+    group_match_table(match_table, team_data, TeamMatchKeys())
+    update_team_averages(team_data, match_table.team_totals())
+    update_team_distributions(team_data, match_table)
+
+    return team_data
+
+
+###############
+# MATCH STORE #
+###############
+
+# Every match entry from every event that has been saved to the store, tagged with its
+# event and season. The views average them the same way update_team_averages() does.
+match_store_schema = """
+CREATE TABLE IF NOT EXISTS match_entries (
+    season TEXT NOT NULL,
+    event TEXT NOT NULL,
+    team_num INTEGER NOT NULL,
+    qual_match_num INTEGER NOT NULL,
+    successfully_completed_taxi REAL NOT NULL,
+    auto_cargo_scored_upper INTEGER NOT NULL,
+    auto_cargo_scored_lower INTEGER NOT NULL,
+    tele_cargo_scored_upper INTEGER NOT NULL,
+    tele_cargo_scored_lower INTEGER NOT NULL,
+    hangar_level INTEGER NOT NULL,
+    defense_level REAL NOT NULL,
+    other_info TEXT NOT NULL,
+    PRIMARY KEY (season, event, team_num, qual_match_num)
+);
+
+CREATE INDEX IF NOT EXISTS match_entries_by_team
+    ON match_entries (team_num, event, qual_match_num);
+
+CREATE INDEX IF NOT EXISTS match_entries_by_season
+    ON match_entries (season, team_num);
+
+CREATE VIEW IF NOT EXISTS team_event_averages AS
+SELECT
+    season,
+    event,
+    team_num,
+    COUNT(*) AS match_count,
+    AVG(successfully_completed_taxi) AS taxi_percent,
+    AVG(auto_cargo_scored_upper) AS avg_auto_cargo_upper,
+    AVG(auto_cargo_scored_lower) AS avg_auto_cargo_lower,
+    AVG(tele_cargo_scored_upper) AS avg_tele_cargo_upper,
+    AVG(tele_cargo_scored_lower) AS avg_tele_cargo_lower,
+    2 * AVG(successfully_completed_taxi) + 2 * AVG(auto_cargo_scored_lower) +
+        4 * AVG(auto_cargo_scored_upper) AS avg_auto_points,
+    AVG(tele_cargo_scored_lower) + 2 * AVG(tele_cargo_scored_upper) AS avg_tele_points,
+    AVG(hangar_level) AS avg_climb_points,
+    AVG(defense_level) AS avg_defense_equivalent
+FROM match_entries
+GROUP BY season, event, team_num;
+
+CREATE VIEW IF NOT EXISTS team_season_averages AS
+SELECT
+    season,
+    team_num,
+    COUNT(DISTINCT event) AS event_count,
+    COUNT(*) AS match_count,
+    AVG(successfully_completed_taxi) AS taxi_percent,
+    AVG(auto_cargo_scored_upper) AS avg_auto_cargo_upper,
+    AVG(auto_cargo_scored_lower) AS avg_auto_cargo_lower,
+    AVG(tele_cargo_scored_upper) AS avg_tele_cargo_upper,
+    AVG(tele_cargo_scored_lower) AS avg_tele_cargo_lower,
+    2 * AVG(successfully_completed_taxi) + 2 * AVG(auto_cargo_scored_lower) +
+        4 * AVG(auto_cargo_scored_upper) AS avg_auto_points,
+    AVG(tele_cargo_scored_lower) + 2 * AVG(tele_cargo_scored_upper) AS avg_tele_points,
+    AVG(hangar_level) AS avg_climb_points,
+    AVG(defense_level) AS avg_defense_equivalent
+FROM match_entries
+GROUP BY season, team_num;
+"""
+
+# The columns of the averages views that are copied onto TeamData classes
+team_average_field_names = (
+    "match_count",
+    "taxi_percent",
+    "avg_auto_cargo_upper",
+    "avg_auto_cargo_lower",
+    "avg_tele_cargo_upper",
+    "avg_tele_cargo_lower",
+    "avg_auto_points",
+    "avg_tele_points",
+    "avg_climb_points",
+    "avg_defense_equivalent",
+)
+
+
+def open_match_store(file_name):
+    # Open (or create) the store, making the tables, indexes and views if they're missing
+    connection = sqlite3.connect(file_name)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(match_store_schema)
+    return connection
+
+
+def save_event_to_store(connection, match_table, event, season):
+    # Replace everything stored for an event in a season with the rows of match_table, all
+    # in one transaction so that the store never ends up with half of an event
+    match_entry_rows = zip(
+        [season] * len(match_table),
+        [event] * len(match_table),
+        *(match_table.column(name).tolist() for name in (
+            "team_num",
+            "qual_match_num",
+            "successfully_completed_taxi",
+            "auto_cargo_scored_upper",
+            "auto_cargo_scored_lower",
+            "tele_cargo_scored_upper",
+            "tele_cargo_scored_lower",
+            "hangar_level",
+            "defense_level")),
+        [match_table.other_info_strings[code]
+         for code in match_table.column("other_info").tolist()])
+
+    with connection:
+        num_replaced_entries = connection.execute(
+            "DELETE FROM match_entries WHERE season = ? AND event = ?", (season, event)
+        ).rowcount
+        connection.executemany(
+            "INSERT INTO match_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            match_entry_rows)
+
+    if num_replaced_entries > 0:
+        print(f"Replaced the {num_replaced_entries} Match Entries Already Stored for {event} "
+              f"({season})")
+    print(f"Saved {len(match_table)} Match Entries for {event} ({season}) to the Store")
+
+
+def load_season_team_data(connection, season):
+    # Read every team's averages across all of a season's stored events. Returns a dict of
+    # team number to TeamData (without any matches) and a dict of team number to how many
+    # events the team was at, the same as combine_event_results().
+    team_data = {}
+    team_event_counts = {}
+
+    season_averages = connection.execute(
+        "SELECT * FROM team_season_averages WHERE season = ? ORDER BY team_num", (season,))
+    for team_averages in season_averages:
+        single_teams_data = get_or_create_team_data(team_data, team_averages["team_num"])
+        for name in team_average_field_names:
+            setattr(single_teams_data, name, team_averages[name])
+        team_event_counts[single_teams_data.team_num] = team_averages["event_count"]
+
+    return team_data, team_event_counts
+
+
+def get_team_history(connection, team_num):
+    # Every match a team has ever had stored, oldest season first, as a list of dicts
+    match_entries = connection.execute(
+        "SELECT * FROM match_entries WHERE team_num = ? "
+        "ORDER BY season, event, qual_match_num",
+        (team_num,))
+    return [dict(match_entry) for match_entry in match_entries]
+
+
+##############
+# RANK TEAMS #
+##############
+
+
+def get_category_points(column_averages):
+    # Turn a team's average for each input column (e.g. from RecentFormAccumulator) into
+    # its points in each ranked category, in the same order as ranked_categories(). Uses
+    # the same formulas as update_team_averages().
+    avg_auto_points = 2 * column_averages["successfully_completed_taxi"] + \
+        2 * column_averages["auto_cargo_scored_lower"] + \
+        4 * column_averages["auto_cargo_scored_upper"]
+    avg_tele_points = column_averages["tele_cargo_scored_lower"] + \
+        2 * column_averages["tele_cargo_scored_upper"]
+    avg_climb_points = column_averages["hangar_level"]
+
+    return [
+        avg_auto_points + avg_tele_points + avg_climb_points,
+        avg_auto_points,
+        avg_tele_points,
+        avg_climb_points,
+        column_averages["defense_level"],
+    ]
+
+
+def rank_category_points(team_category_points):
+    # Rank a dict of team number to category points (from get_category_points()). Returns
+    # a ranking list per category (best first) and a dict of team number to its rank in
+    # each category.
+    category_rankings = []
+    team_ranks = {team_num: [] for team_num in team_category_points}
+
+    for i in range(len(TeamRankings.category_field_names)):
+        category_ranking = sorted(
+            [(team_num, category_points[i])
+             for team_num, category_points in team_category_points.items()],
+            key=lambda x: x[1],
+            reverse=True)
+        category_rankings.append(category_ranking)
+
+        for rank, (team_num, junk) in enumerate(category_ranking):
+            team_ranks[team_num].append(rank + 1)
+
+    return category_rankings, team_ranks
+
+
+def rank_teams(team_data):
+    # Rank every team in each category based on the averages in team_data
+    team_rankings = TeamRankings()
+
+    # Sort the team numbers in ascending order
+    team_num_list = sorted(team_data)
+
+    # Add team statistics to lists for ranking
+    for team_num in team_num_list:
+        single_teams_data = team_data[team_num]
+
+        team_rankings.avg_match_contribution.append(
+            (team_num, single_teams_data.avg_auto_points + single_teams_data.avg_tele_points + single_teams_data.avg_climb_points))
+        team_rankings.avg_auto.append(
+            (team_num, single_teams_data.avg_auto_points))
+        team_rankings.avg_tele.append(
+            (team_num, single_teams_data.avg_tele_points))
+        team_rankings.avg_climb.append(
+            (team_num, single_teams_data.avg_climb_points))
+        team_rankings.defense_percent.append(
+            (team_num, single_teams_data.avg_defense_equivalent))
+
+    # Sort/rank all of the team's individual statistics to find leaders in each category
+    team_rankings.avg_match_contribution = sorted(
+        team_rankings.avg_match_contribution,
+        key=lambda x: x[1],
+        reverse=True)
+    team_rankings.avg_auto = sorted(
+        team_rankings.avg_auto,
+        key=lambda x: x[1],
+        reverse=True)
+    team_rankings.avg_tele = sorted(
+        team_rankings.avg_tele,
+        key=lambda x: x[1],
+        reverse=True)
+    team_rankings.avg_climb = sorted(
+        team_rankings.avg_climb,
+        key=lambda x: x[1],
+        reverse=True)
+    team_rankings.defense_percent = sorted(
+        team_rankings.defense_percent,
+        key=lambda x: x[1],
+        reverse=True)
+
+    # Add the top 5 from each category to a set of all of these teams, where duplicates will
+    # be avoided. This list will determine which teams get colored
+    top_teams_across_categories = []
+    for category_title, category_ranking in team_rankings.ranked_categories():
+        top_teams_across_categories += category_ranking[0:
+                                                        NUM_OF_TOP_TEAMS_TO_COLOR_PER_CATEGORY]
+
+    # Get a list of unique teams that are at the top of at least one category
+    top_teams_across_categories = list(set([
+        team for (team, junk) in top_teams_across_categories]))
+
+    # Add a number to each team that corresponds to its color on the ranking sheet
+    team_rankings.top_teams_across_categories = {
+        team: i + 1 for i, team in enumerate(top_teams_across_categories)}
+
+    # Look up each team's rank in every category once, so that writing a team's ranks is a
+    # dict lookup instead of a search through every ranking list. Each team gets a list of
+    # ranks in the same order as ranked_categories().
+    team_rankings.team_category_ranks = {team_num: [] for team_num in team_num_list}
+    for category_title, category_ranking in team_rankings.ranked_categories():
+        for i, (ranked_team_num, junk) in enumerate(category_ranking):
+            team_rankings.team_category_ranks[ranked_team_num].append(i + 1)
+
+    # Rank teams by their recent form as well
+    team_rankings.recent_rankings, team_rankings.team_recent_ranks = rank_category_points({
+        team_num: get_category_points(team_data[team_num].recent_form.recent_averages())
+        for team_num in team_num_list})
+    team_rankings.weighted_rankings, team_rankings.team_weighted_ranks = \
+        rank_category_points({
+            team_num: get_category_points(
+                team_data[team_num].recent_form.exponential_averages())
+            for team_num in team_num_list})
+
+    # Rank teams by their power ratings, if they've been calculated
+    power_rated_team_nums = [
+        team_num for team_num in team_num_list if team_data[team_num].opr is not None]
+    if power_rated_team_nums:
+        for name, best_first in (("opr", True), ("dpr", False), ("ccwm", True)):
+            team_rankings.power_rankings[name] = sorted(
+                [(team_num, getattr(team_data[team_num], name))
+                 for team_num in power_rated_team_nums],
+                key=lambda x: x[1],
+                reverse=best_first)
+
+    # Rank teams by how their match points are spread out, if that's been worked out
+    team_rankings.team_match_contribution_stats = {
+        team_num: team_data[team_num].distributions["match_contribution"]
+        for team_num in team_num_list if team_data[team_num].distributions}
+    if team_rankings.team_match_contribution_stats:
+        for name, stat_name in (
+                ("median_match_contribution", "median"),
+                ("floor_match_contribution", "p10"),
+                ("ceiling_match_contribution", "p90"),
+                ("consistency", "consistency")):
+            team_rankings.distribution_rankings[name] = sorted(
+                [(team_num, stats[stat_name])
+                 for team_num, stats in team_rankings.team_match_contribution_stats.items()],
+                key=lambda x: x[1],
+                reverse=True)
+
+    return team_rankings
+
+
+###############################
+# GENERATE OUTPUT SPREADSHEET #
+###############################
+
+
+def write_team_worksheet(single_teams_worksheet, single_teams_data, team_rankings,
+                         percent_format, one_decimal_format):
+    # Populate the worksheet for one team with its match data, averages, ranks, etc. (but
+    # not charts, see add_team_charts())
+
+    # Sort the match data to be in ascending order of qual match number. I don't
+    # fully understand how this works, but I got it from stack overflow and it
+    # does the job.
+    match_data = sorted(
+        single_teams_data.get_match_entries(),
+        key=lambda x: x.qual_match_num,
+        reverse=False)
+
+    # Set the column widths to make the text legible
+    single_teams_worksheet.set_column_pixels(0, 0, 120)   # Qual
+    single_teams_worksheet.set_column_pixels(1, 1, 50)   # Taxi
+    single_teams_worksheet.set_column_pixels(
+        2, 3, 180)                                        # Auto cargo (both)
+    single_teams_worksheet.set_column_pixels(
+        4, 5, 190)                                        # Tele cargo (both)
+    single_teams_worksheet.set_column_pixels(6, 6, 100)    # Hangar
+    single_teams_worksheet.set_column_pixels(7, 7, 90)    # Defense
+    single_teams_worksheet.set_column_pixels(8, 8, 1000)  # Other
+
+    # Turn the python representation of the match data back into human-friendly text
+    # that can be written to the spreadsheet, and count up the hangar levels and
+    # defense levels for the pie charts. This has to happen before anything is written
+    # because the counts go in the same rows as the first few matches.
+    # The counts start over every time so that the same team can be written more than once
+    single_teams_data.hangar_level_counts[:] = array.array("I", [0] * len(hangar_level_names))
+    single_teams_data.defense_level_counts[:] = array.array(
+        "I", [0] * len(defense_level_names))
+    match_data_rows = []
+    chart_data_rows = []
+    for match in match_data:
+        taxi_string = "Yes" if match.successfully_completed_taxi == 1 else "No"
+
+        hangar_string = "ERROR"
+        for key, value in hangar_level_points_dict.items():
+            if match.hangar_level == value:
+                hangar_string = key
+                if key in hangar_level_count_index:
+                    single_teams_data.hangar_level_counts[hangar_level_count_index[key]] += 1
+
+        defense_string = "ERROR"
+        for key, value in defense_level_as_percentage_dict.items():
+            if match.defense_level == value:
+                defense_string = key
+                if key in defense_level_count_index:
+                    single_teams_data.defense_level_counts[defense_level_count_index[key]] += 1
+
+        match_data_rows.append([
+            match.qual_match_num,
+            taxi_string,
+            match.auto_cargo_scored_upper,
+            match.auto_cargo_scored_lower,
+            match.tele_cargo_scored_upper,
+            match.tele_cargo_scored_lower,
+            hangar_string,
+            defense_string,
+            match.other_info,
+        ])
+
+        # For charts later on
+        chart_data_rows.append([
+            match.successfully_completed_taxi,
+            match.hangar_level,
+            match.defense_level,
+        ])
+
+    hangar_count_rows = list(zip(hangar_level_names, single_teams_data.hangar_level_counts))
+    defense_count_rows = list(zip(defense_level_names, single_teams_data.defense_level_counts))
+
+    # Populate the worksheet for this team with match data, graphs, etc. Everything
+    # below is written from the top of the sheet to the bottom.
+
+    # Summary statistics
+    summary_statistics = [
+        ("Taxi Percentage: ",
+         single_teams_data.taxi_percent, percent_format, None),
+        ("Avg. Auto Points: ",
+         single_teams_data.avg_auto_points, one_decimal_format, "(Including avg. taxi points)"),
+        ("Avg. Teleop Points: ",
+         single_teams_data.avg_tele_points, one_decimal_format, None),
+        ("Avg. Climb Points: ",
+         single_teams_data.avg_climb_points, one_decimal_format, None),
+        ("Defense Percentage: ",
+         single_teams_data.avg_defense_equivalent, percent_format, "(100% = Yes/Always, 0% = No/Never)"),
+    ]
+    for i, (title, value, value_format, note) in enumerate(summary_statistics):
+        single_teams_worksheet.write(
+            STATISTICS_START_ROW + i, STATISTICS_START_COL, title)
+        single_teams_worksheet.write(
+            STATISTICS_START_ROW + i, STATISTICS_START_COL + 1, value, value_format)
+        single_teams_worksheet.write(
+            STATISTICS_START_ROW + i, STATISTICS_START_COL + 2, note)
+
+    # Write all of the ranked category titles and the rank from each category to the
+    # sheet
+    team_ranks = team_rankings.team_category_ranks[single_teams_data.team_num]
+    team_recent_ranks = team_rankings.team_recent_ranks[single_teams_data.team_num]
+    team_weighted_ranks = team_rankings.team_weighted_ranks[single_teams_data.team_num]
+    single_teams_worksheet.write_row(22, 0, [
+        "Ranked Category",
+        "Rank",
+        f"Rank (Last {RECENT_MATCH_WINDOW} Matches)",
+        "Rank (Weighted Recent)",
+    ])
+    for i, (category_title, junk) in enumerate(team_rankings.ranked_categories()):
+        single_teams_worksheet.write_row(23 + i, 0, [
+            category_title,
+            team_ranks[i],
+            team_recent_ranks[i],
+            team_weighted_ranks[i],
+        ])
+
+    # Data category titles for averages
+    single_teams_worksheet.write_row(AVERAGES_ROW - 1, 1, [
+        "Taxi",
+        "AUTO - Cargo Scored [Upper Hub]",
+        "AUTO - Cargo Scored [Lower Hub]",
+        "TELEOP - Cargo Scored [Upper Hub]",
+        "TELEOP - Cargo Scored [Lower Hub]",
+        "Hangar",
+        "Mostly defense?",
+    ])
+
+    # Print averages to the spreadsheet
+    single_teams_worksheet.write(
+        AVERAGES_ROW, 0, "Averages:")
+    single_teams_worksheet.write(
+        AVERAGES_ROW, 1, single_teams_data.taxi_percent, percent_format)
+    single_teams_worksheet.write_row(AVERAGES_ROW, 2, [
+        single_teams_data.avg_auto_cargo_upper,
+        single_teams_data.avg_auto_cargo_lower,
+        single_teams_data.avg_tele_cargo_upper,
+        single_teams_data.avg_tele_cargo_lower,
+        single_teams_data.avg_climb_points,
+    ], one_decimal_format)
+    single_teams_worksheet.write(
+        AVERAGES_ROW, 7, single_teams_data.avg_defense_equivalent, percent_format)
+
+    # The same averages over only the last few matches, and weighted towards recent matches
+    recent_form_averages = [
+        (f"Last {RECENT_MATCH_WINDOW} Matches:",
+         single_teams_data.recent_form.recent_averages()),
+        ("Weighted Recent:", single_teams_data.recent_form.exponential_averages()),
+    ]
+    for i, (title, column_averages) in enumerate(recent_form_averages):
+        single_teams_worksheet.write(AVERAGES_ROW + i + 1, 0, title)
+        single_teams_worksheet.write(
+            AVERAGES_ROW + i + 1,
+            1,
+            column_averages["successfully_completed_taxi"],
+            percent_format)
+        single_teams_worksheet.write_row(AVERAGES_ROW + i + 1, 2, [
+            column_averages["auto_cargo_scored_upper"],
+            column_averages["auto_cargo_scored_lower"],
+            column_averages["tele_cargo_scored_upper"],
+            column_averages["tele_cargo_scored_lower"],
+            column_averages["hangar_level"],
+        ], one_decimal_format)
+        single_teams_worksheet.write(
+            AVERAGES_ROW + i + 1, 7, column_averages["defense_level"], percent_format)
+
+    # How spread out the team's points are from match to match
+    distribution_rows = [
+        ("Match Contribution", "match_contribution"),
+        ("Auto", "auto"),
+        ("Teleop", "tele"),
+        ("Climb", "climb"),
+    ]
+    if single_teams_data.distributions:
+        single_teams_worksheet.write_row(DISTRIBUTION_START_ROW, 0, [
+            "Points Per Match",
+            "Median",
+            "Std. Dev.",
+            "10th Percentile",
+            "90th Percentile",
+            "Min",
+            "Max",
+            "Consistency",
+        ])
+        for i, (title, category_name) in enumerate(distribution_rows):
+            stats = single_teams_data.distributions[category_name]
+            single_teams_worksheet.write(DISTRIBUTION_START_ROW + i + 1, 0, title)
+            single_teams_worksheet.write_row(DISTRIBUTION_START_ROW + i + 1, 1, [
+                stats["median"],
+                stats["std"],
+                stats["p10"],
+                stats["p90"],
+                stats["min"],
+                stats["max"],
+            ], one_decimal_format)
+            single_teams_worksheet.write(
+                DISTRIBUTION_START_ROW + i + 1, 7, stats["consistency"], percent_format)
+
+    # Data category titles for match data
+    single_teams_worksheet.write(
+        DATA_START_ROW - 1, 0, "MATCH DATA")
+    single_teams_worksheet.write_row(DATA_START_ROW, 0, [
+        "Qualification Number",
+        "Taxi",
+        "AUTO - Cargo Scored [Upper Hub]",
+        "AUTO - Cargo Scored [Lower Hub]",
+        "TELEOP - Cargo Scored [Upper Hub]",
+        "TELEOP - Cargo Scored [Lower Hub]",
+        "Hangar",
+        "Mostly defense?",
+        "Other Information",
+    ])
+
+    # Titles for the hangar/defense counts for pie charts and the numbers for the other
+    # charts later on
+    single_teams_worksheet.write_row(DATA_START_ROW, 19, [
+        "Hangar levels",
+        "Frequency",
+        "Hangar levels",
+        "Frequency",
+        "Taxi Num",
+        "Climb Num",
+        "Defense Num",
+    ])
+
+    # Add the team's match data to that team's worksheet, along with the hangar and
+    # defense counts in columns 19-22 next to the first few matches. i + 1 is needed
+    # because i starts counting at 0, but I want the first row of match data to be in
+    # the row at index 1, not 0.
+    for i in range(max(len(match_data_rows), len(hangar_count_rows))):
+        if i < len(match_data_rows):
+            single_teams_worksheet.write_row(
+                DATA_START_ROW + i + 1, 0, match_data_rows[i])
+            single_teams_worksheet.write_row(
+                DATA_START_ROW + i + 1, 23, chart_data_rows[i])
+        if i < len(hangar_count_rows):
+            single_teams_worksheet.write_row(
+                DATA_START_ROW + i + 1, 19, hangar_count_rows[i])
+        if i < len(defense_count_rows):
+            single_teams_worksheet.write_row(
+                DATA_START_ROW + i + 1, 21, defense_count_rows[i])
+
+
+class ChartTemplate:
+    """Class to set up a chart that gets made over and over with only its cell ranges
+    changed (e.g. the same chart on every team sheet). Everything else about the chart
+    (titles, axes, colors, and where it goes) is worked out once, and add_to_worksheet()
+    stamps out a copy of it for each sheet."""
+
+    def __init__(self, chart_type, title, position, series, x_axis=None, y_axis=None,
+                 insert_options=None):
+        self.chart_options = {"type": chart_type}
+        self.title_options = {"name": title}
+        self.x_axis_options = x_axis
+        self.y_axis_options = y_axis
+        self.position = position
+        self.insert_options = insert_options or {}
+
+        # Each series is (series options, categories column, values column, first row, number
+        # of rows), where the number of rows is None if it changes from sheet to sheet (e.g.
+        # one row per match)
+        self.series = series
+
+    def add_to_worksheet(self, output_workbook, worksheet, sheet_name, num_rows):
+        # num_rows is used for every series that doesn't have a fixed number of rows
+        chart = output_workbook.add_chart(self.chart_options)
+        chart.set_title(self.title_options)
+        if self.x_axis_options is not None:
+            chart.set_x_axis(self.x_axis_options)
+        if self.y_axis_options is not None:
+            chart.set_y_axis(self.y_axis_options)
+
+        for series_options, categories_col, values_col, first_row, series_num_rows in \
+                self.series:
+            last_row = first_row + (num_rows if series_num_rows is None else series_num_rows) - 1
+            chart.add_series({
+                **series_options,
+                'categories':
+                    f'={sheet_name}!{categories_col}{first_row}:{categories_col}{last_row}',
+                'values': f'={sheet_name}!{values_col}{first_row}:{values_col}{last_row}',
+            })
+
+        worksheet.insert_chart(self.position, chart, self.insert_options)
+
+
+# The charts on every team sheet. Match data starts on the row after DATA_START_ROW (and
+# excel counts rows from 1), with the hangar and defense counts next to the first few matches.
+FIRST_MATCH_ROW = DATA_START_ROW + 2
+match_axis_options = {'name': 'Qualification Match'}
+
+team_chart_templates = [
+    # Cargo scored in auto (high vs. low)
+    ChartTemplate(
+        'column',
+        'AUTO - Upper vs. Lower Hub Cargo',
+        f"{FIRST_CHART_COL}{CHART_START_ROW}",
+        [({'name': 'Upper Hub', 'fill': {'color': chart_colors["BLUE"]}},
+          "A", "C", FIRST_MATCH_ROW, None),
+         ({'name': 'Lower Hub', 'fill': {'color': chart_colors["RED"]}},
+          "A", "D", FIRST_MATCH_ROW, None)],
+        x_axis=match_axis_options,
+        y_axis={'name': 'Cargo Scored', 'min': 0, 'max': MAX_POSSIBLE_AUTO_POINTS}),
+
+    # Cargo scored in teleop (high vs. low)
+    ChartTemplate(
+        'column',
+        'TELEOP - Upper vs. Lower Hub Cargo',
+        f"{SECOND_CHART_COL}{CHART_START_ROW}",
+        [({'name': 'Upper Hub', 'fill': {'color': chart_colors["BLUE"]}},
+          "A", "E", FIRST_MATCH_ROW, None),
+         ({'name': 'Lower Hub', 'fill': {'color': chart_colors["RED"]}},
+          "A", "F", FIRST_MATCH_ROW, None)],
+        x_axis=match_axis_options,
+        y_axis={'name': 'Cargo Scored', 'min': 0, 'max': MAX_POSSIBLE_TELE_POINTS}),
+
+    # Hangar level across matches
+    ChartTemplate(
+        'column',
+        'Hangar Points Over Time',
+        f"{SECOND_CHART_COL}{CHART_START_ROW + CHART_ROW_SPACING}",
+        [({'name': 'Hangar Points', 'fill': {'color': chart_colors["RED"]}},
+          "A", "Y", FIRST_MATCH_ROW, None)],
+        x_axis=match_axis_options,
+        y_axis={'name': 'Hangar Points', 'min': 0, 'max': 15}),
+
+    # Hangar pie chart
+    ChartTemplate(
+        'pie',
+        'Climb Level Breakdown',
+        f"{THIRD_CHART_COL}{CHART_START_ROW + CHART_ROW_SPACING}",
+        [({'name': 'Climb Level',
+           'points': [
+               {'fill': {'color': chart_colors["BLACK"]}},
+               {'fill': {'color': chart_colors["RED"]}},
+               {'fill': {'color': chart_colors["YELLOW"]}},
+               {'fill': {'color': chart_colors["BLUE"]}},
+               {'fill': {'color': chart_colors["GREEN"]}},
+           ]},
+          "T", "U", FIRST_MATCH_ROW, len(hangar_level_names))]),
+
+    # Defense pie chart
+    ChartTemplate(
+        'pie',
+        'Does This Team Play Defense?',
+        f"{THIRD_CHART_COL}{CHART_START_ROW}",
+        [({'name': 'Defense',
+           'points': [
+               {'fill': {'color': chart_colors["RED"]}},
+               {'fill': {'color': chart_colors["YELLOW"]}},
+               {'fill': {'color': chart_colors["GREEN"]}},
+           ]},
+          "V", "W", FIRST_MATCH_ROW, len(defense_level_names))]),
+]
+
+# A single chart with everything a team scored in each match, for when the workbook needs
+# to be made as quickly as possible
+combined_team_chart_template = ChartTemplate(
+    'column',
+    'Match Breakdown',
+    f"{FIRST_CHART_COL}{CHART_START_ROW}",
+    [({'name': 'AUTO Upper Hub', 'fill': {'color': chart_colors["BLUE"]}},
+      "A", "C", FIRST_MATCH_ROW, None),
+     ({'name': 'AUTO Lower Hub', 'fill': {'color': chart_colors["RED"]}},
+      "A", "D", FIRST_MATCH_ROW, None),
+     ({'name': 'TELEOP Upper Hub', 'fill': {'color': chart_colors["GREEN"]}},
+      "A", "E", FIRST_MATCH_ROW, None),
+     ({'name': 'TELEOP Lower Hub', 'fill': {'color': chart_colors["YELLOW"]}},
+      "A", "F", FIRST_MATCH_ROW, None),
+     ({'name': 'Hangar Points', 'fill': {'color': chart_colors["PURPLE"]}},
+      "A", "Y", FIRST_MATCH_ROW, None)],
+    x_axis=match_axis_options,
+    y_axis={'name': 'Cargo Scored / Hangar Points', 'min': 0},
+    insert_options={'x_scale': 2})
+
+# The charts on each team sheet for each chart mode. "rankings" leaves team sheets without
+# any charts, so only the chart on the ranking sheet is made.
+team_chart_templates_by_mode = {
+    "full": team_chart_templates,
+    "combined": [combined_team_chart_template],
+    "rankings": [],
+}
+
+# The top teams by average match contribution (from the first column of the ranking sheet),
+# to the right of everything else on the sheet
+ranking_chart_template = ChartTemplate(
+    'column',
+    'Top Teams - Avg. Match Contribution',
+    "AA2",
+    [({'name': 'Avg. Match Contribution (Pts.)', 'fill': {'color': chart_colors["BLUE"]}},
+      "C", "D", 2, None)],
+    x_axis={'name': 'Team'},
+    y_axis={'name': 'Points', 'min': 0},
+    insert_options={'x_scale': 1.5})
+
+
+def add_team_charts(output_workbook, single_teams_worksheet, single_teams_data,
+                    chart_templates=team_chart_templates):
+    # Create the charts for one team and put them on its worksheet. Returns the number of
+    # charts that were created.
+    for chart_template in chart_templates:
+        chart_template.add_to_worksheet(
+            output_workbook,
+            single_teams_worksheet,
+            single_teams_data.team_num,
+            len(single_teams_data.match_rows))
+
+    # TODO: Extremely fancy graphs that look absurd
+
+    return len(chart_templates)
+
+
+def write_ranked_columns(ranking_worksheet, ranking_sheet_columns, team_rankings,
+                         team_labeling_formats, team_table=None):
+    # Fill in a worksheet that lists every team from best to worst in each category, side
+    # by side. ranking_sheet_columns has a (title, width in pixels, ranking list, format)
+    # for each category. Every category gets a gap column, a team column and a points
+    # column, after the ranking number column. team_table can add a table with one row
+    # per team after the categories, as (column titles, rows starting with the team number,
+    # format for each column after the team), which gets filter buttons so it can be sorted
+    # by any column in excel.
+    header_row = ["#"]
+    ranking_worksheet.set_column_pixels(0, 0, 20)  # Num
+    for i, (title, pts_width, category_ranking, pts_format) in enumerate(
+            ranking_sheet_columns):
+        header_row += [None, "Team", title]
+
+        ranking_worksheet.set_column_pixels(3 * i + 1, 3 * i + 1, 10)  # Gap
+        ranking_worksheet.set_column_pixels(3 * i + 2, 3 * i + 2, 40)  # Team
+        ranking_worksheet.set_column_pixels(3 * i + 3, 3 * i + 3, pts_width)  # Pts
+
+    num_rows = len(ranking_sheet_columns[0][2])
+    team_table_col = 3 * len(ranking_sheet_columns) + 2
+    if team_table is not None:
+        team_table_titles, team_table_rows, team_table_formats = team_table
+        header_row += [None] + team_table_titles
+        num_rows = max(num_rows, len(team_table_rows))
+
+        ranking_worksheet.set_column_pixels(team_table_col - 1, team_table_col - 1, 10)  # Gap
+        ranking_worksheet.set_column_pixels(
+            team_table_col + 1, team_table_col + len(team_table_formats), 95)
+        ranking_worksheet.autofilter(
+            0,
+            team_table_col,
+            len(team_table_rows),
+            team_table_col + len(team_table_formats))
+
+    # Write the column headers
+    ranking_worksheet.write_row(0, 0, header_row)
+
+    # Fill in the rank sheet one row at a time. Every row has the ranking number, then the
+    # team and its points for each category side by side.
+    for i in range(num_rows):
+        ranking_worksheet.write(i + 1, 0, i + 1)
+
+        for j, (title, pts_width, category_ranking, pts_format) in enumerate(
+                ranking_sheet_columns):
+            if i >= len(category_ranking):
+                continue
+
+            team_col = 3 * j + 2
+            team_num, pts = category_ranking[i]
+            write_ranked_team_num(
+                ranking_worksheet, i + 1, team_col, team_num, team_rankings,
+                team_labeling_formats)
+            ranking_worksheet.write(i + 1, team_col + 1, pts, pts_format)
+
+        if team_table is not None and i < len(team_table_rows):
+            team_num, *values = team_table_rows[i]
+            write_ranked_team_num(
+                ranking_worksheet, i + 1, team_table_col, team_num, team_rankings,
+                team_labeling_formats)
+            for k, (value, value_format) in enumerate(zip(values, team_table_formats)):
+                ranking_worksheet.write(i + 1, team_table_col + k + 1, value, value_format)
+
+
+def write_ranked_team_num(ranking_worksheet, row, col, team_num, team_rankings,
+                          team_labeling_formats):
+    # The teams at the top of any category get their own color on the ranking sheets
+    if team_num in team_rankings.top_teams_across_categories:
+        ranking_worksheet.write(
+            row,
+            col,
+            team_num,
+            team_labeling_formats[team_rankings.top_teams_across_categories[team_num]])
+    else:
+        ranking_worksheet.write(row, col, team_num)
+
+
+def write_ranking_worksheet(ranking_worksheet, team_rankings, percent_format,
+                            one_decimal_format, team_labeling_formats):
+    # Populate the worksheet that lists every team from best to worst in each category,
+    # followed by a sortable table of how spread out each team's match points are (when
+    # that's been worked out)
+    team_table = None
+    if team_rankings.team_match_contribution_stats:
+        team_table = (
+            [
+                "Team",
+                "Median Match Pts.",
+                "Std. Dev.",
+                "10th Percentile",
+                "90th Percentile",
+                "Min",
+                "Max",
+                "Consistency",
+            ],
+            [
+                [team_num] + [
+                    team_rankings.team_match_contribution_stats[team_num][name]
+                    for name in ("median", "std", "p10", "p90", "min", "max", "consistency")]
+                for team_num, junk in team_rankings.distribution_rankings[
+                    "median_match_contribution"]
+            ],
+            [one_decimal_format] * 6 + [percent_format],
+        )
+
+    write_ranked_columns(ranking_worksheet, [
+        ("Avg. Match Contribution (Pts.)", 170,
+         team_rankings.avg_match_contribution, one_decimal_format),
+        ("Avg. Auto Pts.", 80, team_rankings.avg_auto, one_decimal_format),
+        ("Avg. Teleop Pts.", 90, team_rankings.avg_tele, one_decimal_format),
+        ("Avg. Climb Pts.", 85, team_rankings.avg_climb, one_decimal_format),
+        ("Defense %", 60, team_rankings.defense_percent, percent_format),
+    ], team_rankings, team_labeling_formats, team_table)
+
+
+def write_recent_form_worksheet(recent_form_worksheet, team_rankings, percent_format,
+                                one_decimal_format, team_labeling_formats):
+    # Populate the worksheet that ranks every team by its last few matches and by its
+    # weighted recent averages, with the same team colors as the ranking worksheet
+    (recent_match_contribution, recent_auto, recent_tele, recent_climb,
+     recent_defense) = team_rankings.recent_rankings
+    (weighted_match_contribution, weighted_auto, weighted_tele, weighted_climb,
+     weighted_defense) = team_rankings.weighted_rankings
+
+    last_matches = f"Last {RECENT_MATCH_WINDOW}"
+    write_ranked_columns(recent_form_worksheet, [
+        (f"{last_matches} Match Contribution (Pts.)", 200,
+         recent_match_contribution, one_decimal_format),
+        (f"{last_matches} Auto Pts.", 110, recent_auto, one_decimal_format),
+        (f"{last_matches} Teleop Pts.", 120, recent_tele, one_decimal_format),
+        (f"{last_matches} Climb Pts.", 115, recent_climb, one_decimal_format),
+        (f"{last_matches} Defense %", 110, recent_defense, percent_format),
+        ("Weighted Match Contribution (Pts.)", 220,
+         weighted_match_contribution, one_decimal_format),
+        ("Weighted Auto Pts.", 130, weighted_auto, one_decimal_format),
+        ("Weighted Teleop Pts.", 140, weighted_tele, one_decimal_format),
+        ("Weighted Climb Pts.", 135, weighted_climb, one_decimal_format),
+        ("Weighted Defense %", 130, weighted_defense, percent_format),
+    ], team_rankings, team_labeling_formats)
+
+
+def write_power_rating_worksheet(power_rating_worksheet, team_rankings, one_decimal_format,
+                                 team_labeling_formats):
+    # Populate the worksheet that ranks every team by its power ratings (only the teams in
+    # the match schedule have them, so the list can be shorter than on the other sheets)
+    write_ranked_columns(power_rating_worksheet, [
+        ("OPR (Pts. Added)", 110, team_rankings.power_rankings["opr"], one_decimal_format),
+        ("DPR (Pts. Allowed)", 120, team_rankings.power_rankings["dpr"], one_decimal_format),
+        ("CCWM (OPR - DPR)", 120, team_rankings.power_rankings["ccwm"], one_decimal_format),
+    ], team_rankings, team_labeling_formats)
+
+
+def write_output_workbook(output_workbook, team_data, team_rankings, profiler=None,
+                          reused_team_nums=(), chart_mode="full"):
+    # Fill in the nicely formatted output workbook with the rankings and each team as a
+    # separate tab. chart_mode (see chart_mode_names) picks which charts go on each team
+    # sheet. The workbook is opened in constant_memory mode by open_output_workbook(),
+    # where every row gets flushed to disk as soon as the next row is started (so memory use
+    # doesn't grow with the number of teams), which means every sheet has to be written from
+    # top to bottom.
+    if profiler is None:
+        profiler = PipelineProfiler()
+
+    # Cell formatting objects to format cells as percents, decimals, etc.
+    percent_format = output_workbook.add_format({'num_format': '0.0%'})
+    one_decimal_format = output_workbook.add_format({'num_format': '0.0'})
+
+    # xlsxwriter numbers each format the first time it gets used. The formats used on team
+    # sheets are numbered right away instead, so that a team sheet reused from the sheet
+    # cache (see render_workbook()) points at the same formats on every run. There's no
+    # public way to do this, so it's only done with the xlsxwriter versions the sheet cache
+    # is used with.
+    if can_use_sheet_cache():
+        percent_format._get_xf_index()
+        one_decimal_format._get_xf_index()
+
+    # Create color formats for each team color for use later on in the ranking sheet
+    team_labeling_formats = {}
+    for key, value in team_labeling_colors.items():
+        new_format = output_workbook.add_format({'num_format': '0'})
+        new_format.set_bg_color(value)
+        team_labeling_formats.update({key: new_format})
+
+    # Create the ranking worksheets first
+    ranking_worksheet = output_workbook.add_worksheet("Rankings")
+    recent_form_worksheet = output_workbook.add_worksheet("Recent Form")
+    profiler.add_count("sheets_created", 2)
+    if team_rankings.power_rankings:
+        power_rating_worksheet = output_workbook.add_worksheet("Power Ratings")
+        profiler.add_count("sheets_created")
+
+    # Create a new sheet for every team, in ascending order of team number. Sheets in
+    # reused_team_nums are left empty, to be filled in from the sheet cache once the
+    # workbook is closed.
+    for team_num in sorted(team_data):
+        single_teams_worksheet = output_workbook.add_worksheet(str(team_num))
+        profiler.add_count("sheets_created")
+
+        if team_num in reused_team_nums:
+            continue
+
+        with profiler.phase("sheet_population"):
+            write_team_worksheet(
+                single_teams_worksheet,
+                team_data[team_num],
+                team_rankings,
+                percent_format,
+                one_decimal_format)
+
+        with profiler.phase("chart_creation"):
+            num_charts = add_team_charts(
+                output_workbook,
+                single_teams_worksheet,
+                team_data[team_num],
+                team_chart_templates_by_mode[chart_mode])
+        profiler.add_count("charts_created", num_charts)
+
+    with profiler.phase("sheet_population"):
+        write_ranking_worksheet(
+            ranking_worksheet,
+            team_rankings,
+            percent_format,
+            one_decimal_format,
+            team_labeling_formats)
+        ranking_chart_template.add_to_worksheet(
+            output_workbook,
+            ranking_worksheet,
+            "Rankings",
+            min(len(team_rankings.avg_match_contribution), RANKING_CHART_NUM_TEAMS))
+        profiler.add_count("charts_created")
+        write_recent_form_worksheet(
+            recent_form_worksheet,
+            team_rankings,
+            percent_format,
+            one_decimal_format,
+            team_labeling_formats)
+        if team_rankings.power_rankings:
+            write_power_rating_worksheet(
+                power_rating_worksheet,
+                team_rankings,
+                one_decimal_format,
+                team_labeling_formats)
+
+
+def write_rollup_workbook(output_workbook, team_data, team_rankings, team_event_counts):
+    # Fill in a workbook that combines several events: the rankings across every event,
+    # plus one sheet listing each team's averages across all of its matches at all events
+
+    # Cell formatting objects to format cells as percents, decimals, etc.
+    percent_format = output_workbook.add_format({'num_format': '0.0%'})
+    one_decimal_format = output_workbook.add_format({'num_format': '0.0'})
+
+    # Create color formats for each team color for use later on in the ranking sheet
+    team_labeling_formats = {}
+    for key, value in team_labeling_colors.items():
+        new_format = output_workbook.add_format({'num_format': '0'})
+        new_format.set_bg_color(value)
+        team_labeling_formats.update({key: new_format})
+
+    ranking_worksheet = output_workbook.add_worksheet("Rankings")
+    write_ranking_worksheet(
+        ranking_worksheet,
+        team_rankings,
+        percent_format,
+        one_decimal_format,
+        team_labeling_formats)
+
+    averages_worksheet = output_workbook.add_worksheet("Season Averages")
+    averages_worksheet.write_row(0, 0, [
+        "Team",
+        "Events",
+        "Matches",
+        "Taxi",
+        "AUTO - Cargo Scored [Upper Hub]",
+        "AUTO - Cargo Scored [Lower Hub]",
+        "TELEOP - Cargo Scored [Upper Hub]",
+        "TELEOP - Cargo Scored [Lower Hub]",
+        "Avg. Auto Points",
+        "Avg. Teleop Points",
+        "Avg. Climb Points",
+        "Defense %",
+    ])
+
+    # Set the column widths so the text is legible
+    averages_worksheet.set_column_pixels(0, 2, 60)     # Team, events, matches
+    averages_worksheet.set_column_pixels(3, 3, 50)     # Taxi
+    averages_worksheet.set_column_pixels(4, 5, 180)    # Auto cargo (both)
+    averages_worksheet.set_column_pixels(6, 7, 190)    # Tele cargo (both)
+    averages_worksheet.set_column_pixels(8, 11, 110)   # Points and defense
+
+    for i, team_num in enumerate(sorted(team_data)):
+        single_teams_data = team_data[team_num]
+
+        averages_worksheet.write_row(i + 1, 0, [
+            team_num,
+            team_event_counts[team_num],
+            single_teams_data.match_count,
+        ])
+        averages_worksheet.write(i + 1, 3, single_teams_data.taxi_percent, percent_format)
+        averages_worksheet.write_row(i + 1, 4, [
+            single_teams_data.avg_auto_cargo_upper,
+            single_teams_data.avg_auto_cargo_lower,
+            single_teams_data.avg_tele_cargo_upper,
+            single_teams_data.avg_tele_cargo_lower,
+            single_teams_data.avg_auto_points,
+            single_teams_data.avg_tele_points,
+            single_teams_data.avg_climb_points,
+        ], one_decimal_format)
+        averages_worksheet.write(
+            i + 1, 11, single_teams_data.avg_defense_equivalent, percent_format)
+
+
+def open_output_workbook(file_name):
+    # Open a new xlsxwriter workbook in constant_memory mode (see write_output_workbook()).
+    # xlsxwriter is only imported here so that anything that only needs the statistics
+    # doesn't have to wait for it to load.
+    import xlsxwriter
+
+    return xlsxwriter.Workbook(file_name, {'constant_memory': True})
+
+
+def can_use_sheet_cache():
+    # The sheet cache copies parts of the .xlsx files xlsxwriter makes, and numbers formats
+    # with one of its private methods (see write_output_workbook()), so it's only used with
+    # the major version of xlsxwriter it was made for. Any other version always makes every
+    # sheet from scratch.
+    import xlsxwriter
+    import xlsxwriter.format
+
+    return (
+        xlsxwriter.__version__.split(".")[0] == str(SHEET_CACHE_XLSXWRITER_MAJOR_VERSION)
+        and hasattr(xlsxwriter.format.Format, "_get_xf_index"))
+
+
+def check_xml_part(part_name, part_xml):
+    # Raise a ValueError if a part of the .xlsx file isn't well-formed XML, so that a part
+    # that wasn't laid out the way the sheet cache expects never ends up in a workbook
+    try:
+        ElementTree.fromstring(part_xml)
+    except ElementTree.ParseError as error:
+        raise ValueError(f"{part_name} isn't well-formed XML ({error})")
+
+
+def get_sheet_cache_directory_name(output_file_name):
+    # Each output workbook gets its own sheet cache next to it
+    return os.path.splitext(output_file_name)[0] + "_sheet_cache"
+
+
+def get_team_sheet_fingerprint(single_teams_data, team_rankings, chart_mode="full"):
+    # Hash everything that shows up on a team's sheet and charts (its matches, averages,
+    # ranks and which charts it has), so that the sheet only has to be made again when one
+    # of them changes
+    import xlsxwriter
+
+    # Power ratings aren't shown on team sheets, and they change for every team whenever a
+    # match is added, so they're left out
+    team_summary = get_team_summary(single_teams_data, team_rankings)
+    for name in ("opr", "dpr", "ccwm"):
+        team_summary.pop(name)
+
+    # The sheet lists the matches in order of match number, whatever order they came in
+    team_sheet_inputs = [
+        SHEET_CACHE_VERSION,
+        xlsxwriter.__version__,
+        chart_mode,
+        sorted(
+            (astuple(match_entry) for match_entry in single_teams_data.get_match_entries()),
+            key=lambda x: x[1]),
+        team_summary,
+        single_teams_data.recent_form.recent_averages(),
+        single_teams_data.recent_form.exponential_averages(),
+    ]
+    return hashlib.sha256(
+        repr(get_fingerprint_values(team_sheet_inputs)).encode("utf-8")).hexdigest()
+
+
+def get_fingerprint_values(value):
+    # Turn every number in value (going into lists, tuples and dicts) into a float, so the
+    # same numbers always hash the same way. For example, a taxi is 0 when it was just
+    # parsed, but 0.0 when it was loaded from the parsed data cache or a checkpoint (where
+    # the match table keeps it in a float column).
+    if isinstance(value, dict):
+        return {key: get_fingerprint_values(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [get_fingerprint_values(item) for item in value]
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def get_rels_part_name(part_name):
+    # e.g. "xl/worksheets/sheet2.xml" -> "xl/worksheets/_rels/sheet2.xml.rels"
+    return posixpath.join(
+        posixpath.dirname(part_name), "_rels", posixpath.basename(part_name) + ".rels")
+
+
+def read_optional_part(xlsx_file, part_name):
+    # The text of a part of the .xlsx file, or None if the file doesn't have that part
+    try:
+        return xlsx_file.read(part_name).decode("utf-8")
+    except KeyError:
+        return None
+
+
+def read_relationships(xlsx_file, part_name):
+    # A dict of relationship id to the part name each of part_name's links points at, in
+    # the order they're listed. Parts that don't link to anything have no relationships
+    # part, so that gives an empty dict.
+    relationships_xml = read_optional_part(xlsx_file, get_rels_part_name(part_name))
+    if relationships_xml is None:
+        return {}
+    check_xml_part(get_rels_part_name(part_name), relationships_xml)
+
+    relationships = {}
+    for relationship in ElementTree.fromstring(relationships_xml).iter(
+            f"{{{RELATIONSHIPS_NAMESPACE}}}Relationship"):
+        if "Id" not in relationship.attrib or "Target" not in relationship.attrib:
+            raise ValueError(f"unexpected relationship in {get_rels_part_name(part_name)}")
+        relationships[relationship.attrib["Id"]] = posixpath.normpath(posixpath.join(
+            posixpath.dirname(part_name), relationship.attrib["Target"]))
+    return relationships
+
+
+def get_relationship_targets(xlsx_file, part_name, target_pattern):
+    # The part names of everything part_name links to that matches target_pattern, in the
+    # order they're listed
+    return [
+        target for target in read_relationships(xlsx_file, part_name).values()
+        if re.search(f"{target_pattern}$", target)]
+
+
+def get_sheet_part_names(xlsx_file):
+    # A dict of sheet name to the part of the .xlsx file that holds the sheet
+    workbook_xml = xlsx_file.read("xl/workbook.xml").decode("utf-8")
+    check_xml_part("xl/workbook.xml", workbook_xml)
+    relationship_targets = read_relationships(xlsx_file, "xl/workbook.xml")
+
+    sheet_part_names = {}
+    for sheet in ElementTree.fromstring(workbook_xml).iter(f"{{{SPREADSHEET_NAMESPACE}}}sheet"):
+        relationship_id = sheet.attrib.get(f"{{{DOCUMENT_RELATIONSHIPS_NAMESPACE}}}id")
+        if relationship_id not in relationship_targets:
+            raise ValueError(f"couldn't find the part for sheet {sheet.attrib.get('name')}")
+        sheet_part_names[sheet.attrib["name"]] = relationship_targets[relationship_id]
+    return sheet_part_names
+
+
+def read_team_sheet_parts(xlsx_file, sheet_part_name):
+    # Pull out everything that makes up one team's sheet: the sheet, its drawing (where the
+    # charts are placed), the charts, and the links between them. Sheets without any charts
+    # (e.g. with "--charts rankings") have no drawing, so those parts are left as None.
+    team_sheet_parts = {
+        "sheet": xlsx_file.read(sheet_part_name).decode("utf-8"),
+        "sheet_rels": read_optional_part(xlsx_file, get_rels_part_name(sheet_part_name)),
+        "drawing": None,
+        "drawing_rels": None,
+        "charts": [],
+    }
+
+    drawing_part_names = get_relationship_targets(
+        xlsx_file, sheet_part_name, r"drawing\d+\.xml")
+    if drawing_part_names:
+        drawing_part_name = drawing_part_names[0]
+        chart_part_names = get_relationship_targets(
+            xlsx_file, drawing_part_name, r"chart\d+\.xml")
+
+        team_sheet_parts["drawing"] = xlsx_file.read(drawing_part_name).decode("utf-8")
+        team_sheet_parts["drawing_rels"] = read_optional_part(
+            xlsx_file, get_rels_part_name(drawing_part_name))
+        team_sheet_parts["charts"] = [
+            xlsx_file.read(chart_part_name).decode("utf-8")
+            for chart_part_name in chart_part_names]
+        if team_sheet_parts["charts"] and team_sheet_parts["drawing_rels"] is None:
+            raise ValueError(f"the drawing for {sheet_part_name} has no relationships part")
+
+    for part_name, part_xml in team_sheet_parts.items():
+        for i, xml in enumerate(part_xml if part_name == "charts" else [part_xml]):
+            if xml is not None:
+                check_xml_part(f"{sheet_part_name} {part_name} {i}", xml)
+
+    return team_sheet_parts
+
+
+def load_cached_team_sheet(sheet_cache_directory_name, fingerprint):
+    # Returns the team sheet parts saved with this fingerprint, or None if there aren't any
+    try:
+        with open(os.path.join(sheet_cache_directory_name, f"{fingerprint}.json")) as \
+                cached_team_sheet_file:
+            return json.load(cached_team_sheet_file)
+    except (OSError, ValueError):
+        return None
+
+
+def update_sheet_cache(sheet_cache_directory_name, xlsx_file, team_sheet_fingerprints,
+                       reused_team_nums):
+    # Save the parts of every team sheet that was just made, then remove any cached sheets
+    # that weren't used this time (they're out of date)
+    os.makedirs(sheet_cache_directory_name, exist_ok=True)
+    sheet_part_names = get_sheet_part_names(xlsx_file)
+
+    for team_num, fingerprint in team_sheet_fingerprints.items():
+        if team_num in reused_team_nums:
+            continue
+
+        if str(team_num) not in sheet_part_names:
+            raise ValueError(f"couldn't find the sheet for team {team_num}")
+        team_sheet_parts = read_team_sheet_parts(xlsx_file, sheet_part_names[str(team_num)])
+        with open(os.path.join(sheet_cache_directory_name, f"{fingerprint}.json"), "w") as \
+                cached_team_sheet_file:
+            json.dump(team_sheet_parts, cached_team_sheet_file)
+
+    used_cache_file_names = {
+        f"{fingerprint}.json" for fingerprint in team_sheet_fingerprints.values()}
+    for cache_file_name in os.listdir(sheet_cache_directory_name):
+        if cache_file_name not in used_cache_file_names:
+            os.remove(os.path.join(sheet_cache_directory_name, cache_file_name))
+
+
+def fill_in_reused_team_sheets(file_name, reused_team_sheets):
+    # Swap the empty placeholder sheets left by write_output_workbook() for the cached team
+    # sheets in reused_team_sheets (team number to sheet parts). The cached drawings and
+    # charts get new numbers after the ones xlsxwriter already used. Raises a ValueError
+    # (without changing the file) if any part isn't laid out the way it's expected to be.
+    with zipfile.ZipFile(file_name) as xlsx_file:
+        existing_part_names = xlsx_file.namelist()
+        sheet_part_names = get_sheet_part_names(xlsx_file)
+
+        next_drawing_num = 1 + max([
+            int(part_num) for part_num in re.findall(
+                r"^xl/drawings/drawing(\d+)\.xml$", "\n".join(existing_part_names), re.M)],
+            default=0)
+        next_chart_num = 1 + max([
+            int(part_num) for part_num in re.findall(
+                r"^xl/charts/chart(\d+)\.xml$", "\n".join(existing_part_names), re.M)],
+            default=0)
+
+        new_parts = {}
+        content_type_overrides = []
+        for team_num, team_sheet_parts in reused_team_sheets.items():
+            if str(team_num) not in sheet_part_names:
+                raise ValueError(f"couldn't find the placeholder sheet for team {team_num}")
+            sheet_part_name = sheet_part_names[str(team_num)]
+            drawing_part_name = f"xl/drawings/drawing{next_drawing_num}.xml"
+
+            new_parts[sheet_part_name] = team_sheet_parts["sheet"]
+            if team_sheet_parts["sheet_rels"] is not None:
+                new_parts[get_rels_part_name(sheet_part_name)], num_drawings = re.subn(
+                    r"drawing\d+\.xml", f"drawing{next_drawing_num}.xml",
+                    team_sheet_parts["sheet_rels"])
+                if num_drawings != (team_sheet_parts["drawing"] is not None):
+                    raise ValueError(f"unexpected drawing links for team {team_num}'s sheet")
+
+            # Sheets without any charts have nothing else to copy over
+            if team_sheet_parts["drawing"] is None:
+                continue
+
+            new_parts[drawing_part_name] = team_sheet_parts["drawing"]
+            content_type_overrides.append(
+                f'<Override PartName="/{drawing_part_name}" ContentType="application/'
+                f'vnd.openxmlformats-officedocument.drawing+xml"/>')
+            next_drawing_num += 1
+
+            chart_nums = range(next_chart_num, next_chart_num + len(team_sheet_parts["charts"]))
+            renumbered_charts = iter(chart_nums)
+            if team_sheet_parts["drawing_rels"] is not None:
+                new_parts[get_rels_part_name(drawing_part_name)], num_charts = re.subn(
+                    r"chart\d+\.xml",
+                    lambda match: f"chart{next(renumbered_charts, 0)}.xml",
+                    team_sheet_parts["drawing_rels"])
+                if num_charts != len(team_sheet_parts["charts"]):
+                    raise ValueError(f"unexpected chart links for team {team_num}'s drawing")
+            for chart_num, chart_xml in zip(chart_nums, team_sheet_parts["charts"]):
+                new_parts[f"xl/charts/chart{chart_num}.xml"] = chart_xml
+                content_type_overrides.append(
+                    f'<Override PartName="/xl/charts/chart{chart_num}.xml" ContentType='
+                    f'"application/vnd.openxmlformats-officedocument.drawingml.chart+xml"/>')
+            next_chart_num += len(team_sheet_parts["charts"])
+
+        content_types = xlsx_file.read("[Content_Types].xml").decode("utf-8")
+        if content_types.count("</Types>") != 1:
+            raise ValueError("unexpected [Content_Types].xml")
+        new_parts["[Content_Types].xml"] = content_types.replace(
+            "</Types>", "".join(content_type_overrides) + "</Types>")
+
+        # Every part has to be well-formed before anything is written
+        for part_name, part_xml in new_parts.items():
+            check_xml_part(part_name, part_xml)
+
+        # Copy everything into a new file, swapping in the new parts along the way
+        with zipfile.ZipFile(file_name + ".tmp", "w", zipfile.ZIP_DEFLATED) as new_xlsx_file:
+            for part_info in xlsx_file.infolist():
+                if part_info.filename in new_parts:
+                    new_xlsx_file.writestr(part_info, new_parts.pop(part_info.filename))
+                else:
+                    new_xlsx_file.writestr(part_info, xlsx_file.read(part_info))
+
+            for part_name, part_xml in new_parts.items():
+                new_xlsx_file.writestr(part_name, part_xml)
+
+    os.replace(file_name + ".tmp", file_name)
+
+
+def render_workbook(file_name, team_data, team_rankings, profiler=None,
+                    use_sheet_cache=False, chart_mode="full"):
+    # Write the output workbook for team_data and team_rankings to file_name, with the
+    # charts picked by chart_mode (see chart_mode_names) on each team sheet. With
+    # use_sheet_cache, every team sheet is saved after it's made, and the sheets of teams
+    # whose matches, averages and ranks haven't changed since an earlier run are copied
+    # from there instead of being made again.
+    if profiler is None:
+        profiler = PipelineProfiler()
+    if use_sheet_cache and not can_use_sheet_cache():
+        use_sheet_cache = False
+
+    team_sheet_fingerprints = {}
+    reused_team_sheets = {}
+    if use_sheet_cache:
+        sheet_cache_directory_name = get_sheet_cache_directory_name(file_name)
+
+        with profiler.phase("sheet_cache"):
+            for team_num in sorted(team_data):
+                fingerprint = get_team_sheet_fingerprint(
+                    team_data[team_num], team_rankings, chart_mode)
+                team_sheet_fingerprints[team_num] = fingerprint
+
+                cached_team_sheet = load_cached_team_sheet(
+                    sheet_cache_directory_name, fingerprint)
+                if cached_team_sheet is not None:
+                    reused_team_sheets[team_num] = cached_team_sheet
+
+    output_workbook = open_output_workbook(file_name)
+    write_output_workbook(
+        output_workbook,
+        team_data,
+        team_rankings,
+        profiler,
+        set(reused_team_sheets),
+        chart_mode)
+
+    # Closing the workbook is when xlsxwriter actually puts together and zips up the file
+    with profiler.phase("workbook_close"):
+        output_workbook.close()
+
+    if use_sheet_cache:
+        try:
+            with profiler.phase("sheet_cache"):
+                with zipfile.ZipFile(file_name) as xlsx_file:
+                    update_sheet_cache(
+                        sheet_cache_directory_name,
+                        xlsx_file,
+                        team_sheet_fingerprints,
+                        reused_team_sheets)
+
+                if reused_team_sheets:
+                    fill_in_reused_team_sheets(file_name, reused_team_sheets)
+                    profiler.add_count("sheets_reused", len(reused_team_sheets))
+        except (ValueError, KeyError) as error:
+            # Part of the workbook wasn't laid out the way the sheet cache expects, so none
+            # of the cached sheets can be trusted. The cache is cleared and the whole
+            # workbook is made again without it. The next run starts a new cache.
+            print(f"Couldn't use the sheet cache ({error}), making every sheet again")
+            profiler.add_count("sheet_cache_fallbacks")
+            shutil.rmtree(sheet_cache_directory_name, ignore_errors=True)
+            render_workbook(file_name, team_data, team_rankings, profiler, chart_mode=chart_mode)
+
+
+def process_scouting_data(input_file_name, output_file_name=None, **load_options):
+    # Run the whole pipeline: load and average the input csv, rank the teams and (if an
+    # output_file_name is given) render the workbook. load_options are passed on to
+    # load_team_data(). Returns the team data and the team rankings.
+    team_data, _ = load_team_data(input_file_name, **load_options)
+    team_rankings = rank_teams(team_data)
+
+    if output_file_name is not None:
+        render_workbook(
+            output_file_name, team_data, team_rankings, load_options.get("profiler"))
+
+    return team_data, team_rankings
+
+
+########################
+# OTHER OUTPUT FORMATS #
+########################
+
+
+def get_team_summary(single_teams_data, team_rankings):
+    # A team's averages and its rank in every category as a flat dict
+    team_summary = {
+        "team_num": single_teams_data.team_num,
+        "match_count": single_teams_data.match_count,
+        "taxi_percent": single_teams_data.taxi_percent,
+        "avg_auto_cargo_upper": single_teams_data.avg_auto_cargo_upper,
+        "avg_auto_cargo_lower": single_teams_data.avg_auto_cargo_lower,
+        "avg_tele_cargo_upper": single_teams_data.avg_tele_cargo_upper,
+        "avg_tele_cargo_lower": single_teams_data.avg_tele_cargo_lower,
+        "avg_auto_points": single_teams_data.avg_auto_points,
+        "avg_tele_points": single_teams_data.avg_tele_points,
+        "avg_climb_points": single_teams_data.avg_climb_points,
+        "avg_defense_equivalent": single_teams_data.avg_defense_equivalent,
+        "opr": single_teams_data.opr,
+        "dpr": single_teams_data.dpr,
+        "ccwm": single_teams_data.ccwm,
+        "ranks": dict(zip(
+            TeamRankings.category_field_names,
+            team_rankings.team_category_ranks[single_teams_data.team_num])),
+    }
+
+    # Add the points and ranks for the recent form rankings (see TeamRankings.all_rankings())
+    recent_form_points = [
+        ("recent", single_teams_data.recent_form.recent_averages(),
+         team_rankings.team_recent_ranks[single_teams_data.team_num]),
+        ("weighted", single_teams_data.recent_form.exponential_averages(),
+         team_rankings.team_weighted_ranks[single_teams_data.team_num]),
+    ]
+    for prefix, column_averages, ranks in recent_form_points:
+        for name, points, rank in zip(
+                TeamRankings.category_field_names,
+                get_category_points(column_averages),
+                ranks):
+            team_summary[f"{prefix}_{name}"] = points
+            team_summary["ranks"][f"{prefix}_{name}"] = rank
+
+    # Add how spread out the team's match points are (see compute_team_distributions())
+    for category_name, stats in single_teams_data.distributions.items():
+        for name, value in stats.items():
+            team_summary[f"{category_name}_{name}"] = value
+
+    return team_summary
+
+
+def get_category_ranking(team_rankings, category_name, num_teams=None):
+    # The teams from best to worst in one category (just the top num_teams if given)
+    return [
+        {"rank": i + 1, "team_num": team_num, "value": value}
+        for i, (team_num, value)
+        in enumerate(team_rankings.all_rankings()[category_name][:num_teams])]
+
+
+def write_csv_output(file_name_base, team_data, team_rankings):
+    # Write two flat csv files: one row per team with its averages and ranks, and one row
+    # per team per ranked category
+    teams_file_name = f"{file_name_base}_teams.csv"
+    with open(teams_file_name, "w", newline="") as teams_file:
+        teams_writer = None
+        for team_num in sorted(team_data):
+            team_summary = get_team_summary(team_data[team_num], team_rankings)
+            for category_field_name, rank in team_summary.pop("ranks").items():
+                team_summary[f"{category_field_name}_rank"] = rank
+
+            if teams_writer is None:
+                teams_writer = csv.DictWriter(teams_file, fieldnames=list(team_summary))
+                teams_writer.writeheader()
+            teams_writer.writerow(team_summary)
+
+    rankings_file_name = f"{file_name_base}_rankings.csv"
+    with open(rankings_file_name, "w", newline="") as rankings_file:
+        rankings_writer = csv.writer(rankings_file)
+        rankings_writer.writerow(["category", "rank", "team_num", "value"])
+        for category_name in team_rankings.all_rankings():
+            for ranked_team in get_category_ranking(team_rankings, category_name):
+                rankings_writer.writerow([
+                    category_name,
+                    ranked_team["rank"],
+                    ranked_team["team_num"],
+                    ranked_team["value"],
+                ])
+
+    return [teams_file_name, rankings_file_name]
+
+
+def write_json_output(file_name_base, team_data, team_rankings):
+    # Write every team's averages and ranks plus the ranking lists to one json file
+    json_file_name = f"{file_name_base}.json"
+    with open(json_file_name, "w") as json_file:
+        json.dump({
+            "teams": [
+                get_team_summary(team_data[team_num], team_rankings)
+                for team_num in sorted(team_data)],
+            "rankings": {
+                category_name: get_category_ranking(team_rankings, category_name)
+                for category_name in team_rankings.all_rankings()},
+        }, json_file, indent=4)
+
+    return [json_file_name]
+
+
+def write_npz_output(file_name_base, match_table):
+    # Save the whole match table as a compressed numpy archive. It can be loaded back with
+    # MatchTable.from_arrays(np.load(file_name)).
+    npz_file_name = f"{file_name_base}.npz"
+    np.savez_compressed(npz_file_name, **match_table.to_arrays())
+
+    return [npz_file_name]
+
+
+def write_output_files(output_formats, output_file_name, team_data, team_rankings,
+                       match_table, profiler=None, use_sheet_cache=False, chart_mode="full"):
+    # Write the results in every format in output_formats (see output_format_names). The
+    # other formats get their names from output_file_name without the .xlsx. Returns a list
+    # of every file that was written.
+    if profiler is None:
+        profiler = PipelineProfiler()
+
+    file_name_base = os.path.splitext(output_file_name)[0]
+    written_file_names = []
+
+    if "xlsx" in output_formats:
+        render_workbook(
+            output_file_name,
+            team_data,
+            team_rankings,
+            profiler,
+            use_sheet_cache,
+            chart_mode)
+        written_file_names.append(output_file_name)
+
+    with profiler.phase("other_output_formats"):
+        if "csv" in output_formats:
+            written_file_names += write_csv_output(file_name_base, team_data, team_rankings)
+        if "json" in output_formats:
+            written_file_names += write_json_output(file_name_base, team_data, team_rankings)
+        if "npz" in output_formats:
+            written_file_names += write_npz_output(file_name_base, match_table)
+
+    return written_file_names
+
+
+######################
+# ALLIANCE SIMULATOR #
+######################
+
+
+def get_team_match_points(match_table):
+    # Every team's match contribution points in each of its matches, grouped by team.
+    # Returns the sorted team numbers, the points (sorted by team), and where each team's
+    # points start and how many of them there are.
+    team_nums, team_index = np.unique(match_table.column("team_num"), return_inverse=True)
+    match_counts = np.bincount(team_index, minlength=len(team_nums))
+    team_starts = np.cumsum(match_counts) - match_counts
+
+    match_contribution_points = get_category_points({
+        name: match_table.column(name).astype(np.float64)
+        for name in MatchTable.int_column_names[2:] + MatchTable.float_column_names})[0]
+
+    return team_nums, match_contribution_points[np.argsort(team_index, kind="stable")], \
+        team_starts, match_counts
+
+
+def simulate_alliance_batch(team_points, team_starts, match_counts, alliance_indices,
+                            opponent_indices, num_simulated_matches, seed):
+    # Play num_simulated_matches made-up matches for every alliance in a batch, where each
+    # team scores the points from one of its own matches picked at random. alliance_indices
+    # and opponent_indices have a row of team indexes (into team_starts) per alliance.
+    # This runs in a separate process for each batch, and every batch picks the same
+    # matches for each team (from the same seed), so the alliances are all compared on the
+    # same made-up matches no matter how they were split up. Returns an array of the
+    # expected score, standard deviation, 10th/90th percentile, opponent's expected score
+    # and win probability of each alliance.
+    random_generator = np.random.default_rng(seed)
+    picked_matches = team_starts[:, None] + random_generator.integers(
+        0, match_counts[:, None], size=(len(team_starts), num_simulated_matches))
+    # Every team's points are whole numbers, so float32 adds them up exactly (and quicker)
+    simulated_team_points = team_points.astype(np.float32)[picked_matches]
+
+    # Adding up one team of each alliance at a time avoids making a copy of every team's
+    # simulated points for every alliance
+    alliance_scores = simulated_team_points[alliance_indices[:, 0]]
+    opponent_scores = simulated_team_points[opponent_indices[:, 0]]
+    for i in range(1, TEAMS_PER_ALLIANCE):
+        alliance_scores += simulated_team_points[alliance_indices[:, i]]
+        opponent_scores += simulated_team_points[opponent_indices[:, i]]
+
+    # A tie counts as half of a win
+    win_probabilities = (alliance_scores > opponent_scores).mean(axis=1) + \
+        (alliance_scores == opponent_scores).mean(axis=1) / 2
+    score_percentiles = np.percentile(alliance_scores, [10, 90], axis=1)
+
+    return np.stack([
+        alliance_scores.mean(axis=1),
+        alliance_scores.std(axis=1),
+        score_percentiles[0],
+        score_percentiles[1],
+        opponent_scores.mean(axis=1),
+        win_probabilities,
+    ], axis=1)
+
+
+def check_alliance_team_nums(alliance_team_nums, unavailable_team_nums=(),
+                             opponent_team_nums=None):
+    # Raise a ValueError if the teams given to simulate_alliance_picks() can't all be where
+    # they were put: a team can only be on an alliance once, can't play against its own
+    # alliance, and can't be on the alliance if it's already been picked by another one
+    for team_nums, name in [(alliance_team_nums, "alliance"),
+                            (opponent_team_nums or (), "opponent")]:
+        if len(set(team_nums)) != len(team_nums):
+            raise ValueError(f"a team is on the {name} more than once")
+
+    for team_num in alliance_team_nums:
+        if team_num in (opponent_team_nums or ()):
+            raise ValueError(f"team {team_num} can't be on both the alliance and the opponent")
+        if team_num in unavailable_team_nums:
+            raise ValueError(f"team {team_num} is on the alliance but is unavailable")
+
+
+def simulate_alliance_picks(match_table, team_rankings, alliance_team_nums,
+                            unavailable_team_nums=(), opponent_team_nums=None,
+                            num_processes=None,
+                            num_simulated_matches=SIMULATED_MATCHES_PER_ALLIANCE):
+    # Try every way of filling the rest of an alliance (alliance_team_nums are the teams
+    # already on it) with the teams that can still be picked, and simulate each one against
+    # an opposing alliance. The opponent is opponent_team_nums if given, or else the three
+    # best teams by average match contribution that aren't on the alliance being simulated.
+    # Teams in unavailable_team_nums (e.g. already on another alliance) aren't picked, but
+    # can still be opponents. The alliances are split into batches that are simulated in a
+    # pool of worker processes (one per CPU core by default). Returns a list of dicts, one
+    # per alliance, from the best win probability to the worst.
+    check_alliance_team_nums(alliance_team_nums, unavailable_team_nums, opponent_team_nums)
+
+    team_nums, team_points, team_starts, match_counts = get_team_match_points(match_table)
+    team_index = {team_num: i for i, team_num in enumerate(team_nums.tolist())}
+    if len(team_index) < 2 * TEAMS_PER_ALLIANCE:
+        raise ValueError(
+            f"at least {2 * TEAMS_PER_ALLIANCE} teams need to have played to simulate "
+            f"two alliances")
+    for team_num in itertools.chain(alliance_team_nums, opponent_team_nums or ()):
+        if team_num not in team_index:
+            raise ValueError(f"team {team_num} hasn't played any matches")
+
+    alliance_team_nums = list(alliance_team_nums)
+    num_open_spots = TEAMS_PER_ALLIANCE - len(alliance_team_nums)
+    if num_open_spots < 0:
+        raise ValueError(f"an alliance can only have {TEAMS_PER_ALLIANCE} teams")
+
+    candidate_team_nums = [
+        team_num for team_num in team_index
+        if team_num not in alliance_team_nums and team_num not in unavailable_team_nums
+        and team_num not in (opponent_team_nums or ())]
+    alliance_indices = np.array([
+        [team_index[team_num] for team_num in alliance_team_nums + list(picked_team_nums)]
+        for picked_team_nums in itertools.combinations(candidate_team_nums, num_open_spots)],
+        dtype=np.int64).reshape(-1, TEAMS_PER_ALLIANCE)
+    if len(alliance_indices) == 0:
+        return []
+
+    if opponent_team_nums is not None:
+        opponent_indices = np.tile(
+            [team_index[team_num] for team_num in opponent_team_nums],
+            (len(alliance_indices), 1))
+    else:
+        # Only the best few teams can end up as the opponent, so for each alliance take the
+        # first three of those that aren't on it (a stable sort keeps them in ranked order)
+        best_team_indices = np.array([
+            team_index[team_num]
+            for team_num, junk in team_rankings.avg_match_contribution[:2 * TEAMS_PER_ALLIANCE]
+            if team_num in team_index])
+        on_alliance = (alliance_indices[:, :, None] == best_team_indices).any(axis=1)
+        opponent_indices = best_team_indices[
+            np.argsort(on_alliance, axis=1, kind="stable")[:, :TEAMS_PER_ALLIANCE]]
+
+    # Make a few batches per process so that the processes finish at about the same time,
+    # but keep each batch small enough that its simulated scores fit in memory
+    if num_processes is None:
+        num_processes = os.cpu_count() or 1
+    num_batches = max(
+        num_processes * SIMULATION_BATCHES_PER_PROCESS,
+        -(-len(alliance_indices) // MAX_ALLIANCES_PER_SIMULATION_BATCH))
+    batch_boundaries = np.linspace(0, len(alliance_indices), num_batches + 1).astype(int)
+    batch_boundaries = np.unique(batch_boundaries)
+
+    print(f"Simulating {len(alliance_indices)} Alliances in {len(batch_boundaries) - 1} "
+          f"Batches on {num_processes} Processes")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_processes) as executor:
+        alliance_results = np.concatenate(list(executor.map(
+            simulate_alliance_batch,
+            itertools.repeat(team_points),
+            itertools.repeat(team_starts),
+            itertools.repeat(match_counts),
+            [alliance_indices[start:end]
+             for start, end in zip(batch_boundaries[:-1], batch_boundaries[1:])],
+            [opponent_indices[start:end]
+             for start, end in zip(batch_boundaries[:-1], batch_boundaries[1:])],
+            itertools.repeat(num_simulated_matches),
+            itertools.repeat(SIMULATION_SEED))))
+
+    alliance_picks = []
+    for alliance_row, opponent_row, result_row in zip(
+            team_nums[alliance_indices].tolist(),
+            team_nums[opponent_indices].tolist(),
+            alliance_results.tolist()):
+        expected_score, score_std, score_p10, score_p90, opponent_expected_score, \
+            win_probability = result_row
+        alliance_picks.append({
+            "alliance": alliance_row,
+            "picks": alliance_row[len(alliance_team_nums):],
+            "expected_score": expected_score,
+            "score_std": score_std,
+            "score_p10": score_p10,
+            "score_p90": score_p90,
+            "opponent": opponent_row,
+            "opponent_expected_score": opponent_expected_score,
+            "win_probability": win_probability,
+        })
+
+    alliance_picks.sort(
+        key=lambda x: (x["win_probability"], x["expected_score"]), reverse=True)
+    return alliance_picks
+
+
+def write_alliance_picks_report(file_name, alliance_picks):
+    # Save one row per simulated alliance, from the best win probability to the worst
+    with open(file_name, "w", newline="") as alliance_picks_file:
+        alliance_picks_writer = csv.writer(alliance_picks_file)
+        alliance_picks_writer.writerow([
+            "Rank",
+            "Picks",
+            "Alliance",
+            "Expected Score",
+            "Std. Dev.",
+            "10th Percentile",
+            "90th Percentile",
+            "Opponent",
+            "Opponent Expected Score",
+            "Win Probability",
+        ])
+
+        for rank, alliance_pick in enumerate(alliance_picks):
+            alliance_picks_writer.writerow([
+                rank + 1,
+                " ".join(str(team_num) for team_num in alliance_pick["picks"]),
+                " ".join(str(team_num) for team_num in alliance_pick["alliance"]),
+                round(alliance_pick["expected_score"], 1),
+                round(alliance_pick["score_std"], 1),
+                round(alliance_pick["score_p10"], 1),
+                round(alliance_pick["score_p90"], 1),
+                " ".join(str(team_num) for team_num in alliance_pick["opponent"]),
+                round(alliance_pick["opponent_expected_score"], 1),
+                round(alliance_pick["win_probability"], 3),
+            ])
+
+
+####################
+# BATCH PROCESSING #
+####################
+
+
+def find_event_input_files(batch_input):
+    # batch_input is either a folder (every .csv in it is an event) or a glob pattern like
+    # "events/2022*.csv"
+    if os.path.isdir(batch_input):
+        return sorted(glob.glob(os.path.join(batch_input, "*.csv")))
+    return sorted(glob.glob(batch_input))
+
+
+def process_event(event_input_file_name, event_output_file_name, use_cache=False,
+                  reconcile_duplicates=False, output_formats=("xlsx",), chart_mode="full"):
+    # Turn one event's csv into its own workbook (and/or the other output_formats, see
+    # write_output_files()). This runs in a separate process for each event in batch mode,
+    # so it returns everything the main process needs for the roll-up (the per-team totals)
+    # rather than the TeamData classes themselves.
+    event_output_file_name_base = os.path.splitext(event_output_file_name)[0]
+    team_data, match_table = load_team_data(
+        event_input_file_name,
+        use_cache=use_cache,
+        reject_report_file_name=event_output_file_name_base + ".rejects.csv",
+        reconcile_duplicates=reconcile_duplicates,
+        disagreement_report_file_name=event_output_file_name_base + ".disagreements.csv")
+    team_rankings = rank_teams(team_data)
+
+    written_file_names = write_output_files(
+        output_formats,
+        event_output_file_name,
+        team_data,
+        team_rankings,
+        match_table,
+        chart_mode=chart_mode)
+
+    return {
+        "input_file_name": event_input_file_name,
+        "output_file_names": written_file_names,
+        "team_totals": match_table.team_totals(),
+    }
+
+
+def process_events(event_input_file_names, output_directory_name, max_workers=None,
+                   use_cache=False, reconcile_duplicates=False, output_formats=("xlsx",),
+                   chart_mode="full"):
+    # Process every event at the same time in a pool of worker processes (one per CPU core
+    # by default), writing one workbook (and/or the other output_formats) per event into
+    # output_directory_name. Returns the results from process_event() in the same order as
+    # event_input_file_names.
+    os.makedirs(output_directory_name, exist_ok=True)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        event_futures = []
+        for event_input_file_name in event_input_file_names:
+            event_name = os.path.splitext(os.path.basename(event_input_file_name))[0]
+            event_output_file_name = os.path.join(output_directory_name, f"{event_name}.xlsx")
+
+            event_futures.append(executor.submit(
+                process_event,
+                event_input_file_name,
+                event_output_file_name,
+                use_cache,
+                reconcile_duplicates,
+                output_formats,
+                chart_mode))
+
+        return [event_future.result() for event_future in event_futures]
+
+
+def combine_event_results(event_results):
+    # Add up every event's per-team totals to get each team's averages across all of the
+    # events. Returns a dict of team number to TeamData (without any matches) and a dict of
+    # team number to how many of the events that team was at.
+    season_team_totals = None
+    team_event_counts = {}
+
+    for event_result in event_results:
+        event_team_totals = event_result["team_totals"]
+        for team_num in event_team_totals[0].tolist():
+            team_event_counts[team_num] = team_event_counts.get(team_num, 0) + 1
+
+        if season_team_totals is None:
+            season_team_totals = event_team_totals
+        else:
+            season_team_totals = merge_team_totals(season_team_totals, event_team_totals)
+
+    team_data = {}
+    if season_team_totals is not None:
+        for team_num in season_team_totals[0].tolist():
+            get_or_create_team_data(team_data, team_num)
+        update_team_averages(team_data, season_team_totals)
+
+    return team_data, team_event_counts
+
+
+def run_batch(batch_input, output_directory_name, rollup_file_name=None, max_workers=None,
+              use_cache=False, reconcile_duplicates=False, output_formats=("xlsx",),
+              chart_mode="full"):
+    event_input_file_names = find_event_input_files(batch_input)
+    if not event_input_file_names:
+        print(f"No .csv files found for {batch_input}")
+        return
+
+    print(f"Processing {len(event_input_file_names)} Events")
+    event_results = process_events(
+        event_input_file_names,
+        output_directory_name,
+        max_workers=max_workers,
+        use_cache=use_cache,
+        reconcile_duplicates=reconcile_duplicates,
+        output_formats=output_formats,
+        chart_mode=chart_mode)
+
+    for event_result in event_results:
+        print(f"> {event_result['input_file_name']} -> "
+              f"{', '.join(event_result['output_file_names'])}")
+
+    if rollup_file_name is not None:
+        team_data, team_event_counts = combine_event_results(event_results)
+        team_rankings = rank_teams(team_data)
+
+        with open_output_workbook(rollup_file_name) as output_workbook:
+            write_rollup_workbook(output_workbook, team_data, team_rankings, team_event_counts)
+
+        print(f"> Season Roll-Up -> {rollup_file_name}")
+
+    print("\n> Successfully Created Output Files\n")
+
+
+def run_query_server(event_state, host, port):
+    # Answer queries about event_state over HTTP until the script is stopped (Ctrl+C)
+    query_server = http.server.ThreadingHTTPServer((host, port), QueryRequestHandler)
+    query_server.event_state = event_state
+
+    print(f"\n> Answering Queries at http://{host}:{query_server.server_address[1]}/\n")
+    try:
+        query_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        query_server.server_close()
+
+
+######################
+# DROP FOLDER INGEST #
+######################
+
+
+def find_complete_rows_end(data):
+    # Find where the last complete row ends in "data" (which has to start at the beginning
+    # of a row). A row that's still being written, without its newline yet or in the middle
+    # of a quoted note, is left out.
+    complete_rows_end = 0
+    inside_quotes = False
+    position = 0
+
+    while True:
+        newline_position = data.find(b"\n", position)
+        if newline_position == -1:
+            return complete_rows_end
+
+        num_quotes = data[position:newline_position].count(b'"')
+        inside_quotes = inside_quotes != (num_quotes % 2 == 1)
+        position = newline_position + 1
+
+        if not inside_quotes:
+            complete_rows_end = position
+
+
+class DropFolderWatcher:
+    """Class to watch a folder that every scout's device exports its own csv into (in the
+    same column layout as the input csv). Whatever has been added to the end of each file
+    is read and added to an EventState as soon as it shows up, and the outputs are made
+    again once no new rows have come in for a little while."""
+
+    def __init__(self, drop_directory_name, event_state, output_formats=("xlsx",),
+                 poll_seconds=DROP_FOLDER_POLL_SECONDS,
+                 debounce_seconds=DROP_FOLDER_DEBOUNCE_SECONDS,
+                 reject_report_file_name=None):
+        # Values that can't be decoded are listed in reject_report_file_name (if given),
+        # with the file and row they came from
+        self.drop_directory_name = drop_directory_name
+        self.event_state = event_state
+        self.output_formats = output_formats
+        self.poll_seconds = poll_seconds
+        self.debounce_seconds = debounce_seconds
+        self.reject_report_file_name = reject_report_file_name
+
+        # For each file, how many bytes have been read, and the first and last few bytes of
+        # what has been read (to notice when a file gets exported again from scratch instead
+        # of added to)
+        self.read_progress = {}
+
+        # For each file, how many rows have been read (including the column titles) and
+        # the values that were rejected from them
+        self.num_rows_read = {}
+        self.rejected_values = {}
+
+        # Set whenever new match entries are kept, made once the event loop is running
+        self.rows_added = None
+
+    async def run(self):
+        # Check the folder for new rows every poll_seconds until the task is cancelled.
+        # Every file is read from the start, so any old reject report is started over.
+        self.rows_added = asyncio.Event()
+        self.write_reject_report()
+        regeneration_task = asyncio.create_task(self.regenerate_outputs_when_quiet())
+
+        try:
+            while True:
+                await self.ingest_new_rows()
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            regeneration_task.cancel()
+
+    async def ingest_new_rows(self):
+        # Read the end of every file at the same time, then add the rows file by file (in
+        # order of file name, so the same files always give the same result)
+        drop_file_names = sorted(glob.glob(os.path.join(self.drop_directory_name, "*.csv")))
+        file_tails = await asyncio.gather(*(
+            asyncio.to_thread(self.read_file_tail, drop_file_name)
+            for drop_file_name in drop_file_names))
+
+        for drop_file_name, (file_tail, first_row_num) in zip(drop_file_names, file_tails):
+            if file_tail == "":
+                continue
+
+            # A file read from the start again has had its old rejects exported again too
+            if first_row_num == 1:
+                self.rejected_values.pop(drop_file_name, None)
+
+            rows_summary = await asyncio.to_thread(
+                self.event_state.add_rows, file_tail, first_row_num)
+            self.num_rows_read[drop_file_name] = first_row_num + rows_summary["rows_received"]
+            print(f"Read {rows_summary['rows_received']} Rows from {drop_file_name} "
+                  f"({rows_summary['entries_kept']} New Match Entries, "
+                  f"{rows_summary['rows_rejected']} Rejected)")
+
+            if rows_summary["rejected_values"] or first_row_num == 1:
+                self.rejected_values.setdefault(drop_file_name, []).extend(
+                    rows_summary["rejected_values"])
+                self.write_reject_report()
+
+            if rows_summary["entries_kept"] > 0:
+                self.rows_added.set()
+
+    def read_file_tail(self, drop_file_name):
+        # Get the complete rows that have been added to the end of a file since the last
+        # time it was read, as text (or "" if there aren't any), and the row number of the
+        # first of them (counting from 0 at the column titles). Only the new part of the
+        # file is read.
+        byte_offset, file_start, file_end = self.read_progress.get(
+            drop_file_name, (0, b"", b""))
+
+        with open(drop_file_name, "rb") as drop_file:
+            # A file that got shorter, or whose first or last few bytes read so far have
+            # changed, was exported again from scratch, so it's read again from the
+            # beginning (rows that were already added get dropped as duplicates)
+            file_size = os.fstat(drop_file.fileno()).st_size
+            if file_size < byte_offset or drop_file.read(len(file_start)) != file_start:
+                byte_offset, file_start, file_end = 0, b"", b""
+            else:
+                drop_file.seek(byte_offset - len(file_end))
+                if drop_file.read(len(file_end)) != file_end:
+                    byte_offset, file_start, file_end = 0, b"", b""
+            if file_size == byte_offset:
+                return "", None
+
+            drop_file.seek(byte_offset)
+            new_data = drop_file.read()
+
+        # Anything after the last complete row is left to be read next time
+        complete_rows_end = find_complete_rows_end(new_data)
+        if complete_rows_end == 0:
+            return "", None
+
+        # Every file starts with its own row of column titles
+        rows_start = 0
+        if byte_offset == 0:
+            rows_start = find_next_row_start(new_data[:complete_rows_end], 0)
+            file_start = new_data[:min(complete_rows_end, DROP_FILE_CHECK_BYTES)]
+        file_end = (file_end + new_data[:complete_rows_end])[-DROP_FILE_CHECK_BYTES:]
+
+        self.read_progress[drop_file_name] = (
+            byte_offset + complete_rows_end, file_start, file_end)
+        first_row_num = 1 if byte_offset == 0 else self.num_rows_read[drop_file_name]
+        return (
+            new_data[rows_start:complete_rows_end].decode("utf-8", errors="replace"),
+            first_row_num)
+
+    def write_reject_report(self):
+        # Save every value that couldn't be decoded from any of the files to the reject
+        # report, in the same layout as write_reject_report() with the file name added. If
+        # nothing was rejected, any old report is removed.
+        if self.reject_report_file_name is None:
+            return
+        if not any(self.rejected_values.values()):
+            if os.path.exists(self.reject_report_file_name):
+                os.remove(self.reject_report_file_name)
+            return
+
+        with open(self.reject_report_file_name, "w", newline="") as reject_report_file:
+            reject_report_writer = csv.writer(reject_report_file)
+            reject_report_writer.writerow(
+                ["File", "Row Number", "Column", "Field", "Value", "Reason"])
+
+            for drop_file_name in sorted(self.rejected_values):
+                for rejected_value in self.rejected_values[drop_file_name]:
+                    reject_report_writer.writerow([
+                        os.path.basename(drop_file_name),
+                        rejected_value["row"],
+                        rejected_value["column"],
+                        rejected_value["field"],
+                        rejected_value["value"],
+                        rejected_value["reason"]])
+
+    async def regenerate_outputs_when_quiet(self):
+        # Make the outputs again after new rows come in, but only once no more rows have
+        # come in for debounce_seconds, so that several scouts exporting at once only
+        # makes the outputs once
+        while True:
+            await self.rows_added.wait()
+
+            while self.rows_added.is_set():
+                self.rows_added.clear()
+                try:
+                    await asyncio.wait_for(self.rows_added.wait(), self.debounce_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+            written_file_names = await asyncio.to_thread(
+                self.event_state.write_outputs, self.output_formats)
+            print(f"> Updated {', '.join(written_file_names)}")
+
+
+def run_drop_folder_watcher(drop_folder_watcher):
+    # Watch the drop folder until the script is stopped (Ctrl+C)
+    os.makedirs(drop_folder_watcher.drop_directory_name, exist_ok=True)
+    print(f"\n> Watching {drop_folder_watcher.drop_directory_name}/ for Scouting Exports\n")
+
+    try:
+        asyncio.run(drop_folder_watcher.run())
+    except KeyboardInterrupt:
+        pass
+
+
+########
+# MAIN #
+########
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Turn a scouting data .csv into a formatted Excel workbook")
+    argument_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"only process rows added to {input_file_name} since the last run (progress is "
+             f"saved in {checkpoint_file_name})")
+    argument_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"always parse {input_file_name} and make every team sheet, instead of loading "
+             f"them from {parsed_cache_directory_name}/ and "
+             f"{get_sheet_cache_directory_name(output_file_name)}/ when they haven't "
+             f"changed since an earlier run")
+    argument_parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=profile_report_file_name,
+        metavar="REPORT_FILE",
+        help=f"save how long each phase took (and counts of rows, sheets, charts, etc.) as "
+             f"json to REPORT_FILE (default: {profile_report_file_name})")
+    argument_parser.add_argument(
+        "--profile-cprofile",
+        metavar="STATS_FILE",
+        help="also save cProfile stats for the whole run to STATS_FILE (open it with pstats "
+             "or snakeviz). Turns on --profile if it isn't already.")
+    argument_parser.add_argument(
+        "--profile-tracemalloc",
+        metavar="SNAPSHOT_FILE",
+        help="also track every memory allocation (slow), adding traced bytes to the report "
+             "and saving a tracemalloc snapshot to SNAPSHOT_FILE. Turns on --profile if it "
+             "isn't already.")
+    argument_parser.add_argument(
+        "--batch",
+        metavar="FOLDER_OR_GLOB",
+        help="process every event .csv in a folder (or matching a pattern like "
+             "\"events/*.csv\") at the same time, making one workbook per event")
+    argument_parser.add_argument(
+        "--batch-output",
+        default=batch_output_directory_name,
+        metavar="FOLDER",
+        help=f"where batch mode puts each event's workbook (default: "
+             f"{batch_output_directory_name})")
+    argument_parser.add_argument(
+        "--rollup",
+        nargs="?",
+        const=rollup_output_file_name,
+        metavar="ROLLUP_FILE",
+        help=f"in batch mode, also make a workbook with each team's averages across every "
+             f"event (default: {rollup_output_file_name})")
+    argument_parser.add_argument(
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="how many events to process at once in batch mode, or how many processes to "
+             "simulate alliances on with --simulate-picks (default: one per CPU core)")
+    argument_parser.add_argument(
+        "--parse-jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="split the input file up and parse it with N processes at once, for very large "
+             "input files (default: 1)")
+    argument_parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help=f"combine every entry for the same team in the same match (when it was scouted "
+             f"more than once) instead of only keeping the first one, and list the matches "
+             f"where the scouts disagreed in {disagreement_report_file_name}")
+    argument_parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=query_server_port,
+        type=int,
+        metavar="PORT",
+        help=f"keep the event loaded and answer queries over HTTP on PORT (default: "
+             f"{query_server_port}) instead of making the workbook right away")
+    argument_parser.add_argument(
+        "--watch",
+        nargs="?",
+        const=drop_folder_name,
+        metavar="FOLDER",
+        help=f"instead of reading {input_file_name}, keep adding the rows that every scout's "
+             f"device exports into FOLDER (default: {drop_folder_name}) and remake the "
+             f"outputs a few seconds after new rows come in")
+    argument_parser.add_argument(
+        "--host",
+        default=query_server_host,
+        help=f"the address to answer queries on with --serve (default: {query_server_host})")
+    argument_parser.add_argument(
+        "--store",
+        nargs="?",
+        const=match_store_file_name,
+        metavar="STORE_FILE",
+        help=f"also save this event's match entries to an SQLite store (default: "
+             f"{match_store_file_name}) for looking back at later")
+    argument_parser.add_argument(
+        "--event",
+        help="the name to save the event under with --store (required with --store, since "
+             "saving the same event and season again replaces it)")
+    argument_parser.add_argument(
+        "--season",
+        default=time.strftime("%Y"),
+        help="the season to save the event under with --store, or to roll up with "
+             "--store-rollup (default: this year)")
+    argument_parser.add_argument(
+        "--store-rollup",
+        metavar="ROLLUP_FILE",
+        help="make a workbook with each team's averages across every event of --season in "
+             "the store, instead of processing the input file")
+    argument_parser.add_argument(
+        "--formats",
+        default="xlsx",
+        metavar="FORMAT[,FORMAT...]",
+        help=f"which outputs to make, separated by commas: "
+             f"{', '.join(output_format_names)} (default: xlsx)")
+    argument_parser.add_argument(
+        "--charts",
+        default="full",
+        choices=chart_mode_names,
+        help="which charts to make: \"full\" puts five charts on every team sheet, "
+             "\"combined\" puts one chart with every match on each team sheet, and "
+             "\"rankings\" only puts a chart on the Rankings sheet, which is the quickest "
+             "(default: full)")
+    argument_parser.add_argument(
+        "--schedule",
+        metavar="SCHEDULE_FILE",
+        help=f"the qualification match schedule .csv used to calculate OPR/DPR (default: "
+             f"{schedule_file_name}, if it exists)")
+    argument_parser.add_argument(
+        "--simulate-picks",
+        metavar="TEAM[,TEAM]",
+        help=f"simulate every way of filling the rest of an alliance with these teams on it "
+             f"(e.g. your team, or your team and its first pick) and save each one's "
+             f"expected score and chance of beating the opponent to "
+             f"{alliance_picks_file_name}")
+    argument_parser.add_argument(
+        "--unavailable",
+        default="",
+        metavar="TEAM[,TEAM...]",
+        help="teams that can't be picked with --simulate-picks (e.g. already on another "
+             "alliance)")
+    argument_parser.add_argument(
+        "--opponent",
+        metavar="TEAM,TEAM,TEAM",
+        help="the alliance to simulate against with --simulate-picks (default: the three "
+             "best teams by average match contribution that aren't on the simulated "
+             "alliance)")
+    arguments = argument_parser.parse_args()
+
+    # cProfile stats and tracemalloc snapshots go along with the profile report (and the
+    # traced bytes are only saved in it), so asking for either one turns the report on
+    if arguments.profile is None and (
+            arguments.profile_cprofile is not None
+            or arguments.profile_tracemalloc is not None):
+        arguments.profile = profile_report_file_name
+
+    # Only a single run over the input file is profiled
+    if arguments.profile is not None and (
+            arguments.batch is not None or arguments.watch is not None
+            or arguments.serve is not None):
+        argument_parser.error(
+            "--profile, --profile-cprofile and --profile-tracemalloc can't be used with "
+            "--batch, --watch or --serve")
+
+    output_formats = arguments.formats.split(",")
+    for output_format in output_formats:
+        if output_format not in output_format_names:
+            argument_parser.error(f"unknown format \"{output_format}\" for --formats")
+
+    alliance_team_nums, unavailable_team_nums, opponent_team_nums = None, [], None
+    try:
+        if arguments.simulate_picks is not None:
+            alliance_team_nums = [
+                int(team_num) for team_num in arguments.simulate_picks.split(",")]
+        unavailable_team_nums = [
+            int(team_num) for team_num in arguments.unavailable.split(",") if team_num != ""]
+        if arguments.opponent is not None:
+            opponent_team_nums = [int(team_num) for team_num in arguments.opponent.split(",")]
+    except ValueError:
+        argument_parser.error(
+            "--simulate-picks, --unavailable and --opponent need team numbers separated by "
+            "commas")
+    if opponent_team_nums is not None and len(opponent_team_nums) != TEAMS_PER_ALLIANCE:
+        argument_parser.error(f"--opponent needs {TEAMS_PER_ALLIANCE} teams")
+    if alliance_team_nums is not None:
+        # Checked before anything is processed, so a typo doesn't cost a whole run
+        try:
+            check_alliance_team_nums(
+                alliance_team_nums, unavailable_team_nums, opponent_team_nums)
+        except ValueError as error:
+            argument_parser.error(f"can't simulate alliances: {error}")
+    if alliance_team_nums is not None and (
+            arguments.store_rollup is not None or arguments.batch is not None
+            or arguments.serve is not None or arguments.watch is not None):
+        argument_parser.error(
+            "--simulate-picks can't be used with --store-rollup, --batch, --serve or --watch")
+
+    if arguments.store_rollup is not None:
+        connection = open_match_store(arguments.store or match_store_file_name)
+        team_data, team_event_counts = load_season_team_data(connection, arguments.season)
+        connection.close()
+
+        if not team_data:
+            print(f"Nothing is stored for the {arguments.season} season")
+            return
+
+        with open_output_workbook(arguments.store_rollup) as output_workbook:
+            write_rollup_workbook(
+                output_workbook, team_data, rank_teams(team_data), team_event_counts)
+
+        print(f"\n> Successfully Created {arguments.store_rollup}\n")
+        return
+
+    if arguments.batch is not None:
+        if arguments.incremental:
+            argument_parser.error("--incremental can't be used with --batch")
+        if arguments.serve is not None:
+            argument_parser.error("--serve can't be used with --batch")
+        if arguments.watch is not None:
+            argument_parser.error("--watch can't be used with --batch")
+        # Every event has its own match schedule, and the events are already processed in
+        # separate processes
+        if arguments.schedule is not None:
+            argument_parser.error("--schedule can't be used with --batch")
+        if arguments.parse_jobs != 1:
+            argument_parser.error("--parse-jobs can't be used with --batch (use --jobs)")
+
+        run_batch(
+            arguments.batch,
+            arguments.batch_output,
+            rollup_file_name=arguments.rollup,
+            max_workers=arguments.jobs,
+            use_cache=not arguments.no_cache,
+            reconcile_duplicates=arguments.reconcile,
+            output_formats=output_formats,
+            chart_mode=arguments.charts)
+        return
+
+    # Saving an event replaces whatever was stored under the same name and season, so the
+    # name always has to be given rather than made up from the input file's name
+    if arguments.store is not None and arguments.event is None:
+        argument_parser.error("--store needs --event to say which event to save the matches "
+                              "under")
+
+    # Power ratings are only calculated when there's a match schedule
+    schedule = None
+    if arguments.schedule is not None or os.path.exists(schedule_file_name):
+        schedule = read_schedule(arguments.schedule or schedule_file_name)
+
+    if arguments.reconcile and arguments.incremental:
+        argument_parser.error("--reconcile can't be used with --incremental")
+
+    if arguments.watch is not None:
+        if arguments.incremental or arguments.reconcile:
+            argument_parser.error("--incremental and --reconcile can't be used with --watch")
+
+        event_state = EventState(None, output_file_name, schedule=schedule)
+
+        # With --serve as well, queries are answered on another thread while watching
+        if arguments.serve is not None:
+            threading.Thread(
+                target=run_query_server,
+                args=(event_state, arguments.host, arguments.serve),
+                daemon=True).start()
+
+        run_drop_folder_watcher(DropFolderWatcher(
+            arguments.watch,
+            event_state,
+            output_formats,
+            reject_report_file_name=reject_report_file_name))
+        return
+
+    if arguments.serve is not None:
+        if arguments.reconcile:
+            argument_parser.error("--reconcile can't be used with --serve")
+
+        event_state = EventState(
+            input_file_name,
+            output_file_name,
+            incremental=arguments.incremental,
+            use_cache=not arguments.no_cache,
+            schedule=schedule,
+            reject_report_file_name=reject_report_file_name)
+        run_query_server(event_state, arguments.host, arguments.serve)
+        return
+
+    profiler = PipelineProfiler(
+        enabled=arguments.profile is not None,
+        trace_allocations=arguments.profile_tracemalloc is not None)
+
+    if arguments.profile_tracemalloc:
+        tracemalloc.start()
+
+    if arguments.profile_cprofile:
+        c_profiler = cProfile.Profile()
+        c_profiler.enable()
+
+    # Get rid of any existing output workbook
+    if "xlsx" in output_formats and os.path.exists(output_file_name):
+        os.remove(output_file_name)
+
+    team_data, match_table = load_team_data(
+        input_file_name,
+        incremental=arguments.incremental,
+        use_cache=not arguments.no_cache,
+        profiler=profiler,
+        reject_report_file_name=reject_report_file_name,
+        parse_processes=arguments.parse_jobs,
+        reconcile_duplicates=arguments.reconcile,
+        disagreement_report_file_name=disagreement_report_file_name)
+
+    if arguments.store is not None:
+        with profiler.phase("store_saving"):
+            connection = open_match_store(arguments.store)
+            save_event_to_store(
+                connection,
+                match_table,
+                arguments.event,
+                arguments.season)
+            connection.close()
+
+    if schedule is not None:
+        with profiler.phase("power_ratings"):
+            compute_power_ratings(team_data, match_table, schedule)
+
+    with profiler.phase("ranking"):
+        team_rankings = rank_teams(team_data)
+
+    written_file_names = write_output_files(
+        output_formats,
+        output_file_name,
+        team_data,
+        team_rankings,
+        match_table,
+        profiler,
+        use_sheet_cache=not arguments.no_cache,
+        chart_mode=arguments.charts)
+
+    if alliance_team_nums is not None:
+        with profiler.phase("alliance_simulation"):
+            try:
+                alliance_picks = simulate_alliance_picks(
+                    match_table,
+                    team_rankings,
+                    alliance_team_nums,
+                    unavailable_team_nums,
+                    opponent_team_nums,
+                    num_processes=arguments.jobs)
+            except ValueError as error:
+                argument_parser.error(f"can't simulate alliances: {error}")
+            write_alliance_picks_report(alliance_picks_file_name, alliance_picks)
+        written_file_names.append(alliance_picks_file_name)
+
+        print("\nBest Picks (Win Probability, Expected Score):")
+        for alliance_pick in alliance_picks[:5]:
+            print(f"> {' '.join(str(team_num) for team_num in alliance_pick['picks'])}: "
+                  f"{alliance_pick['win_probability']:.1%}, "
+                  f"{alliance_pick['expected_score']:.1f} Pts.")
+
+    print(f"\n> Successfully Created {', '.join(written_file_names)}\n")
+
+    if arguments.profile_cprofile:
+        c_profiler.disable()
+        c_profiler.dump_stats(arguments.profile_cprofile)
+        print(f"> Saved cProfile Stats to {arguments.profile_cprofile}")
+
+    if arguments.profile_tracemalloc:
+        tracemalloc.take_snapshot().dump(arguments.profile_tracemalloc)
+        print(f"> Saved tracemalloc Snapshot to {arguments.profile_tracemalloc}")
+
+    if arguments.profile is not None:
+        with open(arguments.profile, "w") as profile_report_file:
+            json.dump(profiler.report(), profile_report_file, indent=4)
+        print(f"> Saved Profile Report to {arguments.profile}")
+
+    if arguments.profile_tracemalloc:
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()